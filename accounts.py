@@ -0,0 +1,67 @@
+"""Account directory: one table in the home shard that keeps logins unique across every shard.
+
+A shard's UNIQUE constraints only see its own file, and looking an account up in every
+shard before inserting into one of them races with a concurrent sign-up for the same
+phone in another region. So a new account first claims its keys (donor phone and email,
+host email) in account_directory, in one write transaction under the table's PRIMARY KEY,
+and only then is written to its regional shard. Whoever commits the claim first owns the
+key; if the shard write fails the claim is released again.
+
+Accounts written before the directory existed are added at startup by backfill(). When
+two shards already hold the same key, the first shard keeps it.
+"""
+
+# Fields that identify an account, per role; each non-blank one is a directory key
+ACCOUNT_KEYS = {'donor': ('phone', 'email'), 'host': ('email',)}
+
+def init_account_tables(c):
+    """Called from init_db() with its cursor, for the home shard only."""
+    c.execute('''CREATE TABLE IF NOT EXISTS account_directory
+                 (kind TEXT, value TEXT, shard TEXT, created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                  PRIMARY KEY (kind, value)) WITHOUT ROWID''')
+
+def account_keys(role, **fields):
+    """The directory keys of one account, e.g. account_keys('donor', phone=..., email=...)."""
+    return [(f"{role}_{field}", fields[field]) for field in ACCOUNT_KEYS[role] if fields.get(field)]
+
+def claim_accounts(conn, accounts, shard):
+    """Claims each account's keys for `shard` in one write transaction.
+
+    Returns one bool per account: False where a key is already taken, including by an
+    earlier account in the same call. Nothing is claimed for those."""
+    conn.execute("BEGIN IMMEDIATE TRANSACTION")
+    try:
+        claimed = []
+        for keys in accounts:
+            taken = any(conn.execute("SELECT 1 FROM account_directory WHERE kind = ? AND value = ?", key).fetchone() for key in keys)
+            if not taken: conn.executemany("INSERT INTO account_directory (kind, value, shard) VALUES (?, ?, ?)", [(kind, value, shard) for kind, value in keys])
+            claimed.append(not taken)
+        conn.commit()
+    except Exception:
+        conn.rollback(); raise
+    return claimed
+
+def release_accounts(conn, accounts):
+    """Gives up the keys of accounts that were deleted or never written."""
+    conn.executemany("DELETE FROM account_directory WHERE kind = ? AND value = ?", [key for keys in accounts for key in keys])
+    conn.commit()
+
+def rekey_account(conn, old_keys, new_keys, shard):
+    """Moves an edited account from old_keys to new_keys. Returns False, changing nothing, if a new key is taken."""
+    added = [k for k in new_keys if k not in old_keys]; removed = [k for k in old_keys if k not in new_keys]
+    if added and not claim_accounts(conn, [added], shard)[0]: return False
+    if removed: release_accounts(conn, [removed])
+    return True
+
+def backfill(conn, router):
+    """Adds every shard's existing accounts to the directory (conn is the home shard); keys already claimed are kept."""
+    for shard in router.shards:
+        db = 'main' if shard.name == router.home else 'src'
+        if db == 'src': conn.execute("ATTACH DATABASE ? AS src", (shard.path,))
+        try:
+            for kind, table, column in (('donor_phone', 'donors', 'phone'), ('donor_email', 'donors', 'email'), ('host_email', 'camp_hosts', 'email')):
+                conn.execute(f"""INSERT OR IGNORE INTO account_directory (kind, value, shard)
+                                 SELECT ?, {column}, ? FROM {db}.{table} WHERE {column} IS NOT NULL AND {column} != ''""", (kind, shard.name))
+            conn.commit()
+        finally:
+            if db == 'src': conn.execute("DETACH DATABASE src")
@@ -0,0 +1,150 @@
+"""Read-only analytics snapshot of bloodbank.db for reports and exports.
+
+A SnapshotManager copies the live database with the sqlite3 online backup API into a
+temporary file, materializes the reporting views (report_* tables with their own
+indexes), stamps it in snapshot_meta and atomically swaps it in as analytics.db.
+Report and export routes read only from that copy (opened with mode=ro), so a long
+export scan never holds a read lock on the database that bookings write to.
+
+The copy is refreshed every ANALYTICS_REFRESH_SECONDS by a daemon thread, or on demand
+with `python analytics_snapshot.py refresh`. Every worker process runs the thread, but a
+refresh is claimed with an exclusive lock on <snapshot>.lock and skipped when the file is
+already fresh, so N workers still take one backup per interval. taken_at() is re-read
+whenever the snapshot file changes, whichever process replaced it.
+
+The first snapshot is built by the thread too, never inside a request: until it exists
+connect() raises SnapshotNotReady and taken_at() returns NOT_READY. Without fcntl
+(Windows) there is no cross-process lock and each process refreshes on its own timer."""
+try: import fcntl
+except ImportError: fcntl = None
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+ANALYTICS_REFRESH_SECONDS = int(os.environ.get('LIFEFLOW_ANALYTICS_REFRESH', '300'))
+NOT_READY = 'not yet available (first snapshot in progress)'
+
+class SnapshotNotReady(RuntimeError):
+    """No snapshot has been built yet; the refresh thread is building the first one."""
+
+# (table, SELECT that materializes it, indexes) - rebuilt in every snapshot
+REPORT_VIEWS = [
+    ('report_donation_log',
+     '''SELECT d.id, d.date, u.name, u.blood_group, u.phone, d.volume_ml, d.hospital, d.status
+        FROM donations d JOIN donors u ON d.donor_id = u.id''',
+     ['CREATE INDEX idx_report_donation_hosp ON report_donation_log(hospital, status, date)',
+      'CREATE INDEX idx_report_donation_date ON report_donation_log(date)']),
+    ('report_appointment_log',
+     '''SELECT a.id, a.hospital_id, a.date, a.time_slot, d.name, d.blood_group, d.phone, a.status
+        FROM appointments a JOIN donors d ON a.donor_id = d.id''',
+     ['CREATE INDEX idx_report_appointment_hosp ON report_appointment_log(hospital_id, date)']),
+    ('report_hospital_performance',
+     '''SELECT h.id, h.name, h.type, h.email, COUNT(d.id) as total_units
+        FROM hospitals h LEFT JOIN donations d ON h.name = d.hospital AND d.status = 'Approved'
+        GROUP BY h.id''',
+     []),
+    ('report_stock_prediction',
+     '''SELECT h.name as hospital,
+               IFNULL(SUM(d.volume_ml), 0) as current_stock,
+               ROUND(AVG(IFNULL(SUM(d.volume_ml), 0)) OVER (), 1) as global_avg,
+               CASE
+                   WHEN IFNULL(SUM(d.volume_ml), 0) < (AVG(IFNULL(SUM(d.volume_ml), 0)) OVER () * 0.7) THEN '🚨 CRITICAL SHORTAGE'
+                   WHEN IFNULL(SUM(d.volume_ml), 0) > (AVG(IFNULL(SUM(d.volume_ml), 0)) OVER () * 1.5) THEN '🌟 SURPLUS'
+                   ELSE '✅ STABLE'
+               END as ai_status
+        FROM hospitals h
+        LEFT JOIN donations d ON h.name = d.hospital AND d.status = 'Approved'
+        GROUP BY h.name''',
+     []),
+    ('report_camp_donors',
+     '''SELECT cr.camp_id, d.name, d.blood_group, d.phone, d.email, d.city
+        FROM camp_registrations cr LEFT JOIN donors d ON cr.donor_id = d.id''',
+     ['CREATE INDEX idx_report_camp_donors ON report_camp_donors(camp_id)']),
+]
+
+def build_snapshot(source_path, snapshot_path):
+    """Copies source_path into snapshot_path (atomically replaced) and materializes REPORT_VIEWS."""
+    tmp_path = f"{snapshot_path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp_path): os.remove(tmp_path)
+    src = sqlite3.connect(source_path); dst = sqlite3.connect(tmp_path)
+    try:
+        # One step: a stepped backup restarts whenever another connection writes, so under steady traffic it might never finish
+        src.backup(dst, pages=-1)
+    finally:
+        src.close()
+    try:
+        for table, select, indexes in REPORT_VIEWS:
+            dst.execute(f"DROP TABLE IF EXISTS {table}")
+            dst.execute(f"CREATE TABLE {table} AS {select}")
+            for index in indexes: dst.execute(index)
+        dst.execute("CREATE TABLE IF NOT EXISTS snapshot_meta (taken_at TEXT)")
+        dst.execute("DELETE FROM snapshot_meta")
+        dst.execute("INSERT INTO snapshot_meta (taken_at) VALUES (?)", (datetime.now().strftime('%Y-%m-%d %H:%M:%S'),))
+        dst.commit()
+    finally:
+        dst.close()
+    os.replace(tmp_path, snapshot_path)
+
+class SnapshotManager:
+    def __init__(self, source_path, snapshot_path, interval=ANALYTICS_REFRESH_SECONDS, factory=sqlite3.Connection):
+        self.source_path = source_path; self.snapshot_path = snapshot_path; self.interval = interval; self.factory = factory
+        self._lock = threading.Lock(); self._thread = None; self._taken_at = None
+
+    def refresh(self, if_older_than=None):
+        """Rebuilds the snapshot under the cross-process lock. With if_older_than (seconds), only when the
+        current snapshot is at least that old and no other process is already rebuilding it; returns whether it ran."""
+        with self._lock, open(f"{self.snapshot_path}.lock", 'a') as lock_file:
+            try:
+                if fcntl: fcntl.flock(lock_file, fcntl.LOCK_EX | (fcntl.LOCK_NB if if_older_than is not None else 0))
+            except BlockingIOError: return False # Another worker is refreshing right now
+            if if_older_than is not None and self._age() < if_older_than: return False
+            build_snapshot(self.source_path, self.snapshot_path)
+            return True
+
+    def _age(self):
+        try: return time.time() - os.stat(self.snapshot_path).st_mtime
+        except FileNotFoundError: return float('inf')
+
+    def connect(self):
+        """Read-only connection to the snapshot; SnapshotNotReady until the first one has been built."""
+        self.start()
+        if not os.path.exists(self.snapshot_path): raise SnapshotNotReady(f"{self.snapshot_path} is being built")
+        conn = sqlite3.connect(f"file:{os.path.abspath(self.snapshot_path)}?mode=ro", uri=True, factory=self.factory)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def taken_at(self):
+        try: conn = self.connect()
+        except SnapshotNotReady: return NOT_READY
+        try:
+            # Cached per snapshot file version: any process's refresh changes the mtime
+            version = os.stat(self.snapshot_path).st_mtime_ns
+            if self._taken_at is None or self._taken_at[0] != version:
+                self._taken_at = (version, conn.execute("SELECT taken_at FROM snapshot_meta").fetchone()[0])
+        finally: conn.close()
+        return self._taken_at[1]
+
+    def start(self):
+        if self._thread is not None: return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='analytics-snapshot', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        # The first pass builds a missing snapshot at once; with interval <= 0 that is all the thread does
+        while True:
+            # Slack of a tenth of the interval, so the worker whose timer fires just after another's refresh skips it
+            try: self.refresh(if_older_than=self.interval * 0.9 if self.interval > 0 else float('inf'))
+            except sqlite3.Error as e: print(f"Analytics snapshot refresh failed: {e}")
+            if self.interval <= 0: return
+            time.sleep(self.interval)
+
+if __name__ == '__main__':
+    import sys
+    if sys.argv[1:] != ['refresh']: sys.exit("usage: python analytics_snapshot.py refresh")
+    started = time.perf_counter()
+    build_snapshot(os.environ.get('LIFEFLOW_DB', 'bloodbank.db'), os.environ.get('LIFEFLOW_ANALYTICS_DB', 'analytics.db'))
+    print(f"Analytics snapshot refreshed in {time.perf_counter() - started:.2f}s")
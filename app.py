@@ -1,16 +1,37 @@
 import smtplib
+import hmac
 from email.message import EmailMessage
 import sqlite3
 import csv
 import os
 import math
 import random
+import io
+import threading
+import time
+import tempfile
+import zlib
 from io import StringIO
 from datetime import date, datetime, timedelta
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, make_response
+from flask import Flask, render_template as flask_render_template, request, redirect, url_for, session, flash, jsonify, make_response, g, has_request_context, send_file, abort, Response
 from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
+from werkzeug.utils import secure_filename, safe_join
+from werkzeug.middleware.proxy_fix import ProxyFix
+from jinja2 import FileSystemBytecodeCache
 from fpdf import FPDF
+from bulk_import import import_csv, AccountClaims, IMPORT_COLUMNS
+import db_metrics
+from sos_campaigns import init_sos_tables, create_campaign, campaign_status, donor_index, NotificationDispatcher, shared_send_limiter
+from analytics_snapshot import SnapshotManager, SnapshotNotReady
+from leaderboards import init_leaderboard_tables, leaderboard_query
+from inventory import init_inventory_tables, receive_units, issue_units, stock_levels, InventoryJobs
+from traffic_control import SingleFlight, SharedTokenBucket
+from asset_pipeline import load_manifest, DIST_DIR
+from sharding import ShardRouter, reserve_id_range, merge_sorted
+from certificates import render_certificate, render_batch_pdf, stream_batch_zip, MAX_BATCH as MAX_CERTIFICATE_BATCH
+from cdc import init_cdc_tables, register_consumer, Compactor, CDC_ENABLED, pull_changes, acknowledge, head_seq, CursorExpired, PULL_BATCH_SIZE, MAX_PULL_BATCH
+from accounts import init_account_tables, account_keys, claim_accounts, release_accounts, rekey_account, backfill as backfill_accounts
+from archive import init_archive_tables, archive_history, archive_path, attach_archive, report_source, MIN_HORIZON_DAYS, ARCHIVE_HORIZON_DAYS
 
 app = Flask(__name__)
 app.secret_key = 'super_secret_key_bloodbank'
@@ -21,16 +42,22 @@ ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+# --- TEMPLATE PERFORMANCE: COMPILED-TEMPLATE CACHE SHARED BY ALL WORKERS ---
+JINJA_CACHE_DIR = os.environ.get('LIFEFLOW_JINJA_CACHE', os.path.join(app.instance_path, 'jinja_cache'))
+os.makedirs(JINJA_CACHE_DIR, exist_ok=True)
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache(JINJA_CACHE_DIR)
+app.config['ADMIN_PAGE_SIZE'] = 50
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 # --- SHARED DATA ---
 HOSPITALS_DATA = [
-    {"name": "Rajiv Gandhi Govt General Hospital", "lat": 13.0815, "lng": 80.2768, "type": "Govt", "email": "rajiv@gov.in"},
-    {"name": "Apollo Hospitals (Greams Road)", "lat": 13.0630, "lng": 80.2555, "type": "Private", "email": "apollo@private.com"},
-    {"name": "Government Stanley Hospital", "lat": 13.1067, "lng": 80.2882, "type": "Govt", "email": "stanley@gov.in"},
-    {"name": "MIOT International", "lat": 13.0298, "lng": 80.1866, "type": "Private", "email": "miot@private.com"},
-    {"name": "Rotary Central Blood Bank", "lat": 13.0587, "lng": 80.2642, "type": "NGO", "email": "rotary@ngo.org"}
+    {"name": "Rajiv Gandhi Govt General Hospital", "lat": 13.0815, "lng": 80.2768, "type": "Govt", "email": "rajiv@gov.in", "city": "Chennai"},
+    {"name": "Apollo Hospitals (Greams Road)", "lat": 13.0630, "lng": 80.2555, "type": "Private", "email": "apollo@private.com", "city": "Chennai"},
+    {"name": "Government Stanley Hospital", "lat": 13.1067, "lng": 80.2882, "type": "Govt", "email": "stanley@gov.in", "city": "Chennai"},
+    {"name": "MIOT International", "lat": 13.0298, "lng": 80.1866, "type": "Private", "email": "miot@private.com", "city": "Chennai"},
+    {"name": "Rotary Central Blood Bank", "lat": 13.0587, "lng": 80.2642, "type": "NGO", "email": "rotary@ngo.org", "city": "Chennai"}
 ]
 
 # =========================================================================
@@ -50,15 +77,246 @@ def haversine(lat1, lon1, lat2, lon2):
     except:
         return 9999.0
 
-def get_db_connection():
-    conn = sqlite3.connect('bloodbank.db')
+DATABASE = 'bloodbank.db'
+
+# Regional shards (see sharding.py). Without LIFEFLOW_SHARDS there is one shard: DATABASE itself.
+shards = ShardRouter.from_env(DATABASE)
+DATABASE = shards.path(shards.home) # Home shard: admin account and anything not tied to a region
+
+def current_shard():
+    """The shard a request works on: pinned by the route (g.shard), else the logged-in account's region."""
+    if not has_request_context(): return shards.home
+    return g.get('shard') or shards.valid(session.get('shard')) or shards.home
+
+def get_db_connection(shard=None):
+    # Every connection is instrumented (see db_metrics.py): per-route/per-statement latency and slow-query log
+    shard = shard or current_shard()
+    conn = sqlite3.connect(shards.path(shard), factory=db_metrics.InstrumentedConnection)
+    conn.shard = shard # Lets shared caches (e.g. the SOS donor index) keep one entry per shard
     conn.row_factory = sqlite3.Row
     # Inject our Python math function directly into the SQLite database engine!
     conn.create_function("haversine", 4, haversine) 
     return conn
 
-def init_db():
-    conn = sqlite3.connect('bloodbank.db')
+# =========================================================================
+# PERFORMANCE FEATURE: READ-ONLY ANALYTICS SNAPSHOT FOR REPORTS & EXPORTS
+# =========================================================================
+# Exports and admin reporting read a periodically refreshed copy (see analytics_snapshot.py),
+# so long report scans never compete with bookings and verifications for the live database.
+ANALYTICS_DATABASE = os.environ.get('LIFEFLOW_ANALYTICS_DB', 'analytics.db')
+_analytics_root, _analytics_ext = os.path.splitext(ANALYTICS_DATABASE)
+analytics_snapshots = {name: SnapshotManager(shards.path(name), ANALYTICS_DATABASE if name == shards.home else f"{_analytics_root}.{name}{_analytics_ext}",
+                                             factory=db_metrics.InstrumentedConnection) for name in shards.names}
+for _snapshot in analytics_snapshots.values(): _snapshot.start() # Builds a missing snapshot in the background, not in the first request
+
+@app.errorhandler(SnapshotNotReady)
+def snapshot_not_ready(e):
+    response = make_response("Reports are not available yet: the first analytics snapshot is still being built. Please try again in a minute.", 503)
+    response.headers['Retry-After'] = '30'; return response
+
+def current_analytics():
+    # One snapshot per regional shard; reports cover the region the request is routed to
+    return analytics_snapshots[current_shard()]
+
+def get_analytics_connection():
+    return current_analytics().connect()
+
+# History older than the archive horizon lives in a per-shard cold database (see archive.py)
+archive_paths = {name: archive_path(shards, name) for name in shards.names}
+
+def current_archive():
+    return archive_paths[current_shard()]
+
+def stamp_snapshot(response):
+    # Exports carry the snapshot time so a downloaded file says how fresh its data is
+    response.headers['X-Data-As-Of'] = current_analytics().taken_at()
+    return response
+
+# =========================================================================
+# PERFORMANCE FEATURE: INVENTORY LEDGER (SNAPSHOT + DELTA STOCK, BATCH EXPIRY SWEEP)
+# =========================================================================
+inventory_jobs = {name: InventoryJobs(lambda name=name: get_db_connection(name)) for name in shards.names}
+
+def current_stock(conn, hospital_id=None):
+    # The sweep/snapshot job starts with the first stock read; cron can run `python inventory.py sweep` instead
+    inventory_jobs[conn.shard].start()
+    return stock_levels(conn, hospital_id)
+
+# =========================================================================
+# PERFORMANCE FEATURE: PUBLIC HOT ENDPOINTS (SINGLE-FLIGHT + PER-IP RATE LIMIT)
+# =========================================================================
+# Identical in-flight public reads share one computation; results are reused for LIFEFLOW_COALESCE_SECONDS
+public_reads = SingleFlight(linger=float(os.environ.get('LIFEFLOW_COALESCE_SECONDS', '1')))
+SOS_CELL_DECIMALS = 2 # Coordinate cells of ~1.1 km for coalescing SOS searches
+
+# Per-IP token bucket shared by all worker processes on this host. Off by default: set LIFEFLOW_PUBLIC_RATE
+# (requests/s per client) to enable it. Behind a reverse proxy, also set LIFEFLOW_TRUSTED_PROXIES to the number
+# of proxies in front of the app, so the client IP comes from X-Forwarded-For instead of the proxy's address.
+# Clients behind one NAT (a hospital, a campus) still share a bucket, so size the burst for that.
+TRUSTED_PROXIES = int(os.environ.get('LIFEFLOW_TRUSTED_PROXIES', '0'))
+if TRUSTED_PROXIES: app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES)
+PUBLIC_ENDPOINTS = {'index', 'get_map', 'public_sos', 'api_leaderboard'}
+PUBLIC_RATE = float(os.environ.get('LIFEFLOW_PUBLIC_RATE', '0')) # Sustained requests per second per client
+PUBLIC_BURST = float(os.environ.get('LIFEFLOW_PUBLIC_BURST', '20'))
+_limiter_dir = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+public_limiter = SharedTokenBucket(PUBLIC_RATE, PUBLIC_BURST, os.path.join(_limiter_dir, f"lifeflow_ratelimit_{zlib.crc32(os.path.abspath(DATABASE).encode())}.bin")) if PUBLIC_RATE > 0 else None
+
+@app.before_request
+def limit_public_traffic():
+    if public_limiter is None or request.endpoint not in PUBLIC_ENDPOINTS: return None
+    allowed, retry_after = public_limiter.allow(request.remote_addr or 'unknown')
+    if allowed: return None
+    if request.path.startswith('/api/'): response = jsonify({'error': 'Too many requests, please slow down.'})
+    else: response = make_response("Too many requests. Please wait a moment and try again.")
+    response.status_code = 429; response.headers['Retry-After'] = str(math.ceil(retry_after))
+    return response
+
+# =========================================================================
+# PERFORMANCE FEATURE: FINGERPRINTED, PRECOMPRESSED STATIC BUNDLES
+# =========================================================================
+# Page CSS/JS lives in static_src/ and is built into static/dist/ (see asset_pipeline.py). File names
+# carry a content hash, so browsers may cache them forever and only re-download after a real change.
+asset_manifest = load_manifest()
+ASSET_ENCODINGS = (('br', '.br'), ('gzip', '.gz')) # Best first
+ASSET_MIMETYPES = {'.css': 'text/css', '.js': 'text/javascript'}
+
+@app.template_global()
+def asset_url(name):
+    global asset_manifest
+    if app.debug: asset_manifest = load_manifest() # Pick up source edits without a restart
+    return url_for('asset', filename=asset_manifest[name])
+
+@app.route('/static/dist/<path:filename>')
+def asset(filename):
+    path = safe_join(DIST_DIR, filename); ext = os.path.splitext(filename)[1]
+    if path is None or ext not in ASSET_MIMETYPES or not os.path.isfile(path): abort(404)
+    encoding = None
+    for name, suffix in ASSET_ENCODINGS:
+        if request.accept_encodings[name] and os.path.isfile(path + suffix): encoding = name; path += suffix; break
+    response = send_file(path, mimetype=ASSET_MIMETYPES[ext], max_age=31536000, conditional=True, etag=True)
+    if encoding: response.headers['Content-Encoding'] = encoding
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    response.vary.add('Accept-Encoding')
+    return response
+
+# =========================================================================
+# PERFORMANCE FEATURE: REGIONAL SHARD ROUTING & SCATTER-GATHER READS
+# =========================================================================
+# Donors, hospitals and hosts work on their own region's shard (session['shard'], set at login).
+# Admins browse one shard at a time (?shard=...); routes that act on a record id follow the id.
+ADMIN_ID_ROUTES = {'edit_user', 'delete_user', 'edit_hospital', 'delete_hospital', 'edit_host', 'delete_host', 'delete_camp_photo_admin'}
+ADMIN_ACCOUNT_ROUTES = {'update_admin_profile', 'change_password'} # The admin account lives in the home shard
+
+@app.before_request
+def route_admin_to_shard():
+    if session.get('role') != 'admin': return None
+    if shards.valid(request.args.get('shard')): session['admin_shard'] = request.args['shard']
+    if request.endpoint in ADMIN_ID_ROUTES: g.shard = shards.shard_for_id(request.view_args['id'])
+    elif request.endpoint not in ADMIN_ACCOUNT_ROUTES: g.shard = shards.valid(session.get('admin_shard')) or shards.home
+
+def find_account(sql, params):
+    """Looks an account up in every shard at once; returns (shard, row) for the first match, else (None, None)."""
+    def lookup(name):
+        conn = get_db_connection(name)
+        try: return conn.execute(sql, params).fetchone()
+        finally: conn.close()
+    for name, row in zip(shards.names, shards.scatter(lookup)):
+        if row is not None: return name, row
+    return None, None
+
+def claim_account(role, shard, **fields):
+    """Claims a new account's phone/email in the home shard's directory for `shard`; returns its keys, or None if one is taken."""
+    keys = account_keys(role, **fields)
+    conn = get_db_connection(shards.home)
+    try: return keys if claim_accounts(conn, [keys], shard)[0] else None
+    finally: conn.close()
+
+def release_account(keys):
+    conn = get_db_connection(shards.home)
+    try: release_accounts(conn, [keys])
+    finally: conn.close()
+
+# Ids name their shard (see sharding.py), so an account cannot follow a city change into another region's shard
+MOVE_SHARD_MESSAGE = 'That city is served by another region. Accounts cannot move between regions; please register a new account there.'
+
+def rekey_account_for(role, shard, old, new):
+    """Moves an edited account's directory keys from the row `old` to the form fields `new`; False if a new key is taken."""
+    conn = get_db_connection(shards.home)
+    try: return rekey_account(conn, account_keys(role, **dict(old)), account_keys(role, **new), shard)
+    finally: conn.close()
+
+def paginate_shards(names, sql, params, arg, page_size, key):
+    """paginate() across shards: each shard returns its first page*size rows in order and the pages are merged by key."""
+    try: number = max(1, int(request.args.get(arg, 1)))
+    except ValueError: number = 1
+    def fetch(name):
+        conn = get_db_connection(name)
+        try:
+            total = conn.execute(f"SELECT COUNT(*) FROM ({sql})", params).fetchone()[0]
+            return total, conn.execute(f"{sql} LIMIT ?", tuple(params) + (min(number, max(1, -(-total // page_size))) * page_size,)).fetchall()
+        finally: conn.close()
+    results = shards.scatter(fetch, names)
+    total = sum(t for t, _ in results)
+    number = min(number, max(1, -(-total // page_size)))
+    rows = merge_sorted([r for _, r in results], key=key, limit=number * page_size)[(number - 1) * page_size:]
+    return Page(rows, number, page_size, total, arg)
+
+# =========================================================================
+# PERFORMANCE FEATURE: QUERY INSTRUMENTATION & SLOW-QUERY LOG
+# =========================================================================
+def explain_query_plan(sql, params):
+    conn = sqlite3.connect(shards.path(current_shard()))
+    conn.create_function("haversine", 4, haversine)
+    try: return conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+    finally: conn.close()
+
+def current_route():
+    return (request.endpoint or 'unmatched') if has_request_context() else 'background'
+
+db_metrics.registry.enabled = os.environ.get('LIFEFLOW_METRICS', '1') != '0'
+db_metrics.registry.slow_query_seconds = float(os.environ.get('LIFEFLOW_SLOW_QUERY_MS', '100')) / 1000
+db_metrics.registry.explain = explain_query_plan
+db_metrics.registry.route_getter = current_route
+
+def render_template(template_name, **context):
+    """flask.render_template plus per-template render time and output size metrics."""
+    start = time.perf_counter()
+    html = flask_render_template(template_name, **context)
+    if db_metrics.registry.enabled:
+        db_metrics.registry.record_template(template_name, time.perf_counter() - start, len(html.encode('utf-8')))
+    return html
+
+class Page:
+    """One page of a larger result set, as consumed by the chunked_rows/pager macros."""
+    def __init__(self, rows, number, size, total, arg):
+        self.rows = rows; self.number = number; self.size = size; self.total = total; self.arg = arg
+        self.pages = max(1, -(-total // size))
+        self.first = (number - 1) * size + 1 if total else 0
+        self.last = min(number * size, total)
+
+def paginate(conn, sql, params, arg, page_size=None):
+    """Runs sql for the page named by request.args[arg]; the total comes from a COUNT(*) over the same query."""
+    page_size = page_size or app.config['ADMIN_PAGE_SIZE']
+    try: number = max(1, int(request.args.get(arg, 1)))
+    except ValueError: number = 1
+    total = conn.execute(f"SELECT COUNT(*) FROM ({sql})", params).fetchone()[0]
+    number = min(number, max(1, -(-total // page_size)))
+    rows = conn.execute(f"{sql} LIMIT ? OFFSET ?", tuple(params) + (page_size, (number - 1) * page_size)).fetchall()
+    return Page(rows, number, page_size, total, arg)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.teardown_request
+def record_request_time(exc=None):
+    started = g.pop('request_started', None)
+    if started is not None and db_metrics.registry.enabled:
+        db_metrics.registry.record_request(current_route(), time.perf_counter() - started)
+
+def init_db(shard):
+    os.makedirs(os.path.dirname(os.path.abspath(shard.path)), exist_ok=True)
+    conn = sqlite3.connect(shard.path)
     c = conn.cursor()
     
     # 1. Existing Tables
@@ -67,6 +325,8 @@ def init_db():
                   blood_group TEXT, city TEXT, address TEXT, phone TEXT UNIQUE, password TEXT, role TEXT DEFAULT 'user')''')
     c.execute('''CREATE TABLE IF NOT EXISTS hospitals
                  (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, email TEXT UNIQUE, password TEXT, lat REAL, lng REAL, type TEXT)''')
+    try: c.execute("ALTER TABLE hospitals ADD COLUMN city TEXT DEFAULT 'Chennai'") # Picks the hospital's regional shard
+    except sqlite3.OperationalError: pass
     c.execute('''CREATE TABLE IF NOT EXISTS appointments
                  (id INTEGER PRIMARY KEY AUTOINCREMENT, donor_id INTEGER, hospital_id INTEGER, 
                   date TEXT, time_slot TEXT, status TEXT DEFAULT 'Scheduled',
@@ -94,6 +354,36 @@ def init_db():
                   booking_date TEXT, status TEXT DEFAULT 'Registered',
                   FOREIGN KEY(camp_id) REFERENCES camps(id),
                   FOREIGN KEY(donor_id) REFERENCES donors(id))''')
+    # =========================================================================
+    # DBMS FEATURE: ATOMIC CAMP REGISTRATION COUNTER + ONE SEAT PER DONOR
+    # =========================================================================
+    try:
+        c.execute("ALTER TABLE camps ADD COLUMN registered_count INTEGER DEFAULT 0")
+        c.execute("DELETE FROM camp_registrations WHERE id NOT IN (SELECT MIN(id) FROM camp_registrations GROUP BY camp_id, donor_id)")
+        c.execute("UPDATE camps SET registered_count = (SELECT COUNT(*) FROM camp_registrations cr WHERE cr.camp_id = camps.id)")
+    except sqlite3.OperationalError: pass
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_camp_reg_unique ON camp_registrations(camp_id, donor_id)")
+    # Seats are taken by the conditional increment in book_appointment; freeing one is handled here
+    c.execute('''CREATE TRIGGER IF NOT EXISTS camp_registration_release
+                 AFTER DELETE ON camp_registrations
+                 BEGIN
+                     UPDATE camps SET registered_count = MAX(registered_count - 1, 0) WHERE id = OLD.camp_id;
+                 END;''')
+    # Camp date copied onto each registration so the donor timeline can walk one (donor_id, date) index
+    try:
+        c.execute("ALTER TABLE camp_registrations ADD COLUMN camp_date TEXT")
+        c.execute("UPDATE camp_registrations SET camp_date = (SELECT date FROM camps WHERE camps.id = camp_registrations.camp_id)")
+    except sqlite3.OperationalError: pass
+    c.execute('''CREATE TRIGGER IF NOT EXISTS camp_registration_date
+                 AFTER INSERT ON camp_registrations WHEN NEW.camp_date IS NULL
+                 BEGIN
+                     UPDATE camp_registrations SET camp_date = (SELECT date FROM camps WHERE id = NEW.camp_id) WHERE id = NEW.id;
+                 END;''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS camp_date_changed
+                 AFTER UPDATE OF date ON camps
+                 BEGIN
+                     UPDATE camp_registrations SET camp_date = NEW.date WHERE camp_id = NEW.id;
+                 END;''')
     c.execute('''CREATE TABLE IF NOT EXISTS camp_photos
                  (id INTEGER PRIMARY KEY AUTOINCREMENT, camp_id INTEGER, filename TEXT,
                   FOREIGN KEY(camp_id) REFERENCES camps(id))''')
@@ -111,6 +401,33 @@ def init_db():
     c.execute("CREATE INDEX IF NOT EXISTS idx_donor_bg ON donors(blood_group)")
     c.execute("CREATE INDEX IF NOT EXISTS idx_donation_status ON donations(status)")
     c.execute("CREATE INDEX IF NOT EXISTS idx_appointment_status ON appointments(status)")
+    # Composite indexes backing the hospital verification queue (see get_hospital_dashboard_data)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_appointment_hosp_status_date ON appointments(hospital_id, status, date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_donation_hosp_status_date ON donations(hospital, status, date)")
+    # Per-donor history lookups (eligibility check, one-donation-per-day guard in verification and bulk import)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_donation_donor_date ON donations(donor_id, date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_donation_date ON donations(date)")
+    # Donor activity timeline on the profile page (see donor_timeline)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_appointment_donor_date ON appointments(donor_id, date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_camp_reg_donor_date ON camp_registrations(donor_id, camp_date)")
+
+    # SOS alert campaigns + notification queue (see sos_campaigns.py)
+    init_sos_tables(c)
+
+    # Per-donor donation totals per period, kept current by triggers on donations (see leaderboards.py)
+    init_leaderboard_tables(c)
+
+    # Unit-level inventory ledger with expiry dates and balance snapshots (see inventory.py)
+    init_inventory_tables(c)
+
+    # Per-donor summaries of history moved to the cold archive database (see archive.py)
+    init_archive_tables(c)
+
+    # Sequenced change log of the replicated tables for other nodes and caches (see cdc.py)
+    init_cdc_tables(c)
+
+    # Donor phones/emails and host emails, unique across every shard (see accounts.py)
+    if shard.name == shards.home: init_account_tables(c)
 
     # =========================================================================
     # DBMS FEATURE 2: DATABASE TRIGGERS FOR SECURITY AUDITING
@@ -151,22 +468,27 @@ def init_db():
         c.execute("UPDATE donors SET lat = ?, lng = ? WHERE id = ?", 
                  (13.08 + random.uniform(-0.1, 0.1), 80.27 + random.uniform(-0.1, 0.1), d[0]))
 
-    # Seed Admin & Hospitals
+    # Ids in shard N start at N * sharding.ID_SPAN, so an id alone tells which shard holds the row
+    reserve_id_range(c, shard.index)
+
+    # Seed Admin (home shard) & Hospitals (each in its region's shard)
     c.execute("SELECT * FROM donors WHERE role='admin'")
-    if not c.fetchone():
+    if shard.name == shards.home and not c.fetchone():
         c.execute("INSERT INTO donors (name, phone, email, password, role, blood_group) VALUES (?, ?, ?, ?, ?, ?)",
                   ('Super Admin', 'admin', 'admin@bloodbank.com', generate_password_hash('admin123'), 'admin', 'O+'))
     
     hashed_hosp_pw = generate_password_hash('password123')
     for h in HOSPITALS_DATA:
+        if shards.shard_for_city(h['city']) != shard.name: continue
         c.execute("SELECT * FROM hospitals WHERE email=?", (h['email'],))
         if not c.fetchone():
-            c.execute("INSERT INTO hospitals (name, email, password, lat, lng, type) VALUES (?, ?, ?, ?, ?, ?)",
-                      (h['name'], h['email'], hashed_hosp_pw, h['lat'], h['lng'], h['type']))
+            c.execute("INSERT INTO hospitals (name, email, password, lat, lng, type, city) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                      (h['name'], h['email'], hashed_hosp_pw, h['lat'], h['lng'], h['type'], h['city']))
     conn.commit()
     conn.close()
 
-init_db()
+for _shard in shards.shards: init_db(_shard)
+_home = sqlite3.connect(DATABASE); backfill_accounts(_home, shards); _home.close()
 
 # --- HELPER: CHECK ELIGIBILITY ---
 def check_eligibility(user_id):
@@ -223,42 +545,50 @@ The LifeFlow Team
 
 @app.route('/')
 def index():
-    conn = get_db_connection()
+    # Every regional shard is read in parallel and the pieces merged here (inline when there is one shard)
+    parts = shards.scatter(homepage_shard_data)
+    total_donors = sum(p['total_donors'] for p in parts)
+    total_verified = sum(p['total_verified'] for p in parts)
+    blood_stock = {g: 0 for g in ['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-']}
+    for p in parts:
+        for group, units in p['blood_stock'].items():
+            if group in blood_stock: blood_stock[group] += units
+    leaderboard_data = merge_sorted([p['leaderboard'] for p in parts], key=lambda r: (-r['total_volume'], r['name']), limit=3)
+    upcoming_camps = merge_sorted([p['upcoming_camps'] for p in parts], key=lambda c: c['date'], limit=3)
+    gallery_photos = merge_sorted([p['gallery_photos'] for p in parts], key=lambda ph: ph['date'], limit=10, reverse=True)
+    hospital_list = [h for p in parts for h in p['hospital_list']]
+    return render_template('index.html', total_donors=total_donors, total_units=total_verified, 
+                           lives_saved=total_verified*3, blood_stock=blood_stock, 
+                           upcoming_camps=upcoming_camps, gallery_photos=gallery_photos,
+                           leaderboard=leaderboard_data, hospital_list=hospital_list)
+
+def homepage_shard_data(shard):
+    conn = get_db_connection(shard)
     today_str = date.today().strftime('%Y-%m-%d')
     
     total_donors = conn.execute('SELECT COUNT(*) FROM donors WHERE role!="admin"').fetchone()[0]
     
     # Combined calculations for Total Units logic
     internal_units = conn.execute("SELECT COUNT(*) FROM appointments WHERE status='Verified'").fetchone()[0]
+    internal_units += conn.execute("SELECT IFNULL(SUM(verified_appointments), 0) FROM donor_archive_summary").fetchone()[0] # Moved to the archive
     external_units_row = conn.execute("SELECT SUM(units) FROM hospital_stock").fetchone()[0]
     external_units = external_units_row if external_units_row else 0
     total_verified = internal_units + external_units
 
-    # Combined internal and external stock per blood group
-    internal_stock = conn.execute("SELECT u.blood_group, COUNT(*) as count FROM donations d JOIN donors u ON d.donor_id = u.id WHERE d.status='Approved' GROUP BY u.blood_group").fetchall()
-    external_stock = conn.execute("SELECT blood_group, SUM(units) as count FROM hospital_stock GROUP BY blood_group").fetchall()
+    # Unexpired units per blood group (donated + externally received) from the inventory ledger
+    stock = current_stock(conn)
+    blood_stock = {}
+    hospital_stock_totals = {}
+    for (hospital_id, group), units in stock.items():
+        blood_stock[group] = blood_stock.get(group, 0) + units
+        hospital_stock_totals[hospital_id] = hospital_stock_totals.get(hospital_id, 0) + units
     
-    blood_stock = {g: 0 for g in ['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-']}
-    
-    # Tally up internal and external stock for the Home Page
-    for row in internal_stock:
-        if row['blood_group'] in blood_stock:
-            blood_stock[row['blood_group']] += row['count']
-    for row in external_stock:
-        if row['blood_group'] in blood_stock:
-            blood_stock[row['blood_group']] += row['count']
-    
-    leaderboard_data = conn.execute('''
-        SELECT d.name, d.blood_group, SUM(dn.volume_ml) as total_volume
-        FROM donors d
-        JOIN donations dn ON d.id = dn.donor_id
-        WHERE dn.status = 'Approved'
-        GROUP BY d.id
-        ORDER BY total_volume DESC, d.name ASC LIMIT 3
-    ''').fetchall()
+    # Hall of Fame: top 3 straight off the donor_totals rank index
+    sql, params = leaderboard_query('all')
+    leaderboard_data = conn.execute(f"{sql} LIMIT 3", params).fetchall()
 
     upcoming_camps = conn.execute('''
-        SELECT c.*, (SELECT COUNT(*) FROM camp_registrations cr WHERE cr.camp_id = c.id) as registered_count 
+        SELECT c.* 
         FROM camps c WHERE c.status='Upcoming' AND c.date >= ? ORDER BY c.date ASC LIMIT 3
     ''', (today_str,)).fetchall()
 
@@ -271,25 +601,17 @@ def index():
     # =========================================================================
     # NEW FEATURE: HOSPITAL INVENTORY LIST FOR HOMEPAGE
     # =========================================================================
-    hospitals_db = conn.execute('''
-        SELECT h.id, h.name, h.type, h.email as contact, 
-        (SELECT COUNT(*) FROM donations d WHERE d.hospital = h.name AND d.status = 'Approved') as internal_stock,
-        IFNULL((SELECT SUM(units) FROM hospital_stock hs WHERE hs.hospital_id = h.id), 0) as external_stock
-        FROM hospitals h
-    ''').fetchall()
+    hospitals_db = conn.execute("SELECT h.id, h.name, h.type, h.email as contact, h.city FROM hospitals h").fetchall()
     
     hospital_list = []
     for h in hospitals_db:
         hd = dict(h)
-        hd['total_stock'] = hd['internal_stock'] + hd['external_stock']
-        hd['city'] = 'Chennai' # Since predefined ones are in Chennai, this enables the filter
+        hd['total_stock'] = hospital_stock_totals.get(h['id'], 0)
         hospital_list.append(hd)
 
     conn.close()
-    return render_template('index.html', total_donors=total_donors, total_units=total_verified, 
-                           lives_saved=total_verified*3, blood_stock=blood_stock, 
-                           upcoming_camps=upcoming_camps, gallery_photos=gallery_photos,
-                           leaderboard=leaderboard_data, hospital_list=hospital_list)
+    return {'total_donors': total_donors, 'total_verified': total_verified, 'blood_stock': blood_stock, 'leaderboard': leaderboard_data,
+            'upcoming_camps': upcoming_camps, 'gallery_photos': gallery_photos, 'hospital_list': hospital_list}
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -297,35 +619,35 @@ def login():
         login_id = request.form['login_id']
         password = request.form['password']
         role_type = request.form.get('login_type') 
-        conn = get_db_connection()
+        # Accounts live in their region's shard; every shard is searched at once and the match pins the session
         if role_type == 'hospital':
-            user = conn.execute('SELECT * FROM hospitals WHERE email = ?', (login_id,)).fetchone()
+            shard, user = find_account('SELECT * FROM hospitals WHERE email = ?', (login_id,))
             if user and check_password_hash(user['password'], password):
-                session['user_id'] = user['id']; session['role'] = 'hospital'; session['name'] = user['name']
+                session['user_id'] = user['id']; session['role'] = 'hospital'; session['name'] = user['name']; session['shard'] = shard
                 return redirect(url_for('hospital_dashboard'))
         elif role_type == 'host':
-            user = conn.execute('SELECT * FROM camp_hosts WHERE email = ?', (login_id,)).fetchone()
+            shard, user = find_account('SELECT * FROM camp_hosts WHERE email = ?', (login_id,))
             if user and check_password_hash(user['password'], password):
-                session['user_id'] = user['id']; session['role'] = 'host'; session['name'] = user['organization_name']
+                session['user_id'] = user['id']; session['role'] = 'host'; session['name'] = user['organization_name']; session['shard'] = shard
                 return redirect(url_for('host_dashboard'))
         else: 
-            user = conn.execute('SELECT * FROM donors WHERE phone = ? OR email = ?', (login_id, login_id)).fetchone()
+            shard, user = find_account('SELECT * FROM donors WHERE phone = ? OR email = ?', (login_id, login_id))
             if user and check_password_hash(user['password'], password):
                 if user['role'] == 'admin': 
                     flash('Please use Admin Login', 'warning'); return redirect(url_for('admin_login'))
-                session['user_id'] = user['id']; session['role'] = user['role']; session['name'] = user['name']
+                session['user_id'] = user['id']; session['role'] = user['role']; session['name'] = user['name']; session['shard'] = shard
                 return redirect(url_for('user_profile'))
-        conn.close(); flash('Invalid Credentials', 'danger')
+        flash('Invalid Credentials', 'danger')
     return render_template('login.html')
 
 @app.route('/admin/login', methods=['GET', 'POST'])
 def admin_login():
     if request.method == 'POST':
-        conn = get_db_connection()
+        conn = get_db_connection(shards.home)
         user = conn.execute("SELECT * FROM donors WHERE email = ? AND role = 'admin'", (request.form['email'],)).fetchone()
         conn.close()
         if user and check_password_hash(user['password'], request.form['password']):
-            session['user_id'] = user['id']; session['role'] = 'admin'; session['name'] = user['name']
+            session['user_id'] = user['id']; session['role'] = 'admin'; session['name'] = user['name']; session['shard'] = shards.home
             return redirect(url_for('admin_dashboard'))
         flash('Invalid Admin Credentials', 'danger')
     return render_template('admin_login.html')
@@ -342,15 +664,19 @@ def register():
             flash("Medical Alert: You must be at least 18 years old and 50kg to donate.", "danger")
             return redirect(url_for('register'))
 
-        # 3. Proceed to Database Insertion
+        # 3. Proceed to Database Insertion (in the shard for the donor's city, once the account directory has taken its phone/email)
         try:
-            conn = get_db_connection()
-            conn.execute("INSERT INTO donors (name, email, phone, password, blood_group, city, age, weight, address, role) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 'user')",
+            shard = shards.shard_for_city(request.form['city'])
+            keys = claim_account('donor', shard, phone=request.form['phone'], email=request.form['email'])
+            if keys is None: raise sqlite3.IntegrityError('duplicate donor')
+            conn = get_db_connection(shard)
+            try: conn.execute("INSERT INTO donors (name, email, phone, password, blood_group, city, age, weight, address, role) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 'user')",
                          (request.form['name'], request.form['email'], request.form['phone'], 
                           generate_password_hash(request.form['password']), 
-                          request.form['blood_group'], request.form['city'], age, weight, request.form['address']))
-            conn.commit()
-            conn.close()
+                          request.form['blood_group'], request.form['city'], age, weight, request.form['address'])); conn.commit()
+            except Exception: release_account(keys); raise
+            finally: conn.close()
+            donor_index.invalidate(request.form['blood_group'])
             return redirect(url_for('login'))
         except Exception as e:
             flash('Phone number or Email already registered.', 'danger')
@@ -361,10 +687,15 @@ def register():
 def register_host():
     if request.method == 'POST':
         try:
-            conn = get_db_connection()
-            conn.execute("INSERT INTO camp_hosts (organization_name, leader_name, email, phone, aadhar_number, password, city, address) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-                         (request.form['organization_name'], request.form['leader_name'], request.form['email'], request.form['phone'], request.form['aadhar_number'], generate_password_hash(request.form['password']), request.form['city'], request.form['address']))
-            conn.commit(); conn.close(); flash('Host Account Created!', 'success'); return redirect(url_for('login'))
+            shard = shards.shard_for_city(request.form['city'])
+            keys = claim_account('host', shard, email=request.form['email'])
+            if keys is None: raise sqlite3.IntegrityError('duplicate host')
+            conn = get_db_connection(shard)
+            try: conn.execute("INSERT INTO camp_hosts (organization_name, leader_name, email, phone, aadhar_number, password, city, address) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                              (request.form['organization_name'], request.form['leader_name'], request.form['email'], request.form['phone'], request.form['aadhar_number'], generate_password_hash(request.form['password']), request.form['city'], request.form['address'])); conn.commit()
+            except Exception: release_account(keys); raise
+            finally: conn.close()
+            flash('Host Account Created!', 'success'); return redirect(url_for('login'))
         except: flash('Error creating host account.', 'danger')
     return render_template('register_host.html')
 
@@ -382,7 +713,7 @@ def host_dashboard():
                      (session['user_id'], request.form['camp_name'], start_date, time_str, request.form['location_name'], request.form['lat'], request.form['lng'], request.form['estimated_participants'], request.form['city']))
         conn.commit(); flash('Camp Scheduled!', 'success'); return redirect(url_for('host_dashboard'))
     
-    my_camps = conn.execute("SELECT c.*, (SELECT COUNT(*) FROM camp_registrations cr JOIN donors d ON cr.donor_id = d.id WHERE cr.camp_id = c.id) as registered_count FROM camps c WHERE host_id = ? ORDER BY date DESC", (session['user_id'],)).fetchall()
+    my_camps = conn.execute("SELECT c.* FROM camps c WHERE host_id = ? ORDER BY date DESC", (session['user_id'],)).fetchall()
     today_str = date.today().strftime('%Y-%m-%d')
     pending_uploads = conn.execute("SELECT * FROM camps c WHERE c.host_id = ? AND c.date < ? AND NOT EXISTS (SELECT 1 FROM camp_photos cp WHERE cp.camp_id = c.id)", (session['user_id'], today_str)).fetchall()
     host_details = conn.execute('SELECT * FROM camp_hosts WHERE id = ?', (session['user_id'],)).fetchone()
@@ -396,7 +727,7 @@ def host_dashboard():
     ''', (session['user_id'],)).fetchall()
     
     conn.close()
-    return render_template('host_dashboard.html', camps=my_camps, host=host_details, camp_donors=camp_donors, pending_uploads=pending_uploads)
+    return render_template('host_dashboard.html', camps=my_camps, host=host_details, camp_donors=camp_donors, pending_uploads=pending_uploads, today=today_str)
 
 @app.route('/host/upload_photo', methods=['POST'])
 def upload_camp_photo():
@@ -422,23 +753,27 @@ def export_camp_donors(camp_id):
     if session.get('role') != 'host': return redirect(url_for('login'))
     conn = get_db_connection()
     camp = conn.execute("SELECT * FROM camps WHERE id = ? AND host_id = ?", (camp_id, session['user_id'])).fetchone()
-    if not camp: conn.close(); return "Unauthorized", 403
-    donors = conn.execute("SELECT d.name, d.blood_group, d.phone, d.email, d.city FROM camp_registrations cr LEFT JOIN donors d ON cr.donor_id = d.id WHERE cr.camp_id = ?", (camp_id,)).fetchall()
+    conn.close()
+    if not camp: return "Unauthorized", 403
+    conn = get_analytics_connection()
+    source = report_source(conn, 'report_camp_donors', current_archive()) if request.args.get('include_archive') else 'report_camp_donors'
+    donors = conn.execute(f"SELECT name, blood_group, phone, email, city FROM {source} WHERE camp_id = ?", (camp_id,)).fetchall()
     conn.close()
     file_format = request.args.get('format', 'csv')
     if file_format == 'pdf':
-        pdf = FPDF(); pdf.add_page(); pdf.set_font("Arial", 'B', 16); pdf.cell(0, 10, f"Donor List: {camp['name']}", 0, 1, 'C'); pdf.ln(10)
+        pdf = FPDF(); pdf.add_page(); pdf.set_font("Arial", 'B', 16); pdf.cell(0, 10, f"Donor List: {camp['name']}", 0, 1, 'C')
+        pdf.set_font("Arial", '', 9); pdf.cell(0, 6, f"Data as of {current_analytics().taken_at()}", 0, 1, 'C'); pdf.ln(4)
         pdf.set_font("Arial", 'B', 10); headers = ['Name', 'Group', 'Phone', 'Email', 'City']; widths = [40, 15, 30, 60, 30]
         for i, h in enumerate(headers): pdf.cell(widths[i], 10, h, 1)
         pdf.ln(); pdf.set_font("Arial", '', 10)
         for d in donors:
             pdf.cell(widths[0], 10, str(d['name'] or 'Deleted'), 1); pdf.cell(widths[1], 10, str(d['blood_group'] or '-'), 1)
             pdf.cell(widths[2], 10, str(d['phone'] or '-'), 1); pdf.cell(widths[3], 10, str(d['email'] or '-'), 1); pdf.cell(widths[4], 10, str(d['city'] or '-'), 1); pdf.ln()
-        response = make_response(pdf.output(dest='S').encode('latin-1')); response.headers['Content-Type'] = 'application/pdf'; response.headers['Content-Disposition'] = f'attachment; filename=Donors_{camp_id}.pdf'; return response
+        response = make_response(pdf.output(dest='S').encode('latin-1')); response.headers['Content-Type'] = 'application/pdf'; response.headers['Content-Disposition'] = f'attachment; filename=Donors_{camp_id}.pdf'; return stamp_snapshot(response)
     else:
         si = StringIO(); cw = csv.writer(si); cw.writerow(['Name', 'Blood Group', 'Phone', 'Email', 'City'])
         for d in donors: cw.writerow([d['name'] or 'Deleted', d['blood_group'], d['phone'], d['email'], d['city']])
-        out = make_response(si.getvalue()); out.headers["Content-Disposition"] = f"attachment; filename=Donors_{camp_id}.csv"; out.headers["Content-type"] = "text/csv"; return out
+        out = make_response(si.getvalue()); out.headers["Content-Disposition"] = f"attachment; filename=Donors_{camp_id}.csv"; out.headers["Content-type"] = "text/csv"; return stamp_snapshot(out)
 
 @app.route('/profile', methods=['GET', 'POST'])
 def user_profile():
@@ -447,24 +782,15 @@ def user_profile():
     if session.get('role') == 'host': return redirect(url_for('host_dashboard'))
     conn = get_db_connection()
     if request.method == 'POST':
-        conn.execute('UPDATE donors SET name=?, email=?, city=?, address=? WHERE id=?', (request.form['name'], request.form['email'], request.form['city'], request.form['address'], session['user_id'])); conn.commit(); flash('Updated!', 'success')
+        # The donor's rows live in their region's shard, so a city in another region is refused; a new email is claimed first
+        old = conn.execute('SELECT phone, email FROM donors WHERE id = ?', (session['user_id'],)).fetchone()
+        if shards.shard_for_city(request.form['city']) != conn.shard: flash(MOVE_SHARD_MESSAGE, 'danger')
+        elif old and not rekey_account_for('donor', conn.shard, old, {'phone': old['phone'], 'email': request.form['email']}): flash('Email already registered.', 'danger')
+        else: conn.execute('UPDATE donors SET name=?, email=?, city=?, address=? WHERE id=?', (request.form['name'], request.form['email'], request.form['city'], request.form['address'], session['user_id'])); conn.commit(); flash('Updated!', 'success')
     user = conn.execute('SELECT * FROM donors WHERE id = ?', (session['user_id'],)).fetchone()
-    appointments = conn.execute("SELECT a.id, a.date, a.time_slot, a.status, h.name as location_name, 'Hospital' as type FROM appointments a JOIN hospitals h ON a.hospital_id = h.id WHERE a.donor_id = ?", (session['user_id'],)).fetchall()
-    camp_bookings = conn.execute("SELECT cr.id, c.date, c.time as time_slot, cr.status, c.name as location_name, 'Camp' as type FROM camp_registrations cr JOIN camps c ON cr.camp_id = c.id WHERE cr.donor_id = ?", (session['user_id'],)).fetchall()
-    all_bookings = sorted(appointments + camp_bookings, key=lambda x: x['date'], reverse=True)
-    
-    donations = conn.execute('''
-        SELECT id, date, volume_ml, hospital, status, 'Manual' as source 
-        FROM donations WHERE donor_id = ? 
-        UNION ALL 
-        SELECT a.id, a.date, 450 as volume_ml, h.name as hospital, a.status, 'Appointment' as source 
-        FROM appointments a JOIN hospitals h ON a.hospital_id = h.id 
-        WHERE a.donor_id = ? AND a.status = 'Verified' 
-        ORDER BY date DESC
-    ''', (session['user_id'], session['user_id'])).fetchall()
-    
-    hospitals = conn.execute("SELECT * FROM hospitals").fetchall()
-    conn.close(); return render_template('user_profile.html', user=user, appointments=all_bookings, donations=donations, hospitals=hospitals)
+    archived = conn.execute('SELECT * FROM donor_archive_summary WHERE donor_id = ?', (session['user_id'],)).fetchone()
+    timeline = donor_timeline(conn, session['user_id'], request.args.get('before'), include_archive=bool(archived) and request.args.get('archive') == '1')
+    conn.close(); return render_template('user_profile.html', user=user, timeline=timeline, archived=archived, hospitals=get_hospital_list())
 
 @app.route('/change_password', methods=['POST'])
 def change_password():
@@ -495,6 +821,7 @@ def donate():
     
     conn.commit()
     conn.close()
+    invalidate_hospital_dashboard_by_name(request.form['hospital_name'])
     flash('Past donation logged! Awaiting verification from hospital.', 'info')
     return redirect(url_for('user_profile'))
 
@@ -529,6 +856,7 @@ def book_appointment():
                     conn.execute('INSERT INTO appointments (donor_id, hospital_id, date, time_slot) VALUES (?, ?, ?, ?)', (session['user_id'], hosp_id, book_date, time_slot))
                     
                     conn.commit()
+                    invalidate_hospital_dashboard(hosp_id)
                     flash('Booked successfully! Check your email for confirmation.', 'success')
                     
                     donor = conn.execute("SELECT name, email FROM donors WHERE id = ?", (session['user_id'],)).fetchone()
@@ -542,18 +870,35 @@ def book_appointment():
                 
         elif booking_type == 'camp':
             camp_id = request.form['camp_id']
-            exists = conn.execute("SELECT id FROM camp_registrations WHERE camp_id = ? AND donor_id = ?", (camp_id, session['user_id'])).fetchone()
-            if exists: flash('Already registered.', 'warning')
-            else: 
-                conn.execute('INSERT INTO camp_registrations (camp_id, donor_id, booking_date) VALUES (?, ?, ?)', (camp_id, session['user_id'], date.today()))
-                conn.commit()
-                flash('Registered for the camp!', 'success')
+            try:
+                conn.execute("BEGIN IMMEDIATE TRANSACTION")
+                # Conditional increment: the seat is only taken while the camp still has capacity
+                seat = conn.execute('''UPDATE camps SET registered_count = registered_count + 1
+                                        WHERE id = ? AND status = 'Upcoming'
+                                          AND (estimated_participants IS NULL OR registered_count < estimated_participants)
+                                          AND NOT EXISTS (SELECT 1 FROM camp_registrations WHERE camp_id = ? AND donor_id = ?)''',
+                                    (camp_id, camp_id, session['user_id']))
+                if seat.rowcount == 1:
+                    conn.execute('INSERT INTO camp_registrations (camp_id, donor_id, booking_date) VALUES (?, ?, ?)', (camp_id, session['user_id'], date.today()))
+                    conn.commit()
+                    flash('Registered for the camp!', 'success')
+                else:
+                    conn.rollback()
+                    exists = conn.execute("SELECT id FROM camp_registrations WHERE camp_id = ? AND donor_id = ?", (camp_id, session['user_id'])).fetchone()
+                    if exists: flash('Already registered.', 'warning')
+                    else: flash('Sorry! This camp is already full.', 'danger')
+            except sqlite3.IntegrityError:
+                conn.rollback()
+                flash('Already registered.', 'warning')
+            except sqlite3.OperationalError:
+                conn.rollback()
+                flash('A database transaction error occurred. Please try again.', 'danger')
         
         conn.close()
         return redirect(url_for('user_profile'))
         
     today_str = date.today().strftime('%Y-%m-%d')
-    hospitals = conn.execute('SELECT * FROM hospitals').fetchall()
+    hospitals = get_hospital_list()
     camps = conn.execute("SELECT * FROM camps WHERE status='Upcoming' AND date >= ? ORDER BY date ASC", (today_str,)).fetchall()
     conn.close()
     return render_template('book_appointment.html', hospitals=hospitals, camps=camps, current_date=date.today())
@@ -568,32 +913,156 @@ def public_sos():
         lng = request.form.get('lng')
         blood_group = request.form.get('blood_group')
         
-        if not lat or not lng:
+        try: lat, lng = float(lat), float(lng)
+        except (TypeError, ValueError): lat = lng = None
+        if lat is None or lng is None:
             flash("Please allow location access to use the SOS Radar.", "warning")
             return redirect(url_for('public_sos'))
-            
-        conn = get_db_connection()
-        nearest_donors = conn.execute('''
-            SELECT name, phone, blood_group, city, 
-                   ROUND(haversine(?, ?, lat, lng), 2) as distance_km 
-            FROM donors 
-            WHERE blood_group = ? AND role != 'admin' AND lat IS NOT NULL
-            ORDER BY distance_km ASC 
-            LIMIT 5
-        ''', (lat, lng, blood_group)).fetchall()
-        conn.close()
+
+        # Searches from the same blood group and coordinate cell (~1 km) share one query, run from the cell centre
+        cell = (round(lat, SOS_CELL_DECIMALS), round(lng, SOS_CELL_DECIMALS))
+        nearest_donors = public_reads.do(('sos', blood_group) + cell, lambda: nearest_public_donors(blood_group, *cell))
         
         return render_template('public_sos.html', nearest_donors=nearest_donors, sos_bg=blood_group)
     
     return render_template('public_sos.html')
 
+def nearest_public_donors(blood_group, lat, lng):
+    # Each shard returns its own nearest five; the closest five overall win
+    return merge_sorted(shards.scatter(lambda shard: shard_nearest_donors(shard, blood_group, lat, lng)), key=lambda d: d['distance_km'], limit=5)
+
+def shard_nearest_donors(shard, blood_group, lat, lng):
+    conn = get_db_connection(shard)
+    nearest_donors = conn.execute('''
+        SELECT name, phone, blood_group, city, 
+               ROUND(haversine(?, ?, lat, lng), 2) as distance_km 
+        FROM donors 
+        WHERE blood_group = ? AND role != 'admin' AND lat IS NOT NULL
+        ORDER BY distance_km ASC 
+        LIMIT 5
+    ''', (lat, lng, blood_group)).fetchall()
+    conn.close()
+    return nearest_donors
+
 # =========================================================================
-# DBMS FEATURE: SPATIAL QUERIES - HOSPITAL SOS
+# PERFORMANCE FEATURE: HOSPITAL DASHBOARD DATA SERVICE (CACHED PER HOSPITAL)
+# =========================================================================
+DASHBOARD_CACHE_TTL = 60 # Seconds; safety net for changes made by other worker processes
+_dashboard_cache = {}
+_dashboard_cache_lock = threading.Lock()
+
+def get_hospital_dashboard_data(hospital_id, hospital_name):
+    """Returns the upcoming schedule and the verification queue for one hospital.
+    The queue (due appointments + pending manual claims) comes from a single UNION ALL ordered in SQL."""
+    today_str = date.today().strftime('%Y-%m-%d')
+    key = (hospital_id, today_str)
+    with _dashboard_cache_lock:
+        cached = _dashboard_cache.get(key)
+    if cached and time.monotonic() - cached[0] < DASHBOARD_CACHE_TTL:
+        return cached[1]
+
+    conn = get_db_connection()
+    upcoming = conn.execute("SELECT a.*, d.name as donor_name, d.blood_group, d.phone FROM appointments a JOIN donors d ON a.donor_id = d.id WHERE a.hospital_id = ? AND a.status = 'Scheduled' AND a.date > ? ORDER BY a.date ASC", (hospital_id, today_str)).fetchall()
+    verification_queue = conn.execute('''
+        SELECT a.id, a.date, a.time_slot, 'Appointment' as type, d.name as donor_name, d.blood_group, d.phone, a.status
+        FROM appointments a JOIN donors d ON a.donor_id = d.id
+        WHERE a.hospital_id = ? AND a.status = 'Scheduled' AND a.date <= ?
+        UNION ALL
+        SELECT dn.id, dn.date, 'N/A' as time_slot, 'Manual Request' as type, u.name as donor_name, u.blood_group, u.phone, dn.status
+        FROM donations dn JOIN donors u ON dn.donor_id = u.id
+        WHERE dn.hospital = ? AND dn.status = 'Pending'
+        ORDER BY date ASC
+    ''', (hospital_id, today_str, hospital_name)).fetchall()
+    conn.close()
+
+    data = {'upcoming': upcoming, 'verification_queue': verification_queue}
+    with _dashboard_cache_lock:
+        _dashboard_cache[key] = (time.monotonic(), data)
+    return data
+
+def invalidate_hospital_dashboard(hospital_id=None):
+    """Drops cached dashboard data for one hospital, or for every hospital when no id is given."""
+    with _dashboard_cache_lock:
+        if hospital_id is None: _dashboard_cache.clear(); return
+        for key in [k for k in _dashboard_cache if k[0] == int(hospital_id)]: del _dashboard_cache[key]
+
+def invalidate_hospital_dashboard_by_name(hospital_name):
+    conn = get_db_connection()
+    hosp = conn.execute("SELECT id FROM hospitals WHERE name = ?", (hospital_name,)).fetchone()
+    conn.close()
+    if hosp: invalidate_hospital_dashboard(hosp['id'])
+
+# =========================================================================
+# PERFORMANCE FEATURE: DONOR ACTIVITY TIMELINE & HOSPITAL LIST CACHE
+# =========================================================================
+# Hospital bookings, camp registrations and logged donations in one UNION ALL. Each arm walks a
+# (donor_id, date) index from the cursor, so SQLite merges the already-ordered arms and stops after
+# one page: the cost is the same for a donor with five rows or five thousand. Paging is keyset
+# ("before" = the last row shown) rather than OFFSET/COUNT, which would both scan the whole history.
+# A verified appointment is shown through the donation row that verification created for it.
+DONOR_TIMELINE_PAGE_SIZE = 20
+_DONOR_TIMELINE_ARMS = ['''
+    SELECT a.id, a.date, 'Hospital' as type, h.name as location_name, a.time_slot, a.status
+    FROM {db}appointments a JOIN hospitals h ON a.hospital_id = h.id
+    WHERE a.donor_id = :donor AND a.date <= :date AND (a.date < :date OR 'Hospital' < :type OR ('Hospital' = :type AND a.id < :id))
+      AND NOT (a.status = 'Verified' AND EXISTS (SELECT 1 FROM {db}donations dn WHERE dn.donor_id = a.donor_id AND dn.date = a.date))''', '''
+    SELECT cr.id, cr.camp_date as date, 'Camp' as type, c.name as location_name, c.time as time_slot, cr.status
+    FROM {db}camp_registrations cr JOIN camps c ON cr.camp_id = c.id
+    WHERE cr.donor_id = :donor AND cr.camp_date <= :date AND (cr.camp_date < :date OR 'Camp' < :type OR ('Camp' = :type AND cr.id < :id))''', '''
+    SELECT id, date, 'Donation' as type, hospital as location_name, NULL as time_slot, status
+    FROM {db}donations
+    WHERE donor_id = :donor AND date <= :date AND (date < :date OR 'Donation' < :type OR ('Donation' = :type AND id < :id))''']
+
+def _donor_timeline_sql(databases):
+    arms = [arm.format(db=db) for db in databases for arm in _DONOR_TIMELINE_ARMS]
+    return '\n    UNION ALL'.join(arms) + '''
+    ORDER BY date DESC, type DESC, id DESC
+    LIMIT :limit'''
+
+DONOR_TIMELINE_SQL = _donor_timeline_sql([''])
+# Same arms again over the attached archive (see archive.py); archived ids never collide with hot ones
+DONOR_TIMELINE_ARCHIVE_SQL = _donor_timeline_sql(['', 'archive.'])
+
+def donor_timeline(conn, donor_id, before=None, include_archive=False):
+    """One page of a donor's activity, newest first. `before` is the cursor of the last row already shown."""
+    cursor = None
+    if before:
+        try: day, kind, row_id = before.split('~', 2); cursor = {'date': day, 'type': kind, 'id': int(row_id)}
+        except ValueError: pass
+    params = dict(cursor or {'date': '\uffff', 'type': '\uffff', 'id': 0}, donor=donor_id, limit=DONOR_TIMELINE_PAGE_SIZE + 1) # Sentinel sorts after every row
+    archived = include_archive and attach_archive(conn, archive_paths[conn.shard])
+    rows = conn.execute(DONOR_TIMELINE_ARCHIVE_SQL if archived else DONOR_TIMELINE_SQL, params).fetchall()
+    older = None
+    if len(rows) > DONOR_TIMELINE_PAGE_SIZE:
+        rows = rows[:DONOR_TIMELINE_PAGE_SIZE]; last = rows[-1]
+        older = f"{last['date']}~{last['type']}~{last['id']}"
+    return {'rows': rows, 'older': older, 'first_page': cursor is None, 'archived': archived}
+
+HOSPITAL_LIST_TTL = 300 # Seconds; safety net for hospital edits made by other worker processes
+_hospital_lists = {} # shard -> (loaded_at, rows)
+_hospital_list_lock = threading.Lock()
+
+def get_hospital_list():
+    """Returns (id, name, type) for every hospital in the donor's region, for booking and donation-logging dropdowns."""
+    shard = current_shard()
+    cached = _hospital_lists.get(shard)
+    if cached and time.monotonic() - cached[0] < HOSPITAL_LIST_TTL: return cached[1]
+    conn = get_db_connection(shard)
+    rows = [dict(r) for r in conn.execute("SELECT id, name, type FROM hospitals ORDER BY name")]
+    conn.close()
+    with _hospital_list_lock: _hospital_lists[shard] = (time.monotonic(), rows)
+    return rows
+
+def invalidate_hospital_list():
+    with _hospital_list_lock: _hospital_lists.clear()
+
+# =========================================================================
+# DBMS FEATURE: SPATIAL QUERIES - HOSPITAL SOS (JSON API)
 # =========================================================================
 @app.route('/hospital/sos', methods=['POST'])
 def hospital_sos():
-    if session.get('role') != 'hospital': return redirect(url_for('login'))
-    blood_group = request.form.get('blood_group')
+    if session.get('role') != 'hospital': return jsonify({'error': 'Unauthorized'}), 403
+    blood_group = request.form.get('blood_group') or (request.get_json(silent=True) or {}).get('blood_group')
     conn = get_db_connection()
     
     # Get the Hospital's exact GPS Coordinates
@@ -608,18 +1077,50 @@ def hospital_sos():
         ORDER BY distance_km ASC 
         LIMIT 5
     ''', (hosp['lat'], hosp['lng'], blood_group)).fetchall()
-    
-    # Reload regular dashboard data
-    ts = date.today().strftime('%Y-%m-%d')
-    upcoming = conn.execute("SELECT a.*, d.name as donor_name, d.blood_group, d.phone FROM appointments a JOIN donors d ON a.donor_id = d.id WHERE a.hospital_id = ? AND a.status = 'Scheduled' AND a.date > ? ORDER BY a.date ASC", (session['user_id'], ts)).fetchall()
-    queue_appts = conn.execute("SELECT a.id, a.date, a.time_slot, 'Appointment' as type, d.name as donor_name, d.blood_group, d.phone, a.status FROM appointments a JOIN donors d ON a.donor_id = d.id WHERE a.hospital_id = ? AND a.status = 'Scheduled' AND a.date <= ?", (session['user_id'], ts)).fetchall()
-    queue_manual = conn.execute("SELECT d.id, d.date, 'N/A' as time_slot, 'Manual Request' as type, u.name as donor_name, u.blood_group, u.phone, d.status FROM donations d JOIN donors u ON d.donor_id = u.id WHERE d.hospital = ? AND d.status = 'Pending'", (session['name'],)).fetchall()
-    verification_queue = [dict(r) for r in queue_appts] + [dict(r) for r in queue_manual]
-    verification_queue.sort(key=lambda x: x['date'])
     conn.close()
     
-    flash(f'SOS Alert active. Found {len(nearest_donors)} nearby donors for {blood_group}.', 'danger')
-    return render_template('hospital_dashboard.html', upcoming=upcoming, verification_queue=verification_queue, nearest_donors=nearest_donors, sos_bg=blood_group)
+    return jsonify({'blood_group': blood_group, 'count': len(nearest_donors), 'donors': [dict(d) for d in nearest_donors]})
+
+# =========================================================================
+# NEW FEATURE: MASS SOS ALERT CAMPAIGNS (VECTORIZED SELECTION + THROTTLED FAN-OUT)
+# =========================================================================
+SOS_MAX_RECIPIENTS = 10000
+# Every shard's dispatcher in every worker takes its tokens from one bucket, so LIFEFLOW_SOS_SEND_RATE holds host-wide
+sos_send_limiter = shared_send_limiter(DATABASE)
+sos_dispatchers = {name: NotificationDispatcher(lambda name=name: get_db_connection(name), limiter=sos_send_limiter) for name in shards.names}
+
+@app.route('/hospital/sos/campaign', methods=['POST'])
+def hospital_sos_campaign():
+    if session.get('role') != 'hospital': return jsonify({'error': 'Unauthorized'}), 403
+    data = request.get_json(silent=True) or request.form
+    blood_group = data.get('blood_group')
+    try:
+        radius_km = float(data.get('radius_km', 15))
+        target_count = min(int(data.get('target_count', 50)), SOS_MAX_RECIPIENTS)
+    except (TypeError, ValueError): return jsonify({'error': 'radius_km and target_count must be numbers'}), 400
+    if blood_group not in ('A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-') or not math.isfinite(radius_km) or radius_km <= 0 or target_count <= 0:
+        return jsonify({'error': 'Invalid blood group, radius or recipient count'}), 400
+
+    conn = get_db_connection()
+    hosp = conn.execute("SELECT lat, lng FROM hospitals WHERE id = ?", (session['user_id'],)).fetchone()
+    # Admin-added hospitals keep the raw form values, so the location may be blank or not a number
+    try: lat, lng = float(hosp['lat']), float(hosp['lng'])
+    except (TypeError, ValueError): lat = lng = math.nan
+    if not (math.isfinite(lat) and math.isfinite(lng)): conn.close(); return jsonify({'error': 'Hospital not found or its location is not set'}), 400
+    try: campaign_id, queued = create_campaign(conn, session['user_id'], lat, lng, blood_group, radius_km, target_count)
+    except sqlite3.OperationalError: conn.close(); return jsonify({'error': 'A database transaction error occurred. Please try again.'}), 503
+    conn.close()
+    sos_dispatchers[current_shard()].start()
+    return jsonify({'campaign_id': campaign_id, 'queued': queued, 'blood_group': blood_group, 'radius_km': radius_km}), 201
+
+@app.route('/hospital/sos/campaign/<int:campaign_id>')
+def hospital_sos_campaign_status(campaign_id):
+    if session.get('role') != 'hospital': return jsonify({'error': 'Unauthorized'}), 403
+    conn = get_db_connection()
+    status = campaign_status(conn, campaign_id, session['user_id'])
+    conn.close()
+    if not status: return jsonify({'error': 'Campaign not found'}), 404
+    return jsonify(status)
 
 # =========================================================================
 # NEW ROUTE: UPDATE EXTERNAL HOSPITAL STOCK
@@ -629,20 +1130,37 @@ def hospital_update_stock():
     if session.get('role') != 'hospital': return redirect(url_for('login'))
     
     bg = request.form['blood_group']
-    units = request.form['units']
     password = request.form['password']
+    movement = request.form.get('movement', 'in')
+    try:
+        units = int(request.form['units'])
+        if units <= 0: raise ValueError
+        if request.form.get('collected_on'): date.fromisoformat(request.form['collected_on'])
+    except ValueError:
+        flash('Units must be a positive number and the collection date a valid date.', 'danger'); return redirect(url_for('hospital_dashboard'))
     
     conn = get_db_connection()
     user = conn.execute('SELECT * FROM hospitals WHERE id = ?', (session['user_id'],)).fetchone()
     
     if user and check_password_hash(user['password'], password):
-        exists = conn.execute("SELECT id FROM hospital_stock WHERE hospital_id=? AND blood_group=?", (session['user_id'], bg)).fetchone()
-        if exists:
-            conn.execute("UPDATE hospital_stock SET units = units + ? WHERE id=?", (units, exists['id']))
+        if movement == 'out':
+            # Issued units leave the ledger from the lots closest to expiry; the write lock is taken before the lots are read
+            try:
+                conn.execute("BEGIN IMMEDIATE TRANSACTION")
+                issued = issue_units(conn, session['user_id'], bg, units)
+                conn.commit()
+            except sqlite3.OperationalError:
+                conn.rollback(); conn.close()
+                flash('A database transaction error occurred. Please try again.', 'danger'); return redirect(url_for('hospital_dashboard'))
+            if issued == units: flash(f'Issued {units} units of {bg} from your inventory.', 'success')
+            else: flash(f'Only {issued} unexpired units of {bg} were in stock; {issued} issued.', 'warning')
         else:
-            conn.execute("INSERT INTO hospital_stock (hospital_id, blood_group, units) VALUES (?, ?, ?)", (session['user_id'], bg, units))
-        conn.commit()
-        flash(f'Successfully added {units} units of {bg} to your external inventory!', 'success')
+            # hospital_stock keeps the lifetime total received; current stock comes from the ledger
+            conn.execute('''INSERT INTO hospital_stock (hospital_id, blood_group, units) VALUES (?, ?, ?)
+                            ON CONFLICT(hospital_id, blood_group) DO UPDATE SET units = units + excluded.units''', (session['user_id'], bg, units))
+            expires = receive_units(conn, session['user_id'], bg, units, request.form.get('collected_on'))
+            conn.commit()
+            flash(f'Successfully added {units} units of {bg} to your external inventory (expires {expires.strftime("%d %b %Y")})!', 'success')
     else:
         flash('Invalid password! Stock update failed.', 'danger')
         
@@ -652,15 +1170,8 @@ def hospital_update_stock():
 @app.route('/hospital/dashboard')
 def hospital_dashboard(): 
     if session.get('role') != 'hospital': return redirect(url_for('login'))
-    conn = get_db_connection(); today_str = date.today().strftime('%Y-%m-%d')
-    upcoming = conn.execute("SELECT a.*, d.name as donor_name, d.blood_group, d.phone FROM appointments a JOIN donors d ON a.donor_id = d.id WHERE a.hospital_id = ? AND a.status = 'Scheduled' AND a.date > ? ORDER BY a.date ASC", (session['user_id'], today_str)).fetchall()
-    queue_appts = conn.execute("SELECT a.id, a.date, a.time_slot, 'Appointment' as type, d.name as donor_name, d.blood_group, d.phone, a.status FROM appointments a JOIN donors d ON a.donor_id = d.id WHERE a.hospital_id = ? AND a.status = 'Scheduled' AND a.date <= ?", (session['user_id'], today_str)).fetchall()
-    
-    queue_manual = conn.execute("SELECT d.id, d.date, 'N/A' as time_slot, 'Manual Request' as type, u.name as donor_name, u.blood_group, u.phone, d.status FROM donations d JOIN donors u ON d.donor_id = u.id WHERE d.hospital = ? AND d.status = 'Pending'", (session['name'],)).fetchall()
-    
-    verification_queue = [dict(r) for r in queue_appts] + [dict(r) for r in queue_manual]
-    verification_queue.sort(key=lambda x: x['date'])
-    conn.close(); return render_template('hospital_dashboard.html', upcoming=upcoming, verification_queue=verification_queue)
+    data = get_hospital_dashboard_data(session['user_id'], session['name'])
+    return render_template('hospital_dashboard.html', upcoming=data['upcoming'], verification_queue=data['verification_queue'], analytics_as_of=current_analytics().taken_at())
 
 @app.route('/hospital/export_donations')
 def hospital_export_donations():
@@ -671,13 +1182,14 @@ def hospital_export_donations():
     end_date = request.args.get('end_date')
     blood_group = request.args.get('blood_group')
 
-    conn = get_db_connection()
-    query = "SELECT d.date, u.name, u.blood_group, u.phone, d.volume_ml FROM donations d JOIN donors u ON d.donor_id=u.id WHERE d.hospital=? AND d.status='Approved'"
+    conn = get_analytics_connection()
+    source = report_source(conn, 'report_donation_log', current_archive()) if request.args.get('include_archive') else 'report_donation_log'
+    query = f"SELECT date, name, blood_group, phone, volume_ml FROM {source} WHERE hospital=? AND status='Approved'"
     params = [session['name']]
 
-    if start_date: query += " AND d.date >= ?"; params.append(start_date)
-    if end_date: query += " AND d.date <= ?"; params.append(end_date)
-    if blood_group and blood_group != 'all': query += " AND u.blood_group = ?"; params.append(blood_group)
+    if start_date: query += " AND date >= ?"; params.append(start_date)
+    if end_date: query += " AND date <= ?"; params.append(end_date)
+    if blood_group and blood_group != 'all': query += " AND blood_group = ?"; params.append(blood_group)
 
     donations = conn.execute(query, params).fetchall()
     conn.close()
@@ -686,7 +1198,8 @@ def hospital_export_donations():
     
     if file_format == 'pdf':
         pdf = FPDF('P', 'mm', 'A4'); pdf.add_page()
-        pdf.set_font("Arial", 'B', 14); pdf.cell(0, 10, "Donation History", 0, 1, 'C'); pdf.ln(10)
+        pdf.set_font("Arial", 'B', 14); pdf.cell(0, 10, "Donation History", 0, 1, 'C')
+        pdf.set_font("Arial", '', 9); pdf.cell(0, 6, f"Data as of {current_analytics().taken_at()}", 0, 1, 'C'); pdf.ln(4)
         pdf.set_font("Arial", 'B', 10); widths = [30, 60, 20, 40, 20]
         for i, h in enumerate(headers): pdf.cell(widths[i], 10, h, 1)
         pdf.ln(); pdf.set_font("Arial", '', 10)
@@ -694,12 +1207,12 @@ def hospital_export_donations():
             pdf.cell(widths[0], 10, str(row['date']), 1); pdf.cell(widths[1], 10, str(row['name']), 1)
             pdf.cell(widths[2], 10, str(row['blood_group']), 1); pdf.cell(widths[3], 10, str(row['phone']), 1)
             pdf.cell(widths[4], 10, str(row['volume_ml']), 1); pdf.ln()
-        response = make_response(pdf.output(dest='S').encode('latin-1')); response.headers['Content-Type'] = 'application/pdf'; response.headers['Content-Disposition'] = 'attachment; filename=Donations.pdf'; return response
+        response = make_response(pdf.output(dest='S').encode('latin-1')); response.headers['Content-Type'] = 'application/pdf'; response.headers['Content-Disposition'] = 'attachment; filename=Donations.pdf'; return stamp_snapshot(response)
     else:
         si = StringIO(); cw = csv.writer(si)
         cw.writerow(headers)
         for d in donations: cw.writerow([d['date'], d['name'], d['blood_group'], d['phone'], d['volume_ml']])
-        out = make_response(si.getvalue()); out.headers['Content-Disposition'] = 'attachment; filename=Donations.csv'; out.headers['Content-Type'] = 'text/csv'; return out
+        out = make_response(si.getvalue()); out.headers['Content-Disposition'] = 'attachment; filename=Donations.csv'; out.headers['Content-Type'] = 'text/csv'; return stamp_snapshot(out)
 
 @app.route('/hospital/export_appointments')
 def hospital_export_appointments():
@@ -710,13 +1223,14 @@ def hospital_export_appointments():
     end_date = request.args.get('end_date')
     status = request.args.get('status')
 
-    conn = get_db_connection()
-    query = "SELECT a.date, a.time_slot, d.name, d.blood_group, d.phone, a.status FROM appointments a JOIN donors d ON a.donor_id = d.id WHERE a.hospital_id = ?"
+    conn = get_analytics_connection()
+    source = report_source(conn, 'report_appointment_log', current_archive()) if request.args.get('include_archive') else 'report_appointment_log'
+    query = f"SELECT date, time_slot, name, blood_group, phone, status FROM {source} WHERE hospital_id = ?"
     params = [session['user_id']]
 
-    if start_date: query += " AND a.date >= ?"; params.append(start_date)
-    if end_date: query += " AND a.date <= ?"; params.append(end_date)
-    if status and status != 'all': query += " AND a.status = ?"; params.append(status)
+    if start_date: query += " AND date >= ?"; params.append(start_date)
+    if end_date: query += " AND date <= ?"; params.append(end_date)
+    if status and status != 'all': query += " AND status = ?"; params.append(status)
 
     appointments = conn.execute(query, params).fetchall()
     conn.close()
@@ -725,7 +1239,8 @@ def hospital_export_appointments():
     
     if file_format == 'pdf':
         pdf = FPDF('L', 'mm', 'A4'); pdf.add_page()
-        pdf.set_font("Arial", 'B', 14); pdf.cell(0, 10, "Appointments Log", 0, 1, 'C'); pdf.ln(10)
+        pdf.set_font("Arial", 'B', 14); pdf.cell(0, 10, "Appointments Log", 0, 1, 'C')
+        pdf.set_font("Arial", '', 9); pdf.cell(0, 6, f"Data as of {current_analytics().taken_at()}", 0, 1, 'C'); pdf.ln(4)
         pdf.set_font("Arial", 'B', 10); widths = [30, 40, 60, 20, 40, 30]
         for i, h in enumerate(headers): pdf.cell(widths[i], 10, h, 1)
         pdf.ln(); pdf.set_font("Arial", '', 10)
@@ -733,11 +1248,11 @@ def hospital_export_appointments():
             pdf.cell(widths[0], 10, str(row['date']), 1); pdf.cell(widths[1], 10, str(row['time_slot']), 1)
             pdf.cell(widths[2], 10, str(row['name']), 1); pdf.cell(widths[3], 10, str(row['blood_group']), 1)
             pdf.cell(widths[4], 10, str(row['phone']), 1); pdf.cell(widths[5], 10, str(row['status']), 1); pdf.ln()
-        response = make_response(pdf.output(dest='S').encode('latin-1')); response.headers['Content-Type'] = 'application/pdf'; response.headers['Content-Disposition'] = 'attachment; filename=Appointments.pdf'; return response
+        response = make_response(pdf.output(dest='S').encode('latin-1')); response.headers['Content-Type'] = 'application/pdf'; response.headers['Content-Disposition'] = 'attachment; filename=Appointments.pdf'; return stamp_snapshot(response)
     else:
         si = StringIO(); cw = csv.writer(si); cw.writerow(headers)
         for a in appointments: cw.writerow([a['date'], a['time_slot'], a['name'], a['blood_group'], a['phone'], a['status']])
-        out = make_response(si.getvalue()); out.headers['Content-Disposition'] = 'attachment; filename=Appointments.csv'; out.headers['Content-Type'] = 'text/csv'; return out
+        out = make_response(si.getvalue()); out.headers['Content-Disposition'] = 'attachment; filename=Appointments.csv'; out.headers['Content-Type'] = 'text/csv'; return stamp_snapshot(out)
 
 @app.route('/hospital/verify/<int:id>/<action>/<type>')
 def verify_donation(id, action, type):
@@ -754,17 +1269,163 @@ def verify_donation(id, action, type):
     elif type == 'Manual Request':
         db_status = 'Approved' if action == 'approve' else 'Rejected'
         conn.execute('UPDATE donations SET status = ? WHERE id = ?', (db_status, id))
-    conn.commit(); conn.close(); return redirect(url_for('hospital_dashboard'))
+    conn.commit(); conn.close(); invalidate_hospital_dashboard(session['user_id']); return redirect(url_for('hospital_dashboard'))
 
-@app.route('/certificate/<int:appt_id>')
-def download_certificate(appt_id):
+# =========================================================================
+# PERFORMANCE FEATURE: BULK VERIFICATION (ONE TRANSACTION PER BATCH)
+# =========================================================================
+VERIFY_ACTIONS = {'approve', 'reject'}
+VERIFY_TYPES = {'Appointment', 'Manual Request'}
+
+def verify_batch(conn, hospital_id, hospital_name, items):
+    """Applies a list of {id, type, action} decisions for one hospital in a single transaction.
+    Status updates use executemany and verified appointments are copied into donations with one
+    set-based INSERT...SELECT. Returns one result dict per input item, in input order."""
+    results = []; valid = []
+    for item in items:
+        if not isinstance(item, dict): item = {}  # e.g. a bare number or string; reported as invalid
+        try: item_id = int(item.get('id'))
+        except (TypeError, ValueError): item_id = None
+        item_type = item.get('type'); action = item.get('action')
+        result = {'id': item_id, 'type': item_type, 'action': action}
+        if item_id is None or not isinstance(item_type, str) or item_type not in VERIFY_TYPES or not isinstance(action, str) or action not in VERIFY_ACTIONS:
+            result['result'] = 'invalid'
+        else:
+            valid.append((item_id, item_type, action))
+        results.append(result)
+
+    conn.execute("BEGIN IMMEDIATE TRANSACTION")
+    try:
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS verify_batch_items (id INTEGER, type TEXT, action TEXT)")
+        conn.execute("DELETE FROM verify_batch_items")
+        conn.executemany("INSERT INTO verify_batch_items (id, type, action) VALUES (?, ?, ?)", valid)
+
+        # Only items that belong to this hospital and are still awaiting a decision are applied
+        owned_appts = {r[0] for r in conn.execute('''SELECT a.id FROM verify_batch_items b JOIN appointments a ON a.id = b.id
+                                                   WHERE b.type = 'Appointment' AND a.hospital_id = ? AND a.status = 'Scheduled'
+                                               ''', (hospital_id,))}
+        owned_manual = {r[0] for r in conn.execute('''SELECT d.id FROM verify_batch_items b JOIN donations d ON d.id = b.id
+                                                    WHERE b.type = 'Manual Request' AND d.hospital = ? AND d.status = 'Pending'
+                                                ''', (hospital_name,))}
+
+        appt_updates = {}; manual_updates = {}
+        for item_id, item_type, action in valid:
+            if item_type == 'Appointment' and item_id in owned_appts:
+                appt_updates[item_id] = 'Verified' if action == 'approve' else 'Rejected'
+            elif item_type == 'Manual Request' and item_id in owned_manual:
+                manual_updates[item_id] = 'Approved' if action == 'approve' else 'Rejected'
+
+        conn.executemany("UPDATE appointments SET status = ? WHERE id = ?", [(st, i) for i, st in appt_updates.items()])
+        conn.executemany("UPDATE donations SET status = ? WHERE id = ?", [(st, i) for i, st in manual_updates.items()])
+        conn.execute('''
+            INSERT INTO donations (donor_id, date, volume_ml, hospital, status)
+            SELECT DISTINCT a.donor_id, a.date, 450, h.name, 'Approved'
+            FROM appointments a JOIN hospitals h ON a.hospital_id = h.id
+            WHERE a.id IN (SELECT id FROM verify_batch_items WHERE type = 'Appointment' AND action = 'approve')
+              AND a.hospital_id = ? AND a.status = 'Verified'
+              AND NOT EXISTS (SELECT 1 FROM donations d WHERE d.donor_id = a.donor_id AND d.date = a.date)
+        ''', (hospital_id,))
+        conn.execute("DELETE FROM verify_batch_items")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    for result in results:
+        if 'result' in result: continue
+        updates = appt_updates if result['type'] == 'Appointment' else manual_updates
+        result['result'] = updates.get(result['id'], 'not_found')
+    return results
+
+@app.route('/hospital/verify_batch', methods=['POST'])
+def verify_donation_batch():
+    if session.get('role') != 'hospital': return jsonify({'error': 'Unauthorized'}), 403
+    payload = request.get_json(silent=True) or {}
+    items = payload.get('items')
+    if not isinstance(items, list) or not items: return jsonify({'error': 'Expected a non-empty "items" list'}), 400
+
+    conn = get_db_connection()
+    try: results = verify_batch(conn, session['user_id'], session['name'], items)
+    except sqlite3.Error: conn.close(); return jsonify({'error': 'A database transaction error occurred. Please try again.'}), 500
+    conn.close()
+    invalidate_hospital_dashboard(session['user_id'])
+
+    applied = sum(1 for r in results if r['result'] in ('Verified', 'Approved', 'Rejected'))
+    return jsonify({'applied': applied, 'total': len(results), 'results': results})
+
+# Certificate sources by kind; appointment and donation ids overlap, so the URL names the table
+CERTIFICATE_QUERIES = {
+    'appointment': """SELECT a.date, d.name, h.name as hospital_name, d.blood_group FROM {db}appointments a JOIN donors d ON a.donor_id = d.id
+                      JOIN hospitals h ON a.hospital_id = h.id WHERE a.id = ? AND a.donor_id = ? AND a.status = 'Verified'""",
+    'donation': """SELECT d.date, u.name, d.hospital as hospital_name, u.blood_group FROM {db}donations d JOIN donors u ON d.donor_id = u.id
+                   WHERE d.id = ? AND d.donor_id = ? AND d.status = 'Approved'""",
+}
+
+@app.route('/certificate/<kind>/<int:id>')
+def download_certificate(kind, id):
     if 'user_id' not in session: return redirect(url_for('login'))
+    if kind not in CERTIFICATE_QUERIES: abort(404)
     conn = get_db_connection()
-    data = conn.execute('SELECT a.date, d.name, h.name as hospital_name, d.blood_group FROM appointments a JOIN donors d ON a.donor_id = d.id JOIN hospitals h ON a.hospital_id = h.id WHERE a.id = ?', (appt_id,)).fetchone()
-    if not data: data = conn.execute('SELECT d.date, u.name, d.hospital as hospital_name, u.blood_group FROM donations d JOIN donors u ON d.donor_id = u.id WHERE d.id = ?', (appt_id,)).fetchone()
+    data = conn.execute(CERTIFICATE_QUERIES[kind].format(db=''), (id, session['user_id'])).fetchone()
+    if not data and attach_archive(conn, current_archive()): # Certificates for history that has been archived
+        data = conn.execute(CERTIFICATE_QUERIES[kind].format(db='archive.'), (id, session['user_id'])).fetchone()
     conn.close()
     if not data: return "Certificate not available", 403
-    pdf = FPDF('L', 'mm', 'A4'); pdf.add_page(); pdf.set_fill_color(178, 34, 34); pdf.rect(0, 0, 297, 15, 'F'); pdf.rect(0, 195, 297, 15, 'F'); pdf.set_y(40); pdf.set_font("Arial", 'B', 32); pdf.set_text_color(139, 0, 0); pdf.cell(0, 15, "BLOOD DONATION CERTIFICATE", 0, 1, 'C'); pdf.set_font("Arial", '', 12); pdf.set_text_color(80, 80, 80); pdf.ln(15); pdf.cell(0, 10, "This certificate is awarded to", 0, 1, 'C'); pdf.set_font("Arial", 'B', 40); pdf.set_text_color(0, 0, 0); pdf.ln(5); pdf.cell(0, 20, data['name'], 0, 1, 'C'); pdf.set_font("Arial", '', 14); pdf.ln(15); pdf.multi_cell(0, 10, f"For the voluntary blood donation (Group: {data['blood_group']}).\nYour contribution brings hope and saves lives.", 0, 'C'); pdf.set_y(150); pdf.set_font("Arial", 'B', 12); pdf.cell(0, 10, f"Date: {data['date']}", 0, 1, 'C'); pdf.ln(8); pdf.cell(0, 10, f"Location: {data['hospital_name']}", 0, 1, 'C'); response = make_response(pdf.output(dest='S').encode('latin-1')); response.headers['Content-Type'] = 'application/pdf'; response.headers['Content-Disposition'] = 'attachment; filename=Certificate.pdf'; return response
+    response = make_response(render_certificate(data)); response.headers['Content-Type'] = 'application/pdf'; response.headers['Content-Disposition'] = 'attachment; filename=Certificate.pdf'; return response
+
+# =========================================================================
+# PERFORMANCE FEATURE: BATCH CERTIFICATES (PROCESS POOL, PAGE TEMPLATE, STREAMED ZIP)
+# =========================================================================
+# A camp host or hospital gets every certificate in one download (see certificates.py)
+# 0 (default) renders in the request thread; N > 0 starts an N-process pool for each batch of POOL_THRESHOLD or more
+CERTIFICATE_WORKERS = int(os.environ.get('LIFEFLOW_CERTIFICATE_WORKERS', '0'))
+
+def certificate_batch_response(rows, filename):
+    """One multi-page PDF (?format=pdf) or a streamed ZIP of one PDF per donor; throughput goes to /admin/metrics."""
+    if not rows: return "No certificates to generate", 404
+    if len(rows) > MAX_CERTIFICATE_BATCH: return f"More than {MAX_CERTIFICATE_BATCH} certificates; please narrow the date range.", 400
+    if request.args.get('format') == 'pdf':
+        data, seconds = render_batch_pdf(rows, CERTIFICATE_WORKERS)
+        db_metrics.registry.record_batch('certificates', seconds, len(rows))
+        response = make_response(data); response.headers['Content-Type'] = 'application/pdf'; response.headers['Content-Disposition'] = f'attachment; filename={filename}.pdf'
+        response.headers['X-Certificates'] = str(len(rows)); response.headers['X-Certificates-Per-Second'] = f"{len(rows) / seconds:.0f}"
+        return response
+    done = lambda count, seconds: db_metrics.registry.record_batch('certificates', seconds, count)
+    response = Response(stream_batch_zip(rows, CERTIFICATE_WORKERS, done), mimetype='application/zip')
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}.zip'; response.headers['X-Certificates'] = str(len(rows))
+    return response
+
+@app.route('/host/certificates/<int:camp_id>')
+def camp_certificates(camp_id):
+    if session.get('role') != 'host': return redirect(url_for('login'))
+    conn = get_db_connection()
+    camp = conn.execute("SELECT * FROM camps WHERE id = ? AND host_id = ?", (camp_id, session['user_id'])).fetchone()
+    if not camp: conn.close(); return "Unauthorized", 403
+    if camp['date'] > date.today().strftime('%Y-%m-%d'): conn.close(); return "Certificates are available from the day of the camp", 400
+    rows = conn.execute('''SELECT cr.id, d.name, d.blood_group, c.date, c.name || ', ' || IFNULL(c.location_name, c.city) as hospital_name
+                           FROM camp_registrations cr JOIN donors d ON cr.donor_id = d.id JOIN camps c ON cr.camp_id = c.id
+                           WHERE cr.camp_id = ? ORDER BY d.name LIMIT ?''', (camp_id, MAX_CERTIFICATE_BATCH + 1)).fetchall()
+    conn.close()
+    return certificate_batch_response(rows, f"Certificates_{secure_filename(camp['name']) or camp_id}")
+
+@app.route('/hospital/certificates')
+def hospital_certificates():
+    if session.get('role') != 'hospital': return redirect(url_for('login'))
+    query = """SELECT dn.id, u.name, u.blood_group, dn.date, dn.hospital as hospital_name
+               FROM donations dn JOIN donors u ON dn.donor_id = u.id WHERE dn.hospital = ? AND dn.status = 'Approved'"""
+    params = [session['name']]
+    start_date = request.args.get('start_date'); end_date = request.args.get('end_date')
+    # The dates also name the download, so only YYYY-MM-DD is accepted
+    try:
+        for value in (start_date, end_date):
+            if value: datetime.strptime(value, '%Y-%m-%d')
+    except ValueError: return "start_date and end_date must be dates (YYYY-MM-DD)", 400
+    if start_date: query += " AND dn.date >= ?"; params.append(start_date)
+    if end_date: query += " AND dn.date <= ?"; params.append(end_date)
+    conn = get_db_connection()
+    rows = conn.execute(query + " ORDER BY dn.date, u.name LIMIT ?", params + [MAX_CERTIFICATE_BATCH + 1]).fetchall()
+    conn.close()
+    return certificate_batch_response(rows, f"Certificates_{start_date or 'all'}_{end_date or date.today()}")
 
 # =========================================================================
 # NEW ROUTE: ADMIN ADD MANUAL UNITS TO USER
@@ -776,7 +1437,7 @@ def admin_add_donation_units():
     volume_ml = request.form['volume_ml']
     hospital_name = request.form['hospital_name']
     
-    conn = get_db_connection()
+    conn = get_db_connection(shards.shard_for_id(user_id))
     conn.execute("INSERT INTO donations (donor_id, volume_ml, date, hospital, status) VALUES (?, ?, ?, ?, 'Approved')", 
                  (user_id, volume_ml, date.today().strftime('%Y-%m-%d'), hospital_name))
     conn.commit()
@@ -784,19 +1445,42 @@ def admin_add_donation_units():
     flash(f'Successfully added {volume_ml}ml for the donor.', 'success')
     return redirect(url_for('admin_dashboard'))
 
+# =========================================================================
+# NEW ROUTE: ADMIN BULK CSV IMPORT (DONORS / HOSPITAL STOCK / PAST DONATIONS)
+# =========================================================================
+@app.route('/admin/bulk_import', methods=['POST'])
+def admin_bulk_import():
+    if session.get('role') != 'admin': return redirect(url_for('admin_login'))
+    kind = request.form.get('kind')
+    file = request.files.get('csv_file')
+    if kind not in IMPORT_COLUMNS or not file or file.filename == '':
+        flash('Select an import type and a CSV file.', 'danger'); return redirect(url_for('admin_dashboard'))
+
+    conn = get_db_connection(); home = get_db_connection(shards.home)
+    # Donors go into the shard being browsed: rows for another shard's cities, or with a phone/email taken in any shard, are skipped
+    accounts = AccountClaims(home, conn.shard, shards.shard_for_city) if kind == 'donors' else None
+    stream = io.TextIOWrapper(file.stream, encoding='utf-8-sig', newline='')
+    report = import_csv(conn, kind, stream, workers=0, accounts=accounts) # Hash inline: no process pool inside a web request
+    conn.close(); home.close()
+    if kind == 'donations': invalidate_hospital_dashboard()
+    if kind == 'donors': donor_index.invalidate()
+
+    flash(f'Bulk import finished. {report.summary()}', 'success' if not report.error_count else 'warning')
+    for line, message in report.errors[:5]: flash(f'Line {line}: {message}', 'danger')
+    return redirect(url_for('admin_dashboard'))
+
 @app.route('/admin')
 def admin_dashboard():
     if session.get('role') != 'admin': return redirect(url_for('admin_login'))
     conn = get_db_connection()
-    donors = conn.execute("SELECT * FROM donors WHERE role != 'admin'").fetchall()
-    hospitals = conn.execute("SELECT * FROM hospitals").fetchall()
-    hosts = conn.execute("SELECT * FROM camp_hosts ORDER BY organization_name ASC").fetchall()
-    today_str = date.today().strftime('%Y-%m-%d')
-    ended_camps = conn.execute("SELECT * FROM camps WHERE date < ? ORDER BY date DESC", (today_str,)).fetchall()
-    admin_info = conn.execute("SELECT * FROM donors WHERE id = ?", (session['user_id'],)).fetchone()
-    hospital_stats = conn.execute('''SELECT h.name as hospital, COUNT(a.id) as total_units FROM hospitals h LEFT JOIN appointments a ON h.id = a.hospital_id AND a.status='Verified' GROUP BY h.id''').fetchall()
-    pending_appts = conn.execute('''SELECT a.date, d.name as donor, d.phone, h.name as hospital_name FROM appointments a JOIN donors d ON a.donor_id = d.id JOIN hospitals h ON a.hospital_id = h.id WHERE a.status = 'Scheduled' ORDER BY h.name ASC, a.date ASC''').fetchall()
-    verified_appts = conn.execute('''SELECT a.date, d.name as donor, d.phone, h.name as hospital_name FROM appointments a JOIN donors d ON a.donor_id = d.id JOIN hospitals h ON a.hospital_id = h.id WHERE a.status = 'Verified' ORDER BY h.name ASC, a.date DESC''').fetchall()
+    # Growing tables are paged so render time and response size stay bounded (see templates/macros.html)
+    donors = paginate(conn, "SELECT * FROM donors WHERE role != 'admin' ORDER BY id", (), 'donors_page')
+    hospitals = paginate(conn, "SELECT * FROM hospitals ORDER BY id", (), 'hospitals_page')
+    hosts = paginate(conn, "SELECT * FROM camp_hosts ORDER BY organization_name ASC", (), 'hosts_page')
+    hospital_names = conn.execute("SELECT name FROM hospitals ORDER BY name").fetchall()
+    home = get_db_connection(shards.home); admin_info = home.execute("SELECT * FROM donors WHERE id = ?", (session['user_id'],)).fetchone(); home.close()
+    pending_appts = paginate(conn, '''SELECT a.date, d.name as donor, d.phone, h.name as hospital_name FROM appointments a JOIN donors d ON a.donor_id = d.id JOIN hospitals h ON a.hospital_id = h.id WHERE a.status = 'Scheduled' ORDER BY h.name ASC, a.date ASC''', (), 'pending_page')
+    verified_appts = paginate(conn, '''SELECT a.date, d.name as donor, d.phone, h.name as hospital_name FROM appointments a JOIN donors d ON a.donor_id = d.id JOIN hospitals h ON a.hospital_id = h.id WHERE a.status = 'Verified' ORDER BY h.name ASC, a.date DESC''', (), 'verified_page')
     
     gallery_photos = conn.execute('''
         SELECT cp.id, cp.filename, c.name as camp_name, c.date 
@@ -805,36 +1489,50 @@ def admin_dashboard():
         ORDER BY c.date DESC
     ''').fetchall()
 
-    all_camps = conn.execute("SELECT c.*, h.organization_name, h.leader_name, h.phone FROM camps c JOIN camp_hosts h ON c.host_id = h.id ORDER BY c.date DESC").fetchall()
-    search = request.args.get('search', ''); city = request.args.get('city', ''); blood_group = request.args.get('blood_group', ''); hospital_search = request.args.get('hospital_name', '')
-    hospital_donors = []
-    if hospital_search:
-        hospital_donors = conn.execute('''SELECT d.name, d.phone, d.email, d.city, a.date FROM appointments a JOIN donors d ON a.donor_id = d.id JOIN hospitals h ON a.hospital_id = h.id WHERE h.name LIKE ? AND a.status='Verified' ''', (f'%{hospital_search}%',)).fetchall()
-    
-    audit_logs = conn.execute("SELECT * FROM security_audit_log ORDER BY action_timestamp DESC LIMIT 20").fetchall()
-    
-    ai_predictions = conn.execute('''
-        SELECT h.name as hospital,
-               IFNULL(SUM(d.volume_ml), 0) as current_stock,
-               ROUND(AVG(IFNULL(SUM(d.volume_ml), 0)) OVER (), 1) as global_avg,
-               CASE 
-                   WHEN IFNULL(SUM(d.volume_ml), 0) < (AVG(IFNULL(SUM(d.volume_ml), 0)) OVER () * 0.7) THEN '🚨 CRITICAL SHORTAGE'
-                   WHEN IFNULL(SUM(d.volume_ml), 0) > (AVG(IFNULL(SUM(d.volume_ml), 0)) OVER () * 1.5) THEN '🌟 SURPLUS'
-                   ELSE '✅ STABLE' 
-               END as ai_status
-        FROM hospitals h
-        LEFT JOIN donations d ON h.name = d.hospital AND d.status = 'Approved'
-        GROUP BY h.name
-        ORDER BY current_stock ASC
-    ''').fetchall()
-    
+    # The audit trail stays live; log_id follows insertion order, so this reads the last 20 rowids
+    audit_logs = conn.execute("SELECT * FROM security_audit_log ORDER BY log_id DESC LIMIT 20").fetchall()
     conn.close()
-    return render_template('admin_dashboard.html', donors=donors, hospitals=hospitals, hosts=hosts, hospital_stats=hospital_stats, pending_appts=pending_appts, verified_appts=verified_appts, all_camps=all_camps, ended_camps=ended_camps, admin_info=admin_info, gallery_photos=gallery_photos, audit_logs=audit_logs, ai_predictions=ai_predictions)
+
+    # Reporting panels come from the analytics snapshot (precomputed in analytics_snapshot.REPORT_VIEWS)
+    try: conn = get_analytics_connection()
+    except SnapshotNotReady: ai_predictions = [] # The panel says the snapshot is not yet available (analytics_as_of)
+    else: ai_predictions = conn.execute("SELECT * FROM report_stock_prediction ORDER BY current_stock ASC").fetchall(); conn.close()
+
+    # Statewide totals: one COUNT pass per shard, in parallel
+    def shard_totals(name):
+        c = get_db_connection(name)
+        try: return {'name': name, 'donors': c.execute("SELECT COUNT(*) FROM donors WHERE role != 'admin'").fetchone()[0], 'hospitals': c.execute("SELECT COUNT(*) FROM hospitals").fetchone()[0]}
+        finally: c.close()
+    shard_summary = shards.scatter(shard_totals) if len(shards.names) > 1 else []
+    return render_template('admin_dashboard.html', shard_summary=shard_summary, active_shard=current_shard(), donors=donors, hospitals=hospitals, hospital_names=hospital_names, hosts=hosts, pending_appts=pending_appts, verified_appts=verified_appts, admin_info=admin_info, gallery_photos=gallery_photos, audit_logs=audit_logs, ai_predictions=ai_predictions, analytics_as_of=current_analytics().taken_at(), archive_horizon=ARCHIVE_HORIZON_DAYS, archive_min_horizon=MIN_HORIZON_DAYS)
+
+@app.route('/admin/analytics/refresh', methods=['POST'])
+def refresh_analytics():
+    if session.get('role') != 'admin': return redirect(url_for('admin_login'))
+    current_analytics().refresh()
+    flash(f'Analytics snapshot refreshed ({current_analytics().taken_at()}).', 'success')
+    return redirect(url_for('admin_dashboard') + '#reports')
+
+@app.route('/admin/archive/run', methods=['POST'])
+def run_archive():
+    if session.get('role') != 'admin': return redirect(url_for('admin_login'))
+    horizon = request.form.get('horizon_days', type=int) or ARCHIVE_HORIZON_DAYS
+    if horizon < MIN_HORIZON_DAYS:
+        flash(f'The archive horizon must be at least {MIN_HORIZON_DAYS} days.', 'danger'); return redirect(url_for('admin_dashboard') + '#reports')
+    conn = get_db_connection()
+    try: moved = archive_history(conn, current_archive(), horizon)
+    except sqlite3.Error as e: flash(f'Archiving failed: {e}', 'danger'); return redirect(url_for('admin_dashboard') + '#reports')
+    finally: conn.close()
+    flash('Archived ' + ', '.join(f"{n} {table.replace('_', ' ')}" for table, n in moved.items()) + f' older than {horizon} days.', 'success')
+    return redirect(url_for('admin_dashboard') + '#reports')
 
 @app.route('/admin/update_profile', methods=['POST'])
 def update_admin_profile():
     if session.get('role') != 'admin': return redirect(url_for('admin_login'))
     conn = get_db_connection()
+    old = conn.execute('SELECT phone, email FROM donors WHERE id = ?', (session['user_id'],)).fetchone()
+    if old and not rekey_account_for('donor', conn.shard, old, {'phone': request.form['phone'], 'email': request.form['email']}):
+        conn.close(); flash('Phone number or Email already registered.', 'danger'); return redirect(url_for('admin_dashboard'))
     try:
         if request.form.get('password'): conn.execute('UPDATE donors SET name=?, email=?, phone=?, password=? WHERE id=?', (request.form['name'], request.form['email'], request.form['phone'], generate_password_hash(request.form['password']), session['user_id']))
         else: conn.execute('UPDATE donors SET name=?, email=?, phone=? WHERE id=?', (request.form['name'], request.form['email'], request.form['phone'], session['user_id']))
@@ -846,9 +1544,12 @@ def update_admin_profile():
 def add_user():
     if session.get('role') != 'admin': return redirect(url_for('admin_login'))
     if request.method == 'POST':
-        conn = get_db_connection()
-        try: conn.execute("INSERT INTO donors (name, email, phone, password, blood_group, city, age, weight, address, role) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 'user')", (request.form['name'], request.form['email'], request.form['phone'], generate_password_hash(request.form['password']), request.form['blood_group'], request.form['city'], request.form['age'], request.form['weight'], request.form['address'])); conn.commit(); flash('User Added!', 'success')
-        except: flash('Error adding user', 'danger')
+        shard = shards.shard_for_city(request.form['city'])
+        keys = claim_account('donor', shard, phone=request.form['phone'], email=request.form['email'])
+        if keys is None: flash('Phone number or Email already registered.', 'danger'); return redirect(url_for('admin_dashboard'))
+        conn = get_db_connection(shard)
+        try: conn.execute("INSERT INTO donors (name, email, phone, password, blood_group, city, age, weight, address, role) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 'user')", (request.form['name'], request.form['email'], request.form['phone'], generate_password_hash(request.form['password']), request.form['blood_group'], request.form['city'], request.form['age'], request.form['weight'], request.form['address'])); conn.commit(); donor_index.invalidate(request.form['blood_group']); flash('User Added!', 'success')
+        except: release_account(keys); flash('Error adding user', 'danger')
         conn.close(); return redirect(url_for('admin_dashboard'))
     return render_template('add_user.html')
 
@@ -856,9 +1557,12 @@ def add_user():
 def add_host():
     if session.get('role') != 'admin': return redirect(url_for('admin_login'))
     if request.method == 'POST':
-        conn = get_db_connection()
+        shard = shards.shard_for_city(request.form['city'])
+        keys = claim_account('host', shard, email=request.form['email'])
+        if keys is None: flash('Email already registered.', 'danger'); return redirect(url_for('admin_dashboard'))
+        conn = get_db_connection(shard)
         try: conn.execute("INSERT INTO camp_hosts (organization_name, leader_name, email, phone, aadhar_number, password, city, address) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (request.form['organization_name'], request.form['leader_name'], request.form['email'], request.form['phone'], request.form['aadhar_number'], generate_password_hash(request.form['password']), request.form['city'], request.form['address'])); conn.commit(); flash('Host Added!', 'success')
-        except: flash('Error', 'danger')
+        except: release_account(keys); flash('Error', 'danger')
         conn.close(); return redirect(url_for('admin_dashboard'))
     return render_template('add_host.html')
 
@@ -866,8 +1570,9 @@ def add_host():
 def add_hospital():
     if session.get('role') != 'admin': return redirect(url_for('admin_login'))
     if request.method == 'POST':
-        conn = get_db_connection()
-        try: conn.execute("INSERT INTO hospitals (name, email, password, type, lat, lng) VALUES (?, ?, ?, ?, ?, ?)", (request.form['name'], request.form['email'], generate_password_hash(request.form['password']), request.form['type'], request.form['lat'], request.form['lng'])); conn.commit(); flash('Hospital Added!', 'success')
+        city = request.form.get('city') or 'Chennai'
+        conn = get_db_connection(shards.shard_for_city(city))
+        try: conn.execute("INSERT INTO hospitals (name, email, password, type, lat, lng, city) VALUES (?, ?, ?, ?, ?, ?, ?)", (request.form['name'], request.form['email'], generate_password_hash(request.form['password']), request.form['type'], request.form['lat'], request.form['lng'], city)); conn.commit(); invalidate_hospital_list(); flash('Hospital Added!', 'success')
         except: flash('Error', 'danger')
         conn.close(); return redirect(url_for('admin_dashboard'))
     return render_template('add_hospital.html')
@@ -880,14 +1585,14 @@ def edit_hospital(id):
         pw = request.form.get('password')
         if pw: conn.execute('UPDATE hospitals SET name=?, email=?, type=?, lat=?, lng=?, password=? WHERE id=?', (request.form['name'], request.form['email'], request.form['type'], request.form['lat'], request.form['lng'], generate_password_hash(pw), id))
         else: conn.execute('UPDATE hospitals SET name=?, email=?, type=?, lat=?, lng=? WHERE id=?', (request.form['name'], request.form['email'], request.form['type'], request.form['lat'], request.form['lng'], id))
-        conn.commit(); flash('Updated!', 'success'); return redirect(url_for('admin_dashboard'))
+        conn.commit(); invalidate_hospital_dashboard(id); invalidate_hospital_list(); flash('Updated!', 'success'); return redirect(url_for('admin_dashboard'))
     hospital = conn.execute('SELECT * FROM hospitals WHERE id = ?', (id,)).fetchone(); conn.close()
     return render_template('edit_hospital.html', hospital=hospital)
 
 @app.route('/admin/delete_hospital/<int:id>')
 def delete_hospital(id):
     if session.get('role') != 'admin': return redirect(url_for('admin_login'))
-    conn = get_db_connection(); conn.execute('DELETE FROM hospitals WHERE id = ?', (id,)); conn.commit(); conn.close()
+    conn = get_db_connection(); conn.execute('DELETE FROM hospitals WHERE id = ?', (id,)); conn.commit(); conn.close(); invalidate_hospital_list()
     flash('Hospital Deleted', 'success'); return redirect(url_for('admin_dashboard'))
 
 @app.route('/admin/edit/<int:id>', methods=['GET', 'POST'])
@@ -895,17 +1600,24 @@ def edit_user(id):
     if session.get('role') != 'admin': return redirect(url_for('admin_login'))
     conn = get_db_connection()
     if request.method == 'POST':
+        old = conn.execute('SELECT phone, email FROM donors WHERE id = ?', (id,)).fetchone()
+        if shards.shard_for_city(request.form['city']) != conn.shard:
+            conn.close(); flash(MOVE_SHARD_MESSAGE, 'danger'); return redirect(url_for('edit_user', id=id))
+        if old and not rekey_account_for('donor', conn.shard, old, {'phone': request.form['phone'], 'email': request.form['email']}):
+            conn.close(); flash('Phone number or Email already registered.', 'danger'); return redirect(url_for('edit_user', id=id))
         pw = request.form.get('password')
         if pw: conn.execute('UPDATE donors SET name=?, email=?, phone=?, city=?, blood_group=?, password=? WHERE id=?', (request.form['name'], request.form['email'], request.form['phone'], request.form['city'], request.form['blood_group'], generate_password_hash(pw), id))
         else: conn.execute('UPDATE donors SET name=?, email=?, phone=?, city=?, blood_group=? WHERE id=?', (request.form['name'], request.form['email'], request.form['phone'], request.form['city'], request.form['blood_group'], id))
-        conn.commit(); return redirect(url_for('admin_dashboard'))
+        conn.commit(); invalidate_hospital_dashboard(); donor_index.invalidate(); return redirect(url_for('admin_dashboard'))
     donor = conn.execute('SELECT * FROM donors WHERE id = ?', (id,)).fetchone(); conn.close()
     return render_template('edit_user.html', donor=donor)
 
 @app.route('/admin/delete/<int:id>')
 def delete_user(id):
     if session.get('role') != 'admin': return redirect(url_for('admin_login'))
-    conn = get_db_connection(); conn.execute('DELETE FROM donors WHERE id = ?', (id,)); conn.commit(); conn.close()
+    conn = get_db_connection(); old = conn.execute('SELECT phone, email FROM donors WHERE id = ?', (id,)).fetchone()
+    conn.execute('DELETE FROM camp_registrations WHERE donor_id = ?', (id,)); conn.execute('DELETE FROM donors WHERE id = ?', (id,)); conn.commit(); conn.close(); invalidate_hospital_dashboard(); donor_index.invalidate()
+    if old: release_account(account_keys('donor', **dict(old)))
     flash('User Deleted', 'success'); return redirect(url_for('admin_dashboard'))
 
 @app.route('/admin/edit_host/<int:id>', methods=['GET', 'POST'])
@@ -913,6 +1625,11 @@ def edit_host(id):
     if session.get('role') != 'admin': return redirect(url_for('admin_login'))
     conn = get_db_connection()
     if request.method == 'POST':
+        old = conn.execute('SELECT email FROM camp_hosts WHERE id = ?', (id,)).fetchone()
+        if shards.shard_for_city(request.form['city']) != conn.shard:
+            conn.close(); flash(MOVE_SHARD_MESSAGE, 'danger'); return redirect(url_for('edit_host', id=id))
+        if old and not rekey_account_for('host', conn.shard, old, {'email': request.form['email']}):
+            conn.close(); flash('Email already registered.', 'danger'); return redirect(url_for('edit_host', id=id))
         pw = request.form.get('password')
         if pw: conn.execute('UPDATE camp_hosts SET organization_name=?, leader_name=?, email=?, phone=?, aadhar_number=?, city=?, address=?, password=? WHERE id=?', (request.form['organization_name'], request.form['leader_name'], request.form['email'], request.form['phone'], request.form['aadhar_number'], request.form['city'], request.form['address'], generate_password_hash(pw), id))
         else: conn.execute('UPDATE camp_hosts SET organization_name=?, leader_name=?, email=?, phone=?, aadhar_number=?, city=?, address=? WHERE id=?', (request.form['organization_name'], request.form['leader_name'], request.form['email'], request.form['phone'], request.form['aadhar_number'], request.form['city'], request.form['address'], id))
@@ -923,7 +1640,9 @@ def edit_host(id):
 @app.route('/admin/delete_host/<int:id>')
 def delete_host(id):
     if session.get('role') != 'admin': return redirect(url_for('admin_login'))
-    conn = get_db_connection(); conn.execute('DELETE FROM camps WHERE host_id = ?', (id,)); conn.execute('DELETE FROM camp_hosts WHERE id = ?', (id,)); conn.commit(); conn.close(); flash('Deleted', 'success')
+    conn = get_db_connection(); old = conn.execute('SELECT email FROM camp_hosts WHERE id = ?', (id,)).fetchone()
+    conn.execute('DELETE FROM camp_registrations WHERE camp_id IN (SELECT id FROM camps WHERE host_id = ?)', (id,)); conn.execute('DELETE FROM camps WHERE host_id = ?', (id,)); conn.execute('DELETE FROM camp_hosts WHERE id = ?', (id,)); conn.commit(); conn.close(); flash('Deleted', 'success')
+    if old: release_account(account_keys('host', **dict(old)))
     return redirect(url_for('admin_dashboard'))
 
 @app.route('/admin/delete_photo/<int:id>')
@@ -947,29 +1666,29 @@ def delete_camp_photo_admin(id):
 @app.route('/admin/export_report')
 def export_report():
     if session.get('role') != 'admin': return redirect(url_for('admin_login'))
-    conn = get_db_connection()
+    conn = get_analytics_connection()
     report_type = request.args.get('type')
     file_format = request.args.get('file_format', 'csv')
     
     rows = []; headers = []; widths = []
     filename = f"Report_{report_type}"
+    include_archive = bool(request.args.get('include_archive'))
 
     if report_type == 'camp_donors':
         camp_id = request.args.get('camp_id')
         camp = conn.execute("SELECT name FROM camps WHERE id=?", (camp_id,)).fetchone()
         filename = f"Camp_Donors_{camp['name']}" if camp else "Camp_Donors"
-        rows = conn.execute("SELECT d.name, d.blood_group, d.phone, d.email, d.city FROM camp_registrations cr LEFT JOIN donors d ON cr.donor_id = d.id WHERE cr.camp_id = ?", (camp_id,)).fetchall()
+        source = report_source(conn, 'report_camp_donors', current_archive()) if include_archive else 'report_camp_donors'
+        rows = conn.execute(f"SELECT name, blood_group, phone, email, city FROM {source} WHERE camp_id = ?", (camp_id,)).fetchall()
         headers = ['Name', 'Group', 'Phone', 'Email', 'City']; widths = [40, 20, 35, 60, 35]
 
     elif report_type == 'donations':
-        rows = conn.execute('''SELECT d.date, u.name, d.volume_ml, d.hospital, d.status 
-                               FROM donations d JOIN donors u ON d.donor_id = u.id ORDER BY d.date DESC''').fetchall()
+        source = report_source(conn, 'report_donation_log', current_archive()) if include_archive else 'report_donation_log'
+        rows = conn.execute(f"SELECT date, name, volume_ml, hospital, status FROM {source} ORDER BY date DESC").fetchall()
         headers = ['Date', 'Donor', 'Vol (ml)', 'Hospital', 'Status']; widths = [30, 50, 20, 60, 30]
 
     elif report_type == 'hospitals' or report_type == 'hospitals_list':
-        rows = conn.execute('''SELECT h.name, h.type, h.email, COUNT(d.id) as total_units 
-                               FROM hospitals h LEFT JOIN donations d ON h.name = d.hospital AND d.status='Approved' 
-                               GROUP BY h.id ORDER BY total_units DESC''').fetchall()
+        rows = conn.execute("SELECT name, type, email, total_units FROM report_hospital_performance ORDER BY total_units DESC").fetchall()
         headers = ['Hospital', 'Type', 'Email', 'Collected']; widths = [80, 25, 60, 25]
 
     elif report_type == 'camps_history':
@@ -987,7 +1706,8 @@ def export_report():
     conn.close()
 
     if file_format == 'pdf':
-        pdf = FPDF('L', 'mm', 'A4'); pdf.add_page(); pdf.set_font("Arial", 'B', 14); pdf.cell(0, 10, f"Report: {report_type}", 0, 1, 'C'); pdf.ln(10)
+        pdf = FPDF('L', 'mm', 'A4'); pdf.add_page(); pdf.set_font("Arial", 'B', 14); pdf.cell(0, 10, f"Report: {report_type}", 0, 1, 'C')
+        pdf.set_font("Arial", '', 9); pdf.cell(0, 6, f"Data as of {current_analytics().taken_at()}", 0, 1, 'C'); pdf.ln(4)
         pdf.set_font("Arial", 'B', 10)
         for i, h in enumerate(headers): 
             w = widths[i] if i < len(widths) else 30
@@ -1000,11 +1720,97 @@ def export_report():
                 if pdf.get_string_width(text) > w: text = text[:int(w/2)] + "..."
                 pdf.cell(w, 10, text, 1)
             pdf.ln()
-        response = make_response(pdf.output(dest='S').encode('latin-1')); response.headers['Content-Type'] = 'application/pdf'; response.headers['Content-Disposition'] = f'attachment; filename={filename}.pdf'; return response
+        response = make_response(pdf.output(dest='S').encode('latin-1')); response.headers['Content-Type'] = 'application/pdf'; response.headers['Content-Disposition'] = f'attachment; filename={filename}.pdf'; return stamp_snapshot(response)
     else:
         si = StringIO(); cw = csv.writer(si); cw.writerow(headers)
         for r in rows: cw.writerow([str(item) if item else "N/A" for item in r])
-        out = make_response(si.getvalue()); out.headers['Content-Disposition'] = f'attachment; filename={filename}.csv'; out.headers['Content-Type'] = 'text/csv'; return out
+        out = make_response(si.getvalue()); out.headers['Content-Disposition'] = f'attachment; filename={filename}.csv'; out.headers['Content-Type'] = 'text/csv'; return stamp_snapshot(out)
+
+# =========================================================================
+# ADMIN ROUTE: PROMETHEUS METRICS (QUERY + ROUTE LATENCY)
+# =========================================================================
+@app.route('/admin/metrics')
+def admin_metrics():
+    # Scrapers without a session may authenticate with the LIFEFLOW_METRICS_TOKEN bearer token
+    token = os.environ.get('LIFEFLOW_METRICS_TOKEN')
+    if session.get('role') != 'admin' and not (token and hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode())):
+        return "Unauthorized", 403
+    response = make_response(db_metrics.registry.render_prometheus())
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    return response
+
+# =========================================================================
+# PERFORMANCE FEATURE: CHANGE-DATA CAPTURE FEED (CURSOR PULL, ACK, COMPACTION)
+# =========================================================================
+# Replicas and cache invalidators pull what changed instead of rescanning tables (see cdc.py). Off unless LIFEFLOW_CDC=1.
+# One feed per shard (?shard=, default: the routed shard). Without a session, LIFEFLOW_CDC_TOKEN authenticates.
+cdc_compactors = {name: Compactor(lambda name=name: get_db_connection(name)) for name in shards.names}
+if CDC_ENABLED:
+    for _compactor in cdc_compactors.values(): _compactor.start()
+
+def cdc_request():
+    """(shard, error response) for a CDC API call."""
+    if not CDC_ENABLED: return None, (jsonify({'error': 'Change feed is disabled (set LIFEFLOW_CDC=1)'}), 404)
+    token = os.environ.get('LIFEFLOW_CDC_TOKEN')
+    if session.get('role') != 'admin' and not (token and hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode())):
+        return None, (jsonify({'error': 'Unauthorized'}), 403)
+    shard = request.values.get('shard')
+    if shard and not shards.valid(shard): return None, (jsonify({'error': f'Unknown shard {shard!r}'}), 404)
+    return shard or current_shard(), None
+
+@app.route('/api/changes/register', methods=['POST'])
+def cdc_register():
+    # Body: consumer, optional since (default: the current head, for a replica about to copy the tables)
+    shard, error = cdc_request()
+    if error: return error
+    data = request.get_json(silent=True) or request.form
+    if not data.get('consumer'): return jsonify({'error': 'consumer is required'}), 400
+    try: since = None if data.get('since') is None else int(data['since'])
+    except (TypeError, ValueError): return jsonify({'error': 'since must be a number'}), 400
+    conn = get_db_connection(shard)
+    try:
+        register_consumer(conn, data['consumer'], since)
+        cursor = conn.execute("SELECT acked_seq FROM cdc_consumers WHERE name = ?", (data['consumer'],)).fetchone()[0]
+        return jsonify({'shard': shard, 'consumer': data['consumer'], 'cursor': cursor, 'head': head_seq(conn)})
+    except CursorExpired as e: return jsonify({'error': str(e), 'resync': True}), 410
+    finally: conn.close()
+
+@app.route('/api/changes')
+def cdc_pull():
+    # ?since=SEQ, or ?consumer=NAME to resume from its last acknowledgement; ?limit= up to MAX_PULL_BATCH
+    shard, error = cdc_request()
+    if error: return error
+    try:
+        since = None if request.args.get('since') is None else int(request.args['since'])
+        limit = min(MAX_PULL_BATCH, max(1, int(request.args.get('limit', PULL_BATCH_SIZE))))
+    except ValueError: return jsonify({'error': 'since and limit must be numbers'}), 400
+    conn = get_db_connection(shard)
+    try:
+        if since is None:
+            row = conn.execute("SELECT acked_seq FROM cdc_consumers WHERE name = ?", (request.args.get('consumer'),)).fetchone()
+            if row is None: return jsonify({'error': 'Pass since, or the name of a registered consumer'}), 400
+            since = row[0]
+        started = time.perf_counter()
+        batch = pull_changes(conn, since, limit)
+        db_metrics.registry.record_batch('cdc_pull', time.perf_counter() - started, len(batch['changes']))
+    except CursorExpired as e: return jsonify({'error': str(e), 'resync': True}), 410
+    finally: conn.close()
+    return jsonify(dict(batch, shard=shard, since=since))
+
+@app.route('/api/changes/ack', methods=['POST'])
+def cdc_ack():
+    # Body: consumer, seq (everything up to seq has been applied); compacts what every consumer has acknowledged
+    shard, error = cdc_request()
+    if error: return error
+    data = request.get_json(silent=True) or request.form
+    try: seq = int(data.get('seq'))
+    except (TypeError, ValueError): return jsonify({'error': 'seq must be a number'}), 400
+    conn = get_db_connection(shard)
+    try: acked, compacted = acknowledge(conn, data.get('consumer'), seq)
+    except ValueError as e: return jsonify({'error': str(e)}), 404
+    except sqlite3.OperationalError: return jsonify({'error': 'A database transaction error occurred. Please try again.'}), 503
+    finally: conn.close()
+    return jsonify({'shard': shard, 'consumer': data.get('consumer'), 'acked': acked, 'compacted': compacted})
 
 @app.route('/about')
 def about(): return render_template('about.html')
@@ -1017,33 +1823,58 @@ def map_page(): return render_template('map.html')
 # MAP API: UPDATED TO REFLECT EXTERNAL + INTERNAL STOCK
 # =========================================================================
 @app.route('/api/blood-stock')
-def get_map(): 
-    conn = get_db_connection()
+def get_map():
+    # Concurrent map loads share one computation (see PUBLIC HOT ENDPOINTS below)
+    return jsonify(public_reads.do(('blood-stock', date.today()), blood_stock_markers))
+
+def blood_stock_markers():
+    # Statewide map: every shard's markers, gathered in parallel
+    return [marker for markers in shards.scatter(shard_stock_markers) for marker in markers]
+
+def shard_stock_markers(shard):
+    conn = get_db_connection(shard)
     today_str = date.today().strftime('%Y-%m-%d')
     
-    # Calculate Internal verified donations + External uploaded stock
-    hospitals = conn.execute('''
-        SELECT h.id, h.name, h.lat, h.lng, h.type, h.email as contact, 'hospital' as marker_type, 'N/A' as host, 
-        (SELECT COUNT(*) FROM donations d WHERE d.hospital = h.name AND d.status = 'Approved') as internal_stock,
-        IFNULL((SELECT SUM(units) FROM hospital_stock hs WHERE hs.hospital_id = h.id), 0) as external_stock
-        FROM hospitals h
-    ''').fetchall()
+    # Unexpired units per hospital from the inventory ledger (donations + external stock)
+    hospitals = conn.execute("SELECT h.id, h.name, h.lat, h.lng, h.type, h.email as contact, 'hospital' as marker_type, 'N/A' as host FROM hospitals h").fetchall()
+    totals = {}
+    for (hospital_id, _), units in current_stock(conn).items(): totals[hospital_id] = totals.get(hospital_id, 0) + units
     
-    camps = conn.execute("SELECT c.name, c.lat, c.lng, 'Camp' as type, 'camp' as marker_type, c.estimated_participants as capacity, ch.organization_name as host, ch.phone as contact, (SELECT COUNT(*) FROM camp_registrations cr WHERE cr.camp_id = c.id) as registered_count FROM camps c JOIN camp_hosts ch ON c.host_id = ch.id WHERE c.status='Upcoming' AND c.date >= ?", (today_str,)).fetchall()
+    camps = conn.execute("SELECT c.name, c.lat, c.lng, 'Camp' as type, 'camp' as marker_type, c.estimated_participants as capacity, ch.organization_name as host, ch.phone as contact, c.registered_count FROM camps c JOIN camp_hosts ch ON c.host_id = ch.id WHERE c.status='Upcoming' AND c.date >= ?", (today_str,)).fetchall()
     conn.close()
     
     data = []
     for h in hospitals:
-        total_stock = h['internal_stock'] + h['external_stock']
+        total_stock = totals.get(h['id'], 0)
         st = f"{total_stock} Units" if total_stock > 0 else "Low Stock"
         info = f"<div style='text-align:center;'><b>🏥 {h['name']}</b><br><span style='color:grey;'>{h['type']} Hospital</span><br><div style='margin:5px 0; background:#ffebeb; border:1px solid #ffcccc;'><b>🩸 Total Stock:</b> <span style='color:red;'>{st}</span></div>📞 {h['contact']}</div>"
-        d = dict(h); d['popup_info'] = info; data.append(d)
+        d = dict(h); d['total_stock'] = total_stock; d['popup_info'] = info; data.append(d)
         
     for c in camps:
         info = f"<div style='text-align:center;'><b>⛺ {c['name']}</b><br><span style='color:grey;'>Host: {c['host']}</span><br><div style='margin:5px 0; background:#e6fffa; border:1px solid #b3ffec;'><b>📝 Registered:</b> <span style='color:green;'>{c['registered_count']} / {c['capacity']}</span></div>📞 {c['contact']}</div>"
         d = dict(c); d['popup_info'] = info; data.append(d)
         
-    return jsonify(data) 
+    return data
+
+# =========================================================================
+# PUBLIC API: DONOR LEADERBOARDS (CITY / BLOOD GROUP / MONTH / YEAR)
+# =========================================================================
+@app.route('/api/leaderboard')
+def api_leaderboard():
+    # window=all|year|month (current period) or an explicit period=YYYY / YYYY-MM
+    window = request.args.get('window', 'all'); period = request.args.get('period')
+    if not period: period = {'all': 'all', 'year': date.today().strftime('%Y'), 'month': date.today().strftime('%Y-%m')}.get(window)
+    if not period or (period != 'all' and not (len(period) in (4, 7) and period[:4].isdigit())): return jsonify({'error': 'Unknown window or period'}), 400
+    try: per_page = min(100, max(1, int(request.args.get('per_page', 10))))
+    except ValueError: return jsonify({'error': 'per_page must be a number'}), 400
+    # A city leaderboard lives in that city's shard; statewide boards merge every shard's top rows
+    city = request.args.get('city')
+    sql, params = leaderboard_query(period, city, request.args.get('blood_group'))
+    page = paginate_shards([shards.shard_for_city(city)] if city else shards.names, sql, params, 'page', per_page, key=lambda r: (-r['total_volume'], r['name']))
+    results = [dict(row, rank=page.first + i) for i, row in enumerate(page.rows)]
+    for r in results: r.pop('donor_id')
+    return jsonify({'period': period, 'city': request.args.get('city'), 'blood_group': request.args.get('blood_group'),
+                    'page': page.number, 'pages': page.pages, 'per_page': page.size, 'total': page.total, 'results': results})
 
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
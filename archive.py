@@ -0,0 +1,189 @@
+"""Hot/cold archival of donation, appointment, camp registration and audit history.
+
+The live tables only ever grow, and every dashboard, queue and aggregate scans them.
+archive_history() moves rows older than a horizon into a separate SQLite file that is
+ATTACHed as `archive`. Each batch is one transaction: the rows are copied into
+archive.<table> (stamped with archived_at), folded into the per-donor
+donor_archive_summary in the hot database, and deleted from the hot table. Hot tables
+therefore hold roughly the last `horizon` days, whatever the age of the deployment.
+
+Rows that are still in play stay hot, whatever their age: Pending donations and
+Scheduled appointments. The horizon is at least MIN_HORIZON_DAYS, far beyond the
+90-day windows that eligibility and SOS targeting look at, so moving history never
+changes who may donate.
+
+The hot triggers that react to deletions are undone for archived rows. donor_totals
+keeps counting archived donations, so leaderboards do not change (rebuild_donor_totals
+only sees them with the archive attached), and camps keep their registered_count. Readers that want the full history attach the archive and read
+through ARCHIVE_REPORT_VIEWS or the timeline's archive arms.
+
+    python archive.py run [horizon_days]    (every shard in LIFEFLOW_SHARDS, see sharding.py)
+"""
+import os
+import sqlite3
+from datetime import date, datetime, timedelta
+
+ARCHIVE_DATABASE = os.environ.get('LIFEFLOW_ARCHIVE_DB', 'archive.db')
+ARCHIVE_HORIZON_DAYS = int(os.environ.get('LIFEFLOW_ARCHIVE_HORIZON_DAYS', '730'))
+MIN_HORIZON_DAYS = 365
+ARCHIVE_BATCH_SIZE = 1000
+
+# (table, primary key, archive-by date column, rows that stay hot whatever their age,
+#  per-donor summary columns folded from each archived batch)
+ARCHIVED_TABLES = [
+    ('donations', 'id', 'date', "status = 'Pending'",
+     {'donations': "SUM(status = 'Approved')", 'donated_ml': "SUM(CASE WHEN status = 'Approved' THEN IFNULL(volume_ml, 0) ELSE 0 END)"}),
+    ('appointments', 'id', 'date', "status = 'Scheduled'",
+     {'appointments': 'COUNT(*)', 'verified_appointments': "SUM(status = 'Verified')"}),
+    ('camp_registrations', 'id', 'camp_date', None,
+     {'camp_registrations': 'COUNT(*)'}),
+    ('security_audit_log', 'log_id', 'action_timestamp', None, None),
+]
+
+ARCHIVE_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS archive.idx_archive_donation_donor_date ON donations(donor_id, date)",
+    "CREATE INDEX IF NOT EXISTS archive.idx_archive_donation_hosp_date ON donations(hospital, date)",
+    "CREATE INDEX IF NOT EXISTS archive.idx_archive_appointment_donor_date ON appointments(donor_id, date)",
+    "CREATE INDEX IF NOT EXISTS archive.idx_archive_appointment_hosp_date ON appointments(hospital_id, date)",
+    "CREATE INDEX IF NOT EXISTS archive.idx_archive_camp_reg_donor_date ON camp_registrations(donor_id, camp_date)",
+    "CREATE INDEX IF NOT EXISTS archive.idx_archive_camp_reg_camp ON camp_registrations(camp_id)",
+]
+
+# Run around the hot DELETE so triggers written for real deletions leave archived history counted
+_PRESERVE = {
+    'donations': (
+        ["DELETE FROM temp.archive_kept_totals",
+         # Only the periods the batch counts towards: the all-time, year and month rows (see leaderboards.py)
+         '''WITH archived AS (SELECT donor_id, date FROM donations WHERE id IN (SELECT id FROM temp.archive_batch) AND status = 'Approved')
+            INSERT INTO temp.archive_kept_totals SELECT * FROM donor_totals WHERE (donor_id, period) IN
+            (SELECT donor_id, 'all' FROM archived UNION SELECT donor_id, substr(date, 1, 4) FROM archived
+             UNION SELECT donor_id, substr(date, 1, 7) FROM archived)'''],
+        ["INSERT OR REPLACE INTO donor_totals SELECT * FROM temp.archive_kept_totals",
+         # Removing a hot donation later recomputes last_date from the hot rows and this, so archived dates are not lost
+         '''WITH archived AS (SELECT donor_id, date FROM archive.donations WHERE id IN (SELECT id FROM temp.archive_batch) AND status = 'Approved')
+            UPDATE donor_totals SET archived_last_date = MAX(IFNULL(archived_last_date, ''), b.last_date)
+            FROM (SELECT donor_id, period, MAX(date) AS last_date FROM
+                  (SELECT donor_id, 'all' AS period, date FROM archived UNION ALL SELECT donor_id, substr(date, 1, 4), date FROM archived
+                   UNION ALL SELECT donor_id, substr(date, 1, 7), date FROM archived) GROUP BY donor_id, period) b
+            WHERE donor_totals.donor_id = b.donor_id AND donor_totals.period = b.period''']),
+    'camp_registrations': (
+        [],
+        ['''UPDATE camps SET registered_count = registered_count + b.n
+            FROM (SELECT camp_id, COUNT(*) AS n FROM archive.camp_registrations
+                  WHERE id IN (SELECT id FROM temp.archive_batch) GROUP BY camp_id) b
+            WHERE camps.id = b.camp_id''']),
+}
+
+# Archive counterparts of the analytics snapshot's report_* tables (see analytics_snapshot.REPORT_VIEWS).
+# Rows archived after the snapshot was taken are still in its copy of the hot table, so they are skipped.
+ARCHIVE_REPORT_VIEWS = {
+    'report_donation_log':
+        '''SELECT d.id, d.date, u.name, u.blood_group, u.phone, d.volume_ml, d.hospital, d.status
+           FROM archive.donations d JOIN donors u ON d.donor_id = u.id
+           WHERE NOT EXISTS (SELECT 1 FROM main.donations hot WHERE hot.id = d.id)''',
+    'report_appointment_log':
+        '''SELECT a.id, a.hospital_id, a.date, a.time_slot, d.name, d.blood_group, d.phone, a.status
+           FROM archive.appointments a JOIN donors d ON a.donor_id = d.id
+           WHERE NOT EXISTS (SELECT 1 FROM main.appointments hot WHERE hot.id = a.id)''',
+    'report_camp_donors':
+        '''SELECT cr.camp_id, d.name, d.blood_group, d.phone, d.email, d.city
+           FROM archive.camp_registrations cr LEFT JOIN donors d ON cr.donor_id = d.id
+           WHERE NOT EXISTS (SELECT 1 FROM main.camp_registrations hot WHERE hot.id = cr.id)''',
+}
+
+def init_archive_tables(c):
+    """Called from init_db() with its cursor. The archive file itself is created by the first archive run."""
+    c.execute('''CREATE TABLE IF NOT EXISTS donor_archive_summary
+                 (donor_id INTEGER PRIMARY KEY, donations INTEGER DEFAULT 0, donated_ml INTEGER DEFAULT 0,
+                  appointments INTEGER DEFAULT 0, verified_appointments INTEGER DEFAULT 0, camp_registrations INTEGER DEFAULT 0,
+                  first_date TEXT, last_date TEXT,
+                  FOREIGN KEY(donor_id) REFERENCES donors(id))''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS donor_archive_summary_donor_delete AFTER DELETE ON donors
+                 BEGIN DELETE FROM donor_archive_summary WHERE donor_id = OLD.id; END;''')
+
+def archive_path(router, name):
+    """Archive file of a shard: ARCHIVE_DATABASE for the home shard, archive.<shard>.db for the others."""
+    root, ext = os.path.splitext(ARCHIVE_DATABASE)
+    return ARCHIVE_DATABASE if name == router.home else f"{root}.{name}{ext}"
+
+def attach_archive(conn, path):
+    """Attaches the archive as `archive` for reading; False if nothing has been archived yet. Not inside a transaction."""
+    if any(r[1] == 'archive' for r in conn.execute("PRAGMA database_list")): return True
+    if not os.path.exists(path): return False
+    conn.execute("ATTACH DATABASE ? AS archive", (path,))
+    return True
+
+def report_source(conn, table, path):
+    """FROM clause for a snapshot report table: the table alone, or UNION ALL its archived rows."""
+    if not attach_archive(conn, path): return table
+    return f"(SELECT * FROM {table} UNION ALL {ARCHIVE_REPORT_VIEWS[table]})"
+
+def _prepare(conn, path):
+    # Mirrors each hot table's current columns into the archive (new hot columns are added on later runs)
+    if not any(r[1] == 'archive' for r in conn.execute("PRAGMA database_list")):
+        conn.execute("ATTACH DATABASE ? AS archive", (path,))
+    columns = {}
+    for table, key, *_ in ARCHIVED_TABLES:
+        hot = [(r[1], r[2]) for r in conn.execute(f"PRAGMA main.table_info({table})")]
+        cold = {r[1] for r in conn.execute(f"PRAGMA archive.table_info({table})")}
+        if not cold:
+            defs = ', '.join(f"{name} INTEGER PRIMARY KEY" if name == key else f"{name} {ctype}" for name, ctype in hot)
+            conn.execute(f"CREATE TABLE archive.{table} ({defs}, archived_at TEXT)")
+        for name, ctype in hot:
+            if cold and name not in cold: conn.execute(f"ALTER TABLE archive.{table} ADD COLUMN {name} {ctype}")
+        columns[table] = ', '.join(name for name, _ in hot)
+    for index in ARCHIVE_INDEXES: conn.execute(index)
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS archive_batch (id INTEGER PRIMARY KEY)")
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS archive_kept_totals AS SELECT * FROM donor_totals WHERE 0")
+    conn.commit()
+    return columns
+
+def archive_history(conn, path, horizon_days=ARCHIVE_HORIZON_DAYS, batch_size=ARCHIVE_BATCH_SIZE, today=None):
+    """Moves rows older than horizon_days into the archive at `path`, batch_size rows per transaction.
+
+    Returns {table: rows moved}. Safe to re-run after an interruption: a batch whose hot
+    delete did not commit is copied again with INSERT OR REPLACE."""
+    if horizon_days < MIN_HORIZON_DAYS: raise ValueError(f"horizon must be at least {MIN_HORIZON_DAYS} days")
+    cutoff = ((today or date.today()) - timedelta(days=horizon_days)).isoformat()
+    columns = _prepare(conn, path); moved = {}
+    for table, key, date_column, keep_hot, summary in ARCHIVED_TABLES:
+        where = f"{date_column} < ?" + (f" AND NOT ({keep_hot})" if keep_hot else '')
+        before, after = _PRESERVE.get(table, ([], []))
+        moved[table] = 0
+        while True:
+            conn.execute("BEGIN IMMEDIATE TRANSACTION")
+            conn.execute("DELETE FROM temp.archive_batch")
+            # No ORDER BY: a date index range scan or a rowid scan (old rows sit at the front) both stop after one batch
+            n = conn.execute(f"INSERT INTO temp.archive_batch SELECT {key} FROM main.{table} WHERE {where} LIMIT ?", (cutoff, batch_size)).rowcount
+            if not n: conn.commit(); break
+            conn.execute(f'''INSERT OR REPLACE INTO archive.{table} ({columns[table]}, archived_at)
+                             SELECT {columns[table]}, ? FROM main.{table} WHERE {key} IN (SELECT id FROM temp.archive_batch)''',
+                         (datetime.now().strftime('%Y-%m-%d %H:%M:%S'),))
+            if summary:
+                names = ', '.join(summary); exprs = ', '.join(summary.values())
+                updates = ', '.join(f"{name} = {name} + excluded.{name}" for name in summary)
+                conn.execute(f'''INSERT INTO donor_archive_summary (donor_id, {names}, first_date, last_date)
+                                 SELECT donor_id, {exprs}, MIN({date_column}), MAX({date_column}) FROM main.{table}
+                                 WHERE {key} IN (SELECT id FROM temp.archive_batch) GROUP BY donor_id
+                                 ON CONFLICT(donor_id) DO UPDATE SET {updates},
+                                     first_date = MIN(IFNULL(first_date, excluded.first_date), excluded.first_date),
+                                     last_date = MAX(IFNULL(last_date, excluded.last_date), excluded.last_date)''')
+            for sql in before: conn.execute(sql)
+            conn.execute(f"DELETE FROM main.{table} WHERE {key} IN (SELECT id FROM temp.archive_batch)")
+            for sql in after: conn.execute(sql)
+            conn.commit()
+            moved[table] += n
+            if n < batch_size: break
+    return moved
+
+if __name__ == '__main__':
+    import sys
+    if sys.argv[1:2] != ['run'] or len(sys.argv) > 3: sys.exit("usage: python archive.py run [horizon_days]")
+    from sharding import ShardRouter
+    horizon = int(sys.argv[2]) if len(sys.argv) > 2 else ARCHIVE_HORIZON_DAYS
+    router = ShardRouter.from_env(os.environ.get('LIFEFLOW_DB', 'bloodbank.db'))
+    for shard in router.shards:
+        conn = sqlite3.connect(shard.path); path = archive_path(router, shard.name)
+        try: moved = archive_history(conn, path, horizon)
+        finally: conn.close()
+        print(f"{shard.name}: archived rows older than {horizon} days into {path}: " + ', '.join(f"{n} {t}" for t, n in moved.items()))
@@ -0,0 +1,110 @@
+"""ASGI serving mode for LifeFlow.
+
+The event loop owns every socket, so slow or idle keep-alive clients cost a coroutine
+instead of a thread. A request is read in full before any thread gets involved. The
+Flask app is then called once, with a complete WSGI environ, on one of two executors:
+
+* READ_ROUTES (homepage, map API, public SOS, leaderboard) run on a small bounded pool
+  sized for concurrent SQLite readers. Requests beyond READ_MAX_PENDING get a 503
+  instead of queueing without limit.
+* Every other route (bookings, dashboards, admin) runs on its own pool, just as it did
+  under the threaded server, so a surge of public readers cannot starve hospitals.
+
+Production (one process per core, each with its own executors):
+    python asgi.py
+    uvicorn asgi:application --workers 4 --host 0.0.0.0 --port 8000 --timeout-keep-alive 15
+"""
+import asyncio
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from app import app as flask_app
+
+DB_READ_WORKERS = int(os.environ.get('LIFEFLOW_DB_READ_WORKERS', '8'))
+READ_MAX_PENDING = int(os.environ.get('LIFEFLOW_READ_MAX_PENDING', '256'))
+APP_WORKERS = int(os.environ.get('LIFEFLOW_APP_WORKERS', '16'))
+MAX_BODY_BYTES = 32 * 1024 * 1024 # Camp photo uploads are the largest legitimate bodies
+
+READ_ROUTES = {('GET', '/'), ('GET', '/api/blood-stock'), ('GET', '/api/leaderboard'), ('GET', '/public_sos'), ('POST', '/public_sos')}
+
+read_executor = ThreadPoolExecutor(max_workers=DB_READ_WORKERS, thread_name_prefix='lifeflow-read')
+app_executor = ThreadPoolExecutor(max_workers=APP_WORKERS, thread_name_prefix='lifeflow-app')
+_read_slots = None # asyncio.Semaphore, created inside the running loop
+
+def build_environ(scope, body):
+    server = scope.get('server') or ('localhost', 80); client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'], 'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin1'),
+        'PATH_INFO': scope['path'].encode('utf8').decode('latin1'), 'QUERY_STRING': scope['query_string'].decode('latin1'),
+        'SERVER_NAME': server[0], 'SERVER_PORT': str(server[1]), 'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'REMOTE_ADDR': client[0], 'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0), 'wsgi.url_scheme': scope.get('scheme', 'http'), 'wsgi.input': io.BytesIO(body),
+        'CONTENT_LENGTH': str(len(body)), # The body is already read in full; a chunked upload has no Content-Length header
+        'wsgi.errors': sys.stderr, 'wsgi.multithread': True, 'wsgi.multiprocess': True, 'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin1'); value = value.decode('latin1')
+        if name == 'content-type': environ['CONTENT_TYPE'] = value
+        elif name in ('content-length', 'transfer-encoding'): continue
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+def call_flask(environ):
+    """Runs one request through the Flask app on an executor thread; returns (status, headers, body)."""
+    started = []
+    def start_response(status, headers, exc_info=None): started[:] = [status, headers]
+    result = flask_app(environ, start_response)
+    try: body = b''.join(result)
+    finally:
+        if hasattr(result, 'close'): result.close()
+    return int(started[0].split(' ', 1)[0]), started[1], body
+
+async def _send_response(send, status, headers, body):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(k.lower().encode('latin1'), v.encode('latin1')) for k, v in headers]})
+    await send({'type': 'http.response.body', 'body': body})
+
+async def _read_body(receive):
+    chunks = []; size = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect': return None
+        chunks.append(message.get('body', b'')); size += len(chunks[-1])
+        if size > MAX_BODY_BYTES: return False
+        if not message.get('more_body'): return b''.join(chunks)
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup': await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            read_executor.shutdown(wait=False); app_executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'}); return
+
+async def application(scope, receive, send):
+    global _read_slots
+    if scope['type'] == 'lifespan': return await _lifespan(receive, send)
+    if scope['type'] != 'http': return
+    body = await _read_body(receive)
+    if body is None: return # Client went away before finishing its request
+    if body is False: return await _send_response(send, 413, [('Content-Type', 'text/plain')], b'Request too large')
+    loop = asyncio.get_running_loop(); environ = build_environ(scope, body)
+    if (scope['method'], scope['path']) in READ_ROUTES:
+        if _read_slots is None: _read_slots = asyncio.Semaphore(READ_MAX_PENDING)
+        if _read_slots.locked():
+            return await _send_response(send, 503, [('Content-Type', 'text/plain'), ('Retry-After', '1')], b'Server busy, please retry')
+        async with _read_slots:
+            status, headers, payload = await loop.run_in_executor(read_executor, call_flask, environ)
+    else:
+        status, headers, payload = await loop.run_in_executor(app_executor, call_flask, environ)
+    await _send_response(send, status, headers, payload)
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run('asgi:application', host=os.environ.get('LIFEFLOW_HOST', '0.0.0.0'), port=int(os.environ.get('PORT', '8000')),
+                workers=int(os.environ.get('WEB_CONCURRENCY', os.cpu_count() or 1)),
+                timeout_keep_alive=int(os.environ.get('LIFEFLOW_KEEPALIVE_SECONDS', '15')),
+                backlog=4096, proxy_headers=True, access_log=False)
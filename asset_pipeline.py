@@ -0,0 +1,97 @@
+"""Static asset pipeline: static_src/ -> fingerprinted, minified, precompressed bundles.
+
+Every file in static_src/css and static_src/js is minified. It is then written to
+static/dist/<name>.<sha256[:10]>.<ext> next to .gz and .br (Brotli, when the module is
+installed) copies, and recorded in static/dist/manifest.json. Templates link bundles
+with asset_url('layout.css'). The app serves the best precompressed variant with
+immutable far-future cache headers, which is safe because changed content always gets
+a new file name.
+
+    python asset_pipeline.py build
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+
+try:
+    import brotli
+except ImportError: # Optional: without it only gzip variants are produced
+    brotli = None
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SOURCE_DIR = os.path.join(ROOT, 'static_src')
+DIST_DIR = os.path.join(ROOT, 'static', 'dist')
+MANIFEST = os.path.join(DIST_DIR, 'manifest.json')
+
+def minify_css(text):
+    text = re.sub(r'/\*.*?\*/', '', text, flags=re.S)
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\s*([{};,])\s*', r'\1', text)
+    text = re.sub(r':\s+', ':', text) # Only after ':' so descendant pseudo-selectors ("a :hover") keep their space
+    return text.replace(';}', '}').strip()
+
+def minify_js(text):
+    """Conservative: drops comments and indentation, keeps line breaks so ASI behaves as before."""
+    out = []; i = 0; quote = None; n = len(text)
+    while i < n:
+        ch = text[i]
+        if quote:
+            out.append(ch)
+            if ch == '\\' and i + 1 < n: out.append(text[i + 1]); i += 1
+            elif ch == quote: quote = None
+        elif ch in '"\'`': quote = ch; out.append(ch)
+        elif text.startswith('//', i):
+            while i < n and text[i] != '\n': i += 1
+            continue
+        elif text.startswith('/*', i):
+            end = text.find('*/', i + 2); i = n if end < 0 else end + 2
+            continue
+        else: out.append(ch)
+        i += 1
+    return '\n'.join(line.strip() for line in ''.join(out).splitlines() if line.strip()) + '\n'
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+def _write(path, data):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f: f.write(data)
+    os.replace(tmp, path) # Atomic, so concurrent builds from several workers never expose half a file
+
+def build():
+    """Builds every bundle and returns the manifest {logical name: fingerprinted file name}."""
+    os.makedirs(DIST_DIR, exist_ok=True)
+    manifest = {}
+    for kind in sorted(os.listdir(SOURCE_DIR)):
+        for source in sorted(os.listdir(os.path.join(SOURCE_DIR, kind))):
+            stem, ext = os.path.splitext(source)
+            if ext not in MINIFIERS: continue
+            with open(os.path.join(SOURCE_DIR, kind, source), encoding='utf-8') as f:
+                data = MINIFIERS[ext](f.read()).encode('utf-8')
+            name = f"{stem}.{hashlib.sha256(data).hexdigest()[:10]}{ext}"
+            path = os.path.join(DIST_DIR, name)
+            if not os.path.exists(path):
+                _write(path, data)
+                _write(path + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+                if brotli: _write(path + '.br', brotli.compress(data, quality=11))
+            manifest[source] = name
+    _write(MANIFEST, json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    return manifest
+
+def load_manifest():
+    """Reads the manifest, rebuilding first if it is missing or older than any source file."""
+    try: built = os.path.getmtime(MANIFEST)
+    except OSError: return build()
+    for dirpath, _, files in os.walk(SOURCE_DIR):
+        if any(os.path.getmtime(os.path.join(dirpath, f)) > built for f in files): return build()
+    with open(MANIFEST, encoding='utf-8') as f: return json.load(f)
+
+if __name__ == '__main__':
+    import sys
+    if sys.argv[1:] != ['build']: sys.exit("usage: python asset_pipeline.py build")
+    for source, name in build().items():
+        path = os.path.join(DIST_DIR, name)
+        sizes = [os.path.getsize(os.path.join(SOURCE_DIR, 'css' if source.endswith('.css') else 'js', source)), os.path.getsize(path), os.path.getsize(path + '.gz')]
+        if os.path.exists(path + '.br'): sizes.append(os.path.getsize(path + '.br'))
+        print(f"{source:<18} -> {name:<28} " + ' / '.join(f"{s:,} B" for s in sizes) + "  (source / min / gz / br)")
@@ -0,0 +1,69 @@
+"""Benchmark: dashboard and report cost before and after archiving old history.
+
+Seeds PER_YEAR donations, hospital appointments and camp registrations for every one
+of YEARS years, spread over 2000 donors. Times the homepage aggregates, GET /admin
+(verified-appointment pages) and an analytics snapshot refresh, then moves everything
+older than the default horizon into the archive database and times them again.
+Also reports archival throughput and the hot database size on both sides.
+
+Usage: python benchmarks/bench_archive.py [years] [per_year]"""
+import os
+import sys
+from common import load_app, login, seed_donors, days_ago, Timer
+
+YEARS = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+PER_YEAR = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+
+def best_of(fn, runs=5):
+    times = []
+    for _ in range(runs):
+        with Timer() as t: fn()
+        times.append(t.elapsed)
+    return min(times) * 1000
+
+def measure(app, client):
+    conn = app.get_db_connection()
+    rows = sum(conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0] for t in ('donations', 'appointments', 'camp_registrations'))
+    conn.execute("VACUUM"); conn.close()
+    return {'rows': rows, 'size_mb': os.path.getsize(app.DATABASE) / 2 ** 20,
+            'homepage': best_of(lambda: app.homepage_shard_data(app.shards.home)),
+            'admin': best_of(lambda: client.get('/admin')),
+            'snapshot': best_of(app.current_analytics().refresh, runs=2)}
+
+def main():
+    app = load_app()
+    app.db_metrics.registry.slow_query_seconds = float('inf')
+    conn = app.get_db_connection()
+    seed_donors(conn, 2000)
+    donors = [r[0] for r in conn.execute("SELECT id FROM donors WHERE role = 'user'")]
+    hospitals = [r[0] for r in conn.execute("SELECT id FROM hospitals")]
+    span = YEARS * 365; total = YEARS * PER_YEAR
+    conn.executemany("INSERT INTO camps (host_id, name, date, time, city, status) VALUES (1, ?, ?, '09:00', 'Chennai', 'Completed')",
+                     ((f'Camp {i}', days_ago(span - i * span // (total // 50))) for i in range(total // 50)))
+    camps = [r[0] for r in conn.execute("SELECT id FROM camps")]
+    # Oldest first, as a real deployment accumulates them
+    conn.executemany("INSERT INTO donations (donor_id, date, volume_ml, hospital, status) VALUES (?, ?, 450, 'MIOT International', 'Approved')",
+                     ((donors[i % len(donors)], days_ago(span - i * span // total)) for i in range(total)))
+    conn.executemany("INSERT INTO appointments (donor_id, hospital_id, date, time_slot, status) VALUES (?, ?, ?, '10:00 AM', 'Verified')",
+                     ((donors[i % len(donors)], hospitals[i % len(hospitals)], days_ago(span - i * span // total)) for i in range(total)))
+    conn.executemany("INSERT OR IGNORE INTO camp_registrations (camp_id, donor_id, booking_date) VALUES (?, ?, ?)",
+                     ((camps[i // 50], donors[i % len(donors)], days_ago(0)) for i in range(total)))
+    conn.commit(); conn.close()
+    client = app.app.test_client(); login(client, 'admin', 1, 'Admin')
+    print(f"{YEARS} years x {PER_YEAR} donations, appointments and camp registrations; horizon {app.ARCHIVE_HORIZON_DAYS} days")
+
+    before = measure(app, client)
+    conn = app.get_db_connection()
+    with Timer() as t: moved = app.archive_history(conn, app.current_archive())
+    conn.close()
+    after = measure(app, client)
+    rows = sum(moved.values())
+    print(f"Archived {rows} rows in {t.elapsed:.2f}s ({rows / t.elapsed:,.0f} rows/s)")
+    print(f"{'':<26} {'before':>10} {'after':>10}")
+    for key, label, fmt in [('rows', 'hot history rows', '{:>10,}'), ('size_mb', 'hot database (MB)', '{:>10.1f}'),
+                            ('homepage', 'homepage aggregates (ms)', '{:>10.2f}'), ('admin', 'GET /admin (ms)', '{:>10.2f}'),
+                            ('snapshot', 'snapshot refresh (ms)', '{:>10.0f}')]:
+        print(f"{label:<26} " + fmt.format(before[key]) + ' ' + fmt.format(after[key]))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Benchmark: public read APIs under slow-client load, threaded Flask server vs ASGI mode.
+
+Starts each server in a throwaway directory and holds SLOW_CLIENTS connections open. Each
+one trickles request headers one line per second, as a slow mobile client or a slowloris
+attack would. Meanwhile FAST_CLIENTS keep-alive clients hammer /api/blood-stock and the
+homepage. Reports fast-client throughput and latency, failures, and the server's thread
+count and RSS.
+
+Needs httpx: pip install -r requirements-dev.txt
+
+Usage: python benchmarks/bench_asgi.py [slow_clients] [fast_clients] [seconds]"""
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+from common import REPO_ROOT
+
+SLOW_CLIENTS = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+FAST_CLIENTS = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+SECONDS = float(sys.argv[3]) if len(sys.argv) > 3 else 10
+PATHS = ['/api/blood-stock', '/']
+
+SERVERS = {
+    'threaded Flask': [sys.executable, '-c', f"import sys; sys.path.insert(0, {REPO_ROOT!r}); import app; app.app.run(port={{port}}, threaded=True)"],
+    'ASGI (uvicorn)': [sys.executable, '-m', 'uvicorn', 'asgi:application', '--app-dir', REPO_ROOT, '--port', '{port}', '--log-level', 'warning', '--no-access-log'],
+}
+
+def free_port():
+    with socket.socket() as s: s.bind(('127.0.0.1', 0)); return s.getsockname()[1]
+
+def proc_stats(pid):
+    fields = dict(line.split(':', 1) for line in open(f'/proc/{pid}/status'))
+    return int(fields['Threads'].strip()), int(fields['VmRSS'].split()[0]) // 1024
+
+async def wait_ready(port):
+    async with httpx.AsyncClient() as client:
+        for _ in range(100):
+            try: await client.get(f'http://127.0.0.1:{port}/api/blood-stock'); return
+            except httpx.HTTPError: await asyncio.sleep(0.2)
+    raise RuntimeError('server did not start')
+
+async def slow_client(port, stop):
+    try:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(b'GET /api/blood-stock HTTP/1.1\r\nHost: bench\r\n'); await writer.drain()
+        while not stop.is_set():
+            await asyncio.sleep(1); writer.write(b'X-Slow: 1\r\n'); await writer.drain()
+        writer.close()
+    except OSError: pass
+
+async def fast_client(port, stop, latencies, failures):
+    async with httpx.AsyncClient(base_url=f'http://127.0.0.1:{port}', timeout=10) as client:
+        i = 0
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                r = await client.get(PATHS[i % len(PATHS)])
+                if r.status_code == 200: latencies.append(time.perf_counter() - started)
+                else: failures.append(r.status_code)
+            except httpx.HTTPError as e: failures.append(type(e).__name__)
+            i += 1
+
+async def run(name, command):
+    port = free_port(); workdir = tempfile.mkdtemp(prefix='lifeflow_bench_')
+    server = subprocess.Popen([part.format(port=port) for part in command], cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                              env=dict(os.environ, LIFEFLOW_PUBLIC_RATE='0')) # All fast clients share one IP
+    try:
+        await wait_ready(port)
+        stop = asyncio.Event(); latencies = []; failures = []
+        slow = [asyncio.create_task(slow_client(port, stop)) for _ in range(SLOW_CLIENTS)]
+        await asyncio.sleep(2) # Let the slow connections pile up first
+        fast = [asyncio.create_task(fast_client(port, stop, latencies, failures)) for _ in range(FAST_CLIENTS)]
+        await asyncio.sleep(SECONDS)
+        threads, rss = proc_stats(server.pid)
+        stop.set(); await asyncio.gather(*fast, *slow)
+    finally:
+        server.terminate(); server.wait()
+    latencies.sort()
+    p50 = statistics.median(latencies) * 1000 if latencies else float('nan')
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else float('nan')
+    print(f"{name:<16} {len(latencies) / SECONDS:>8.0f} {p50:>9.1f} {p99:>9.1f} {len(failures):>9} {threads:>8} {rss:>8}")
+
+async def main():
+    print(f"{SLOW_CLIENTS} slow clients, {FAST_CLIENTS} fast keep-alive clients, {SECONDS:.0f}s, {os.cpu_count()} CPU(s)")
+    print(f"{'server':<16} {'req/s':>8} {'p50 ms':>9} {'p99 ms':>9} {'failures':>9} {'threads':>8} {'RSS MiB':>8}")
+    for name, command in SERVERS.items(): await run(name, command)
+
+if __name__ == '__main__':
+    asyncio.run(main())
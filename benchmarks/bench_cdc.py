@@ -0,0 +1,65 @@
+"""Benchmark: what the change-data capture triggers cost writers, and how fast the feed drains.
+
+Inserts and then updates ROWS donations with the CDC triggers dropped and again with them
+in place, one transaction each, and reports the write overhead. Then pulls the logged
+changes through GET /api/changes in batches of BATCH (acknowledging each one, which
+compacts the log as it goes) and reports changes/s, comparing against a full rescan
+of the table, which is what a replica had to do without the feed. Runs with LIFEFLOW_CDC=1,
+since the triggers are only installed when the feed is enabled.
+
+Usage: python benchmarks/bench_cdc.py [rows] [batch]"""
+import os
+import sys
+from common import load_app, login, seed_donors, days_ago, Timer
+
+ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+BATCH = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+def write(conn, donors):
+    with Timer() as t:
+        conn.executemany("INSERT INTO donations (donor_id, date, volume_ml, hospital, status) VALUES (?, ?, 450, 'MIOT International', 'Pending')",
+                         ((donors[i % len(donors)], days_ago(i % 700)) for i in range(ROWS)))
+        conn.execute("UPDATE donations SET status = 'Approved' WHERE status = 'Pending'")
+        conn.commit()
+    conn.execute("DELETE FROM donations"); conn.commit()
+    return t.elapsed
+
+def main():
+    os.environ['LIFEFLOW_CDC'] = '1'
+    app = load_app()
+    app.db_metrics.registry.slow_query_seconds = float('inf')
+    conn = app.get_db_connection()
+    seed_donors(conn, 2000)
+    donors = [r[0] for r in conn.execute("SELECT id FROM donors WHERE role = 'user'")]
+    triggers = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'cdc_donations_%'").fetchall()
+    for t in triggers: conn.execute(f"DROP TRIGGER {t['name']}")
+    plain = write(conn, donors)
+    for t in triggers: conn.execute(t['sql'])
+    conn.execute("DELETE FROM change_log"); conn.commit()
+    client = app.app.test_client(); login(client, 'admin', 1, 'Admin')
+    client.post('/api/changes/register', json={'consumer': 'bench'})
+    logged = write(conn, donors)
+    conn.executemany("INSERT INTO donations (donor_id, date, volume_ml, hospital, status) VALUES (?, ?, 450, 'MIOT International', 'Approved')",
+                     ((donors[i % len(donors)], days_ago(i % 700)) for i in range(ROWS)))
+    conn.commit()
+    with Timer() as rescan: conn.execute("SELECT * FROM donations").fetchall()
+    pending = conn.execute("SELECT COUNT(*) FROM change_log").fetchone()[0]
+    conn.close()
+
+    pulled = 0
+    with Timer() as drain:
+        while True:
+            batch = client.get(f'/api/changes?consumer=bench&limit={BATCH}').get_json()
+            pulled += len(batch['changes'])
+            client.post('/api/changes/ack', json={'consumer': 'bench', 'seq': batch['next_cursor']})
+            if not batch['has_more']: break
+    conn = app.get_db_connection(); left = conn.execute("SELECT COUNT(*) FROM change_log").fetchone()[0]; conn.close()
+
+    print(f"{ROWS} donations inserted then approved (2 x {ROWS} row writes)")
+    print(f"{'without CDC triggers':<28} {plain:7.2f}s")
+    print(f"{'with CDC triggers':<28} {logged:7.2f}s  (+{(logged / plain - 1):.0%})")
+    print(f"Drained {pulled} of {pending} changes in batches of {BATCH}: {drain.elapsed:.2f}s ({pulled / drain.elapsed:,.0f} changes/s), {left} left after compaction")
+    print(f"Full rescan of {ROWS} donations: {rescan.elapsed * 1000:.0f} ms, repeated on every sync without the feed")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""Benchmark: certificates for a whole camp, one request per donor vs one batch download.
+
+Seeds a camp with CAMP_SIZE registered donors. Times the old way (GET /certificate/donation/<id>
+for every donor, each a separate FPDF render) against GET /host/certificates/<camp>
+as a streamed ZIP and as one multi-page PDF, rendered inline and in the process pool.
+Reports certificates per second.
+
+Usage: python benchmarks/bench_certificates.py [camp_size] [workers]"""
+import os
+import sys
+from common import load_app, login, seed_donors, days_ago, Timer
+
+CAMP_SIZE = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+WORKERS = int(sys.argv[2]) if len(sys.argv) > 2 else (os.cpu_count() or 1)
+
+def main():
+    app = load_app()
+    app.db_metrics.registry.slow_query_seconds = float('inf')
+    conn = app.get_db_connection()
+    seed_donors(conn, CAMP_SIZE)
+    host_id = conn.execute("INSERT INTO camp_hosts (organization_name, leader_name, email, phone, password, city) VALUES ('Bench Org', 'Lead', 'org@bench.local', '900', 'x', 'Chennai')").lastrowid
+    camp_id = conn.execute("INSERT INTO camps (host_id, name, date, time, location_name, city) VALUES (?, 'Bench Camp', ?, '09:00', 'Town Hall', 'Chennai')", (host_id, days_ago(1))).lastrowid
+    donors = conn.execute("SELECT id, name FROM donors WHERE role = 'user'").fetchall()
+    conn.executemany("INSERT INTO camp_registrations (camp_id, donor_id, booking_date) VALUES (?, ?, ?)", ((camp_id, d['id'], days_ago(5)) for d in donors))
+    # The single-certificate route only knows donations and appointments, so each donor also gets a donation to fetch
+    conn.executemany("INSERT INTO donations (donor_id, date, volume_ml, hospital, status) VALUES (?, ?, 450, 'Bench Camp', 'Approved')", ((d['id'], days_ago(1)) for d in donors))
+    donations = conn.execute("SELECT d.id, d.donor_id, u.name FROM donations d JOIN donors u ON d.donor_id = u.id").fetchall()
+    conn.commit(); conn.close()
+    client = app.app.test_client()
+    print(f"Camp of {CAMP_SIZE} donors, {WORKERS} pool worker(s), {os.cpu_count()} CPU(s)")
+
+    with Timer() as t:
+        for d in donations:
+            login(client, 'user', d['donor_id'], d['name']); client.get(f"/certificate/donation/{d['id']}").get_data()
+    results = [('One GET /certificate per donor', t.elapsed)]
+
+    login(client, 'host', host_id, 'Bench Org')
+    for workers, label in ((0, 'inline'), (WORKERS, f'pool x{WORKERS}')):
+        app.CERTIFICATE_WORKERS = workers
+        for fmt, name in (('zip', 'streamed ZIP'), ('pdf', 'multi-page PDF')):
+            with Timer() as t: body = client.get(f"/host/certificates/{camp_id}?format={fmt}").get_data()
+            results.append((f"Batch {name}, {label} ({len(body) / 2 ** 20:.1f} MB)", t.elapsed))
+
+    for label, seconds in results:
+        print(f"{label:<44} {seconds:7.2f}s {CAMP_SIZE / seconds:9,.0f} certificates/s")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""Benchmark: an emergency traffic spike on /public_sos and /api/blood-stock.
+
+CLIENTS threads (one simulated IP each) fire SOS searches for O+ from coordinates
+scattered around one neighbourhood, and map loads. Meanwhile a hospital keeps loading
+its dashboard. Runs once with single-flight coalescing disabled and once enabled, and
+reports public requests/s, SQL statements executed and the hospital's latency. A final
+pass drives one IP past its token bucket to show the 429s.
+
+Usage: python benchmarks/bench_coalescing.py [clients] [requests_per_client] [donors]"""
+import random
+import statistics
+import sys
+import threading
+from common import load_app, login, seed_donors, Timer
+
+CLIENTS = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+REQUESTS = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+DONORS = int(sys.argv[3]) if len(sys.argv) > 3 else 50000
+
+def spike(app, coalesce):
+    original = app.public_reads.do
+    if not coalesce: app.public_reads.do = lambda key, fn: fn()
+    app.db_metrics.registry.reset()
+    stop = threading.Event(); hospital_times = []
+    def hospital():
+        client = app.app.test_client(); login(client, 'hospital', 1, 'Apollo Hospital')
+        while not stop.is_set():
+            with Timer() as t: client.get('/hospital/dashboard')
+            hospital_times.append(t.elapsed)
+    def public(i):
+        client = app.app.test_client(); client.environ_base['REMOTE_ADDR'] = f'10.0.{i // 250}.{i % 250}'
+        for n in range(REQUESTS):
+            if n % 2: client.get('/api/blood-stock')
+            else: client.post('/public_sos', data={'blood_group': 'O+', 'lat': 13.0815 + random.uniform(-0.004, 0.004), 'lng': 80.2768 + random.uniform(-0.004, 0.004)})
+    watcher = threading.Thread(target=hospital); watcher.start()
+    threads = [threading.Thread(target=public, args=(i,)) for i in range(CLIENTS)]
+    with Timer() as wall:
+        for t in threads: t.start()
+        for t in threads: t.join()
+    stop.set(); watcher.join()
+    app.public_reads.do = original
+    queries = sum(int(line.rsplit(' ', 1)[1]) for line in app.db_metrics.registry.render_prometheus().splitlines()
+                  if line.startswith('lifeflow_sql_query_duration_seconds_count') and ('route="public_sos"' in line or 'route="get_map"' in line))
+    p50 = statistics.median(hospital_times) * 1000
+    print(f"{'on' if coalesce else 'off':<11} {CLIENTS * REQUESTS / wall.elapsed:>10.0f} {queries:>12} {p50:>15.1f} {max(hospital_times) * 1000:>15.1f}")
+
+def main():
+    app = load_app()
+    app.db_metrics.registry.slow_query_seconds = float('inf')
+    conn = app.get_db_connection(); seed_donors(conn, DONORS); conn.close()
+    print(f"{CLIENTS} clients x {REQUESTS} requests, {DONORS} donors")
+    print(f"{'coalescing':<11} {'public rps':>10} {'SQL stmts':>12} {'hospital p50 ms':>15} {'hospital max ms':>15}")
+    spike(app, coalesce=False)
+    spike(app, coalesce=True)
+
+    from traffic_control import SharedTokenBucket
+    app.public_limiter = SharedTokenBucket(app.PUBLIC_RATE or 5, app.PUBLIC_BURST, app.public_limiter.path if app.public_limiter else 'bench_ratelimit.bin')
+    client = app.app.test_client(); client.environ_base['REMOTE_ADDR'] = '10.9.9.9'
+    codes = [client.get('/api/blood-stock').status_code for _ in range(200)]
+    print(f"Rate limiter: one IP, 200 back-to-back map loads -> {codes.count(200)} served, {codes.count(429)} rejected with 429")
+
+if __name__ == '__main__':
+    main()
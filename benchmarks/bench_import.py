@@ -0,0 +1,49 @@
+"""Benchmark: streaming bulk import throughput and peak memory.
+
+Writes a synthetic donors CSV (and a matching donations CSV), imports both with
+bulk_import.import_csv and reports rows/s and peak RSS. Hashing uses a cheap
+PBKDF2 setting by default so the run measures the pipeline, not scrypt.
+
+Usage: python benchmarks/bench_import.py [rows] [--hash-method pbkdf2:sha256:1000]"""
+import argparse
+import csv
+import os
+import random
+import resource
+import sqlite3
+from common import load_app, BLOOD_GROUPS, days_ago
+
+def write_csvs(rows, workdir):
+    donors_path = os.path.join(workdir, 'donors.csv'); donations_path = os.path.join(workdir, 'donations.csv')
+    with open(donors_path, 'w', newline='') as f:
+        w = csv.writer(f); w.writerow(['name', 'email', 'phone', 'password', 'blood_group', 'city', 'age', 'weight', 'address'])
+        for i in range(rows):
+            age = 17 if i % 1000 == 999 else 20 + i % 40 # Sprinkle in invalid rows so error reporting is exercised
+            w.writerow([f'Legacy Donor {i}', f'legacy{i}@partner.org', f'8{i:09d}', f'pw{i}', random.choice(BLOOD_GROUPS), 'Chennai', age, 60, 'Partner Bank'])
+    with open(donations_path, 'w', newline='') as f:
+        w = csv.writer(f); w.writerow(['donor_phone', 'date', 'volume_ml', 'hospital'])
+        for i in range(rows):
+            w.writerow([f'8{i:09d}', days_ago(random.randint(100, 2000)), 450, 'Rotary Central Blood Bank'])
+    return donors_path, donations_path
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('rows', nargs='?', type=int, default=50000)
+    parser.add_argument('--hash-method', default='pbkdf2:sha256:1000')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    app = load_app()
+    from bulk_import import import_csv
+    donors_path, donations_path = write_csvs(args.rows, os.getcwd())
+    conn = sqlite3.connect('bloodbank.db', isolation_level=None)
+    for kind, path in (('donors', donors_path), ('donations', donations_path)):
+        with open(path, newline='') as f:
+            report = import_csv(conn, kind, f, workers=args.workers, hash_method=args.hash_method)
+        print(report.summary())
+    conn.close()
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"Peak RSS (parent process): {peak_mb:.1f} MB")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+"""Benchmark: request latency with query instrumentation enabled vs disabled.
+
+Usage: python benchmarks/bench_instrumentation.py [requests] [donors]"""
+import sys
+from common import load_app, seed_donors, Timer
+
+REQUESTS = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+DONORS = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+PATHS = ['/', '/api/blood-stock']
+
+def run(client):
+    with Timer() as t:
+        for i in range(REQUESTS):
+            client.get(PATHS[i % len(PATHS)])
+    return t.elapsed
+
+def main():
+    app = load_app()
+    conn = app.get_db_connection(); seed_donors(conn, DONORS); conn.close()
+    client = app.app.test_client()
+    run(client) # Warm-up (template compilation, page cache)
+
+    results = {}
+    for enabled in (False, True, False, True):
+        app.db_metrics.registry.enabled = enabled
+        results.setdefault(enabled, []).append(run(client))
+    off, on = min(results[False]), min(results[True])
+    print(f"{REQUESTS} requests over {PATHS}")
+    print(f"Instrumentation off: {off * 1000 / REQUESTS:7.3f} ms/request")
+    print(f"Instrumentation on:  {on * 1000 / REQUESTS:7.3f} ms/request")
+    print(f"Overhead:            {(on - off) / off * 100:7.2f} %")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Benchmark: homepage/map stock totals from the full donation history vs the inventory ledger.
+
+Seeds three years of approved donations plus a busy external-stock ledger, then times
+the old per-hospital COUNT over donations against stock_levels() before and after a
+balance snapshot, and the batch expiry sweep.
+
+Usage: python benchmarks/bench_inventory.py [donations] [ledger_movements]"""
+import random
+import sys
+from datetime import date, timedelta
+from common import load_app, seed_donors, days_ago, Timer, BLOOD_GROUPS
+
+DONATIONS = int(sys.argv[1]) if len(sys.argv) > 1 else 300000
+MOVEMENTS = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+OLD_MAP_QUERY = '''SELECT h.id, (SELECT COUNT(*) FROM donations d WHERE d.hospital = h.name AND d.status = 'Approved') as internal_stock,
+                   IFNULL((SELECT SUM(units) FROM hospital_stock hs WHERE hs.hospital_id = h.id), 0) as external_stock FROM hospitals h'''
+
+def best_of(fn, runs=5):
+    times = []
+    for _ in range(runs):
+        with Timer() as t: fn()
+        times.append(t.elapsed)
+    return min(times) * 1000
+
+def main():
+    app = load_app()
+    app.db_metrics.registry.slow_query_seconds = float('inf')
+    import inventory
+    conn = app.get_db_connection()
+    seed_donors(conn, 5000)
+    donor_ids = [r[0] for r in conn.execute("SELECT id FROM donors WHERE role = 'user'")]
+    hospitals = conn.execute("SELECT id, name FROM hospitals").fetchall()
+    with Timer() as seed:
+        conn.executemany("INSERT INTO donations (donor_id, date, volume_ml, hospital, status) VALUES (?, ?, 450, ?, 'Approved')",
+                         ((random.choice(donor_ids), days_ago(random.randint(0, 1095)), random.choice(hospitals)['name']) for _ in range(DONATIONS)))
+        for i in range(MOVEMENTS):
+            h = random.choice(hospitals)['id']; bg = random.choice(BLOOD_GROUPS)
+            if i % 3: inventory.receive_units(conn, h, bg, random.randint(1, 10), (date.today() - timedelta(days=random.randint(0, 60))).isoformat())
+            else: inventory.issue_units(conn, h, bg, random.randint(1, 10))
+        conn.commit()
+    ledger = conn.execute("SELECT COUNT(*) FROM inventory_movements").fetchone()[0]
+    print(f"Seeded {DONATIONS} donations and {ledger} ledger rows in {seed.elapsed:.1f}s")
+
+    old = best_of(lambda: conn.execute(OLD_MAP_QUERY).fetchall())
+    no_snapshot = best_of(lambda: inventory.stock_levels(conn))
+    with Timer() as sweep: lots, units = inventory.sweep_expired(conn)
+    with Timer() as snap: inventory.take_snapshot(conn)
+    for _ in range(200): inventory.receive_units(conn, random.choice(hospitals)['id'], random.choice(BLOOD_GROUPS), 2)
+    conn.commit()
+    with_snapshot = best_of(lambda: inventory.stock_levels(conn))
+    conn.close()
+    print(f"Old full-history stock query:       {old:8.2f} ms")
+    print(f"Ledger, no snapshot (full scan):     {no_snapshot:8.2f} ms")
+    print(f"Ledger, snapshot + 200-row delta:    {with_snapshot:8.2f} ms")
+    print(f"Expiry sweep: {units} units in {lots} lots, {sweep.elapsed:.2f}s; snapshot {snap.elapsed * 1000:.0f} ms")
+
+if __name__ == '__main__':
+    main()
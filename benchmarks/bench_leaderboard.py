@@ -0,0 +1,51 @@
+"""Benchmark: homepage Hall of Fame and leaderboard API as donation history grows.
+
+Compares the old GROUP BY over every approved donation with the trigger-maintained
+donor_totals table, at several history sizes, for the global top 3 and a filtered
+(city + blood group, current month) leaderboard page.
+
+Usage: python benchmarks/bench_leaderboard.py [donors] [max_donations]"""
+import random
+import sys
+from common import load_app, login, seed_donors, days_ago, Timer
+
+DONORS = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+MAX_DONATIONS = int(sys.argv[2]) if len(sys.argv) > 2 else 400000
+CITIES = ['Chennai', 'Madurai', 'Salem', 'Vellore']
+OLD_HALL_OF_FAME = '''SELECT d.name, d.blood_group, SUM(dn.volume_ml) as total_volume
+                      FROM donors d JOIN donations dn ON d.id = dn.donor_id WHERE dn.status = 'Approved'
+                      GROUP BY d.id ORDER BY total_volume DESC, d.name ASC LIMIT 3'''
+
+def best_of(fn, runs=5):
+    times = []
+    for _ in range(runs):
+        with Timer() as t: fn()
+        times.append(t.elapsed)
+    return min(times) * 1000
+
+def main():
+    app = load_app()
+    app.db_metrics.registry.slow_query_seconds = float('inf') # The old query is slow on purpose
+    from leaderboards import leaderboard_query
+    conn = app.get_db_connection()
+    seed_donors(conn, DONORS)
+    conn.executemany("UPDATE donors SET city = ? WHERE id % ? = ?", [(city, len(CITIES), i) for i, city in enumerate(CITIES)]); conn.commit()
+    donor_ids = [r[0] for r in conn.execute("SELECT id FROM donors WHERE role = 'user'")]
+    client = app.app.test_client(); login(client, 'user', donor_ids[0], 'Bench')
+
+    print(f"{'donations':>10} {'insert/s':>9} {'old top3 ms':>12} {'new top3 ms':>12} {'API page ms':>12}")
+    loaded = 0; step = MAX_DONATIONS // 4
+    while loaded < MAX_DONATIONS:
+        rows = [(random.choice(donor_ids), days_ago(random.randint(0, 1500)), random.choice([350, 450]), 'Bench Hospital', 'Approved') for _ in range(step)]
+        with Timer() as ins:
+            conn.executemany("INSERT INTO donations (donor_id, date, volume_ml, hospital, status) VALUES (?, ?, ?, ?, ?)", rows); conn.commit()
+        loaded += step
+        sql, params = leaderboard_query('all')
+        old = best_of(lambda: conn.execute(OLD_HALL_OF_FAME).fetchall())
+        new = best_of(lambda: conn.execute(f"{sql} LIMIT 3", params).fetchall())
+        api = best_of(lambda: client.get('/api/leaderboard?window=month&city=Chennai&blood_group=O%2B&page=2'))
+        print(f"{loaded:>10} {step / ins.elapsed:>9.0f} {old:>12.2f} {new:>12.3f} {api:>12.2f}")
+    conn.close()
+
+if __name__ == '__main__':
+    main()
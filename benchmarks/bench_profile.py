@@ -0,0 +1,73 @@
+"""Benchmark: donor profile page cost as one donor's history grows.
+
+Gives a single donor HISTORY hospital appointments, camp registrations and logged
+donations, spread over many years. Times the old five-query profile load (full
+booking and donation lists merged and sorted in Python, plus the whole hospitals
+table) against one keyset-paged timeline query and the cached hospital list, then times
+a full GET /profile.
+
+Usage: python benchmarks/bench_profile.py [history] [hospitals]"""
+import sys
+from common import load_app, login, seed_donors, days_ago, Timer
+
+HISTORY = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+HOSPITALS = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+def old_profile(conn, donor_id):
+    appointments = conn.execute("SELECT a.id, a.date, a.time_slot, a.status, h.name as location_name, 'Hospital' as type FROM appointments a JOIN hospitals h ON a.hospital_id = h.id WHERE a.donor_id = ?", (donor_id,)).fetchall()
+    camp_bookings = conn.execute("SELECT cr.id, c.date, c.time as time_slot, cr.status, c.name as location_name, 'Camp' as type FROM camp_registrations cr JOIN camps c ON cr.camp_id = c.id WHERE cr.donor_id = ?", (donor_id,)).fetchall()
+    sorted(appointments + camp_bookings, key=lambda x: x['date'], reverse=True)
+    conn.execute('''SELECT id, date, volume_ml, hospital, status, 'Manual' as source FROM donations WHERE donor_id = ?
+                    UNION ALL SELECT a.id, a.date, 450 as volume_ml, h.name as hospital, a.status, 'Appointment' as source
+                    FROM appointments a JOIN hospitals h ON a.hospital_id = h.id WHERE a.donor_id = ? AND a.status = 'Verified'
+                    ORDER BY date DESC''', (donor_id, donor_id)).fetchall()
+    conn.execute("SELECT * FROM hospitals").fetchall()
+
+def new_profile(app, conn, donor_id, before=None):
+    app.donor_timeline(conn, donor_id, before)
+    app.get_hospital_list()
+
+def best_of(fn, runs=5):
+    times = []
+    for _ in range(runs):
+        with Timer() as t: fn()
+        times.append(t.elapsed)
+    return min(times) * 1000
+
+def main():
+    app = load_app()
+    app.db_metrics.registry.slow_query_seconds = float('inf')
+    conn = app.get_db_connection()
+    seed_donors(conn, 2000)
+    conn.executemany("INSERT INTO hospitals (name, email, password, lat, lng, type) VALUES (?, ?, 'x', 13.0, 80.2, 'Private')",
+                     ((f'Bench Hospital {i}', f'h{i}@bench.local') for i in range(HOSPITALS)))
+    donor = conn.execute("SELECT id, name FROM donors WHERE role = 'user' LIMIT 1").fetchone()
+    others = [r[0] for r in conn.execute("SELECT id FROM donors WHERE role = 'user' AND id != ?", (donor['id'],))]
+    conn.executemany("INSERT INTO camps (host_id, name, date, time, city) VALUES (1, ?, ?, '09:00', 'Chennai')", ((f'Camp {i}', days_ago(i % 4000)) for i in range(HISTORY)))
+    for donor_id in [donor['id']] + others[:200]: # Background donors so every index also holds other people's rows
+        n = HISTORY if donor_id == donor['id'] else 50
+        conn.executemany("INSERT INTO appointments (donor_id, hospital_id, date, time_slot, status) VALUES (?, ?, ?, '10:00 AM', ?)",
+                         ((donor_id, 1 + i % 5, days_ago(i % 4000), 'Verified' if i % 3 else 'Scheduled') for i in range(n)))
+        conn.executemany("INSERT INTO donations (donor_id, date, volume_ml, hospital, status) VALUES (?, ?, 450, 'MIOT International', 'Approved')",
+                         ((donor_id, days_ago(i % 4000 + 1)) for i in range(n)))
+        conn.executemany("INSERT OR IGNORE INTO camp_registrations (camp_id, donor_id, booking_date) VALUES (?, ?, ?)",
+                         ((1 + i, donor_id, days_ago(0)) for i in range(n)))
+    conn.commit()
+    print(f"One donor with {HISTORY} appointments, {HISTORY} camp registrations and {HISTORY} donations; {HOSPITALS} hospitals")
+    params = {'donor': donor['id'], 'date': '\uffff', 'type': '\uffff', 'id': 0, 'limit': 21}
+    for row in conn.execute(f"EXPLAIN QUERY PLAN {app.DONOR_TIMELINE_SQL}", params): print('  plan:', row[3])
+
+    old = best_of(lambda: old_profile(conn, donor['id']))
+    first = best_of(lambda: new_profile(app, conn, donor['id']))
+    deep = best_of(lambda: new_profile(app, conn, donor['id'], f"{days_ago(3000)}~Hospital~{2 ** 62}"))
+    client = app.app.test_client(); login(client, 'user', donor['id'], donor['name'])
+    client.get('/profile')
+    page = best_of(lambda: client.get('/profile'))
+    conn.close()
+    print(f"Old five-query profile load:      {old:9.2f} ms")
+    print(f"Timeline newest page + cache:     {first:9.2f} ms")
+    print(f"Timeline 8 years back + cache:    {deep:9.2f} ms")
+    print(f"GET /profile (page 1, rendered):  {page:9.2f} ms")
+
+if __name__ == '__main__':
+    main()
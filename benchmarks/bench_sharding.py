@@ -0,0 +1,83 @@
+"""Benchmark: write throughput with one SQLite file vs N regional shards.
+
+For each shard count, a fresh worker process creates the shard files and seeds donors
+spread over the shards' cities. WRITERS threads then log donations for random donors
+for SECONDS. Each write is one transaction, with an insert plus the leaderboard and
+inventory triggers. With one file every writer queues on the same write lock; with N
+shards only writers in the same region contend. Reports committed writes per second
+and writes that gave up on a locked database. A scatter-gather read (homepage data
+from every shard) is timed as well.
+
+Usage: python benchmarks/bench_sharding.py [writers] [seconds] [max_shards]"""
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+WRITERS = int(sys.argv[1]) if len(sys.argv) > 1 and sys.argv[1] != '--child' else 8
+SECONDS = float(sys.argv[2]) if len(sys.argv) > 2 and sys.argv[1] != '--child' else 5
+MAX_SHARDS = int(sys.argv[3]) if len(sys.argv) > 3 and sys.argv[1] != '--child' else 4
+CITIES = ['Chennai', 'Coimbatore', 'Madurai', 'Tiruchirappalli', 'Salem', 'Tirunelveli', 'Vellore', 'Erode']
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def child(shard_count, writers, seconds):
+    workdir = tempfile.mkdtemp(prefix='lifeflow_shards_')
+    config = [{'name': city.lower(), 'path': os.path.join(workdir, f'{city.lower()}.db'), 'cities': CITIES[i::shard_count]}
+              for i, city in enumerate(CITIES[:shard_count])]
+    with open(os.path.join(workdir, 'shards.json'), 'w') as f: json.dump(config, f)
+    os.environ['LIFEFLOW_SHARDS'] = os.path.join(workdir, 'shards.json')
+    from common import load_app
+    app = load_app()
+    app.db_metrics.registry.slow_query_seconds = float('inf')
+    donors = []
+    for i, city in enumerate(CITIES):
+        shard = app.shards.shard_for_city(city); conn = app.get_db_connection(shard)
+        before = conn.execute("SELECT COALESCE(MAX(id), 0) FROM donors").fetchone()[0]
+        conn.executemany("INSERT INTO donors (name, phone, city, blood_group, role, password) VALUES (?, ?, ?, 'O+', 'user', 'x')",
+                         ((f'{city} donor {n}', f'{i}{n:08d}', city) for n in range(500)))
+        conn.commit()
+        donors += [(shard, r[0]) for r in conn.execute("SELECT id FROM donors WHERE id > ?", (before,))]
+        conn.close()
+
+    stop = threading.Event(); committed = [0] * writers; locked = [0] * writers
+    def writer(slot):
+        rng = random.Random(slot); conns = {}
+        while not stop.is_set():
+            shard, donor_id = rng.choice(donors)
+            conn = conns.get(shard) or conns.setdefault(shard, app.get_db_connection(shard))
+            try:
+                conn.execute("INSERT INTO donations (donor_id, date, volume_ml, hospital, status) VALUES (?, date('now'), 450, 'Bench Hospital', 'Approved')", (donor_id,))
+                conn.commit(); committed[slot] += 1
+            except sqlite3.OperationalError:
+                conn.rollback(); locked[slot] += 1
+        for conn in conns.values(): conn.close()
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    started = time.perf_counter()
+    for t in threads: t.start()
+    time.sleep(seconds); stop.set()
+    for t in threads: t.join()
+    elapsed = time.perf_counter() - started
+
+    reads = []
+    for _ in range(5):
+        t = time.perf_counter(); app.shards.scatter(app.homepage_shard_data); reads.append(time.perf_counter() - t)
+    print(json.dumps({'writes_per_s': sum(committed) / elapsed, 'locked': sum(locked), 'scatter_read_ms': min(reads) * 1000}))
+
+def main():
+    print(f"{WRITERS} writer threads, {SECONDS:.0f}s per run, {os.cpu_count()} CPU(s)")
+    print(f"{'shards':>7} {'writes/s':>10} {'locked':>8} {'homepage scatter ms':>20}")
+    counts = sorted({1, 2, MAX_SHARDS} | ({4} if MAX_SHARDS > 4 else set()))
+    for shard_count in counts:
+        out = subprocess.run([sys.executable, os.path.join(BENCH_DIR, 'bench_sharding.py'), '--child', str(shard_count), str(WRITERS), str(SECONDS)],
+                             cwd=BENCH_DIR, capture_output=True, text=True, check=True)
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        print(f"{shard_count:>7} {result['writes_per_s']:>10.0f} {result['locked']:>8} {result['scatter_read_ms']:>20.2f}")
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--child']: child(int(sys.argv[2]), int(sys.argv[3]), float(sys.argv[4]))
+    else: main()
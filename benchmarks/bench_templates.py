@@ -0,0 +1,67 @@
+"""Benchmark: worker first-request latency (Jinja bytecode cache cold vs warm) and
+admin dashboard render cost with every row rendered vs paged chunked tables.
+
+Usage: python benchmarks/bench_templates.py [donors]"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from common import load_app, login, seed_donors, days_ago, Timer
+
+DONORS = int(sys.argv[1]) if len(sys.argv) > 1 and sys.argv[1] != '--child' else 5000
+PAGES = ['/', '/login', '/admin', '/public_sos']
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def child():
+    """Runs in a fresh interpreter, like a newly started worker: times the first hit on each page."""
+    import time
+    started = time.perf_counter()
+    app = load_app()
+    import_s = time.perf_counter() - started
+    client = app.app.test_client(); login(client, 'admin', 1, 'Super Admin')
+    first = {}
+    for path in PAGES:
+        t = time.perf_counter(); client.get(path); first[path] = time.perf_counter() - t
+    print(json.dumps({'import_s': import_s, 'first': first}))
+
+def spawn_worker(cache_dir):
+    env = dict(os.environ, LIFEFLOW_JINJA_CACHE=cache_dir)
+    out = subprocess.run([sys.executable, os.path.join(BENCH_DIR, 'bench_templates.py'), '--child'], env=env, cwd=BENCH_DIR, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def render_cost(app, client, page_size, repeat=5):
+    app.app.config['ADMIN_PAGE_SIZE'] = page_size
+    best = None
+    for _ in range(repeat):
+        app.db_metrics.registry.reset()
+        with Timer() as t: res = client.get('/admin')
+        best = t.elapsed if best is None else min(best, t.elapsed)
+    return best, len(res.data)
+
+def main():
+    cache_dir = tempfile.mkdtemp(prefix='lifeflow_jinja_')
+    cold = spawn_worker(cache_dir) # Empty cache: templates are parsed and compiled (the pre-cache behaviour)
+    warm = spawn_worker(cache_dir) # Second worker loads compiled bytecode written by the first
+    print("First request per page in a fresh worker (ms):")
+    print(f"  {'page':<14}{'cold cache':>12}{'warm cache':>12}")
+    for path in PAGES:
+        print(f"  {path:<14}{cold['first'][path] * 1000:12.1f}{warm['first'][path] * 1000:12.1f}")
+    print(f"  {'total':<14}{sum(cold['first'].values()) * 1000:12.1f}{sum(warm['first'].values()) * 1000:12.1f}")
+
+    app = load_app()
+    conn = app.get_db_connection()
+    seed_donors(conn, DONORS)
+    conn.executemany("INSERT INTO appointments (donor_id, hospital_id, date, time_slot, status) VALUES (?, 1, ?, '10:00 AM', ?)",
+                     [(i, days_ago(i % 300), 'Verified' if i % 2 else 'Scheduled') for i in range(2, DONORS + 2)])
+    conn.commit(); conn.close()
+    client = app.app.test_client(); login(client, 'admin', 1, 'Super Admin')
+    client.get('/admin')
+    everything = render_cost(app, client, 10 ** 9)
+    paged = render_cost(app, client, 50)
+    print(f"\n/admin with {DONORS} donors and {DONORS} appointments:")
+    print(f"  all rows rendered:  {everything[0] * 1000:8.1f} ms  {everything[1] / 1024:9.1f} KiB")
+    print(f"  paged (50 / table): {paged[0] * 1000:8.1f} ms  {paged[1] / 1024:9.1f} KiB")
+
+if __name__ == '__main__':
+    child() if '--child' in sys.argv else main()
@@ -0,0 +1,49 @@
+"""Benchmark: verifying 1,000 queued appointments one request at a time vs one batch request.
+
+Usage: python benchmarks/bench_verify.py [count]"""
+import sys
+from common import load_app, login, seed_donors, days_ago, Timer
+
+COUNT = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+def seed_queue(app, hospital_id):
+    conn = app.get_db_connection()
+    conn.execute("DELETE FROM appointments")
+    conn.execute("DELETE FROM donations")
+    donor_ids = [r[0] for r in conn.execute("SELECT id FROM donors WHERE role = 'user' LIMIT ?", (COUNT,))]
+    conn.executemany("INSERT INTO appointments (donor_id, hospital_id, date, time_slot) VALUES (?, ?, ?, '10:00 AM')",
+                     [(donor_id, hospital_id, days_ago(1)) for donor_id in donor_ids])
+    conn.commit()
+    ids = [r[0] for r in conn.execute("SELECT id FROM appointments ORDER BY id")]
+    conn.close()
+    return ids
+
+def main():
+    app = load_app()
+    conn = app.get_db_connection()
+    seed_donors(conn, COUNT)
+    hosp = conn.execute("SELECT id, name FROM hospitals ORDER BY id LIMIT 1").fetchone()
+    conn.close()
+    client = app.app.test_client()
+    login(client, 'hospital', hosp['id'], hosp['name'])
+
+    ids = seed_queue(app, hosp['id'])
+    with Timer() as single:
+        for appt_id in ids:
+            client.get(f'/hospital/verify/{appt_id}/approve/Appointment')
+
+    ids = seed_queue(app, hosp['id'])
+    with Timer() as batch:
+        res = client.post('/hospital/verify_batch', json={'items': [{'id': i, 'type': 'Appointment', 'action': 'approve'} for i in ids]})
+    assert res.get_json()['applied'] == len(ids), res.get_json()
+
+    conn = app.get_db_connection()
+    donations = conn.execute("SELECT COUNT(*) FROM donations").fetchone()[0]
+    conn.close()
+    print(f"Verifications:      {len(ids)} (donations created by batch: {donations})")
+    print(f"One at a time:      {single.elapsed:8.3f} s  ({len(ids) / single.elapsed:8.1f} / s)")
+    print(f"Single batch:       {batch.elapsed:8.3f} s  ({len(ids) / batch.elapsed:8.1f} / s)")
+    print(f"Speed-up:           {single.elapsed / batch.elapsed:8.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""Shared helpers for the LifeFlow benchmark scripts.
+
+Every benchmark runs against a throwaway copy of the app inside a temporary
+directory, so the real bloodbank.db is never touched."""
+import os
+import sys
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BLOOD_GROUPS = ['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-']
+
+def load_app():
+    """Imports app.py from inside a fresh temp directory (init_db() creates an empty bloodbank.db there)."""
+    workdir = tempfile.mkdtemp(prefix='lifeflow_bench_')
+    os.environ.setdefault('LIFEFLOW_PUBLIC_RATE', '0') # Benchmarks drive one client IP far past the public rate limit
+    os.chdir(workdir)
+    if REPO_ROOT not in sys.path: sys.path.insert(0, REPO_ROOT)
+    import app
+    return app
+
+def login(client, role, user_id, name):
+    with client.session_transaction() as s:
+        s['user_id'] = user_id; s['role'] = role; s['name'] = name
+
+def seed_donors(conn, count, city='Chennai', password_hash='x'):
+    rows = [(f'Donor {i}', f'donor{i}@bench.local', 20 + i % 40, 55 + i % 30, random.choice(BLOOD_GROUPS), city, 'Bench Street',
+             f'9{i:09d}', password_hash, 'user', 13.08 + random.uniform(-0.3, 0.3), 80.27 + random.uniform(-0.3, 0.3)) for i in range(count)]
+    conn.executemany("INSERT INTO donors (name, email, age, weight, blood_group, city, address, phone, password, role, lat, lng) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    conn.commit()
+
+def days_ago(n):
+    return (date.today() - timedelta(days=n)).strftime('%Y-%m-%d')
+
+class Timer:
+    def __enter__(self):
+        self.start = time.perf_counter(); return self
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
@@ -0,0 +1,235 @@
+"""Micro-benchmarks for the app's hot functions, with JSON baselines and a regression check.
+
+Each database size runs in its own process against a freshly seeded throwaway app
+(see common.load_app). Every case is timed with timeit-style auto-ranging: the call
+is repeated until one round takes at least MIN_ROUND_SECONDS, and the best of ROUNDS
+rounds is kept as the per-call time.
+
+    python benchmarks/microbench.py run [--sizes small,medium,large] [--cases a,b] [--save NAME]
+    python benchmarks/microbench.py compare BASELINE [CURRENT] [--threshold 0.15]
+    python benchmarks/microbench.py list
+
+`run` writes benchmarks/baselines/NAME.json (default: latest). `compare` reads two of
+those files, prints the ratio for every case and size they share, and exits with
+status 1 if any case got slower than the threshold allows, so it can gate CI. Compare
+files recorded on the same machine: absolute times from different hardware mean nothing."""
+import argparse
+import json
+import os
+import platform
+import random
+import runpy
+import sqlite3
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_DIR = os.path.join(BENCH_DIR, 'baselines')
+ROUNDS = 5
+MIN_ROUND_SECONDS = 0.2
+MAX_CASE_SECONDS = 20 # Slow cases (big PDFs) stop adding rounds after this, with at least 2 rounds
+
+# Donors per database; each donor has two donations and one hospital appointment
+SIZES = {'small': 1000, 'medium': 10000, 'large': 50000}
+
+CASES = {}
+
+def case(name):
+    """Registers a setup function: setup(ctx) -> the zero-argument callable to time."""
+    def register(setup):
+        CASES[name] = setup
+        return setup
+    return register
+
+# =========================================================================
+# CASES
+# =========================================================================
+@case('haversine_python')
+def _haversine_python(ctx):
+    points = ctx['points'][:1000]
+    haversine = ctx['app'].haversine
+    def run():
+        for lat, lng in points: haversine(lat, lng, 13.0827, 80.2707)
+    return run, len(points) # Reported per call
+
+@case('haversine_udf')
+def _haversine_udf(ctx):
+    # The SOS radius filter: the Python UDF evaluated by SQLite for every donor row
+    conn = ctx['conn']
+    return lambda: conn.execute("SELECT COUNT(*) FROM donors WHERE haversine(lat, lng, 13.0827, 80.2707) < 10").fetchone(), 1
+
+@case('check_eligibility')
+def _check_eligibility(ctx):
+    app, donors = ctx['app'], ctx['donor_ids'][:200]
+    def run():
+        for donor_id in donors: app.check_eligibility(donor_id)
+    return run, len(donors)
+
+@case('index_aggregates')
+def _index_aggregates(ctx):
+    app = ctx['app']
+    return lambda: app.homepage_shard_data(app.shards.home), 1
+
+@case('get_map_json')
+def _get_map_json(ctx):
+    # The /api/blood-stock payload without the single-flight cache in front of it
+    app = ctx['app']
+    def run():
+        with app.app.app_context(): app.jsonify(app.blood_stock_markers()).get_data()
+    return run, 1
+
+@case('csv_export_donations')
+def _csv_export_donations(ctx):
+    client = ctx['admin']
+    return lambda: client.get('/admin/export_report?type=donations&file_format=csv').get_data(), 1
+
+@case('csv_export_users')
+def _csv_export_users(ctx):
+    client = ctx['admin']
+    return lambda: client.get('/admin/export_report?type=users_list&file_format=csv').get_data(), 1
+
+@case('pdf_export_report')
+def _pdf_export_report(ctx):
+    client = ctx['admin']
+    return lambda: client.get('/admin/export_report?type=users_list&file_format=pdf').get_data(), 1
+
+@case('pdf_certificate')
+def _pdf_certificate(ctx):
+    client, donation_id = ctx['donor'], ctx['donation_id']
+    return lambda: client.get(f'/certificate/donation/{donation_id}').get_data(), 1
+
+@case('generate_report')
+def _generate_report(ctx):
+    script = os.path.join(ctx['repo_root'], 'generate_report.py')
+    def run():
+        with open(os.devnull, 'w') as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            try: runpy.run_path(script, run_name='__main__')
+            finally: sys.stdout = stdout
+    return run, 1
+
+# =========================================================================
+# SEEDING AND TIMING
+# =========================================================================
+def seed(app, donors):
+    """Seeds `donors` donors plus history into the throwaway app's home shard; returns the case context."""
+    from common import seed_donors, login, days_ago, REPO_ROOT
+    random.seed(donors)
+    conn = app.get_db_connection()
+    seed_donors(conn, donors)
+    donor_ids = [r[0] for r in conn.execute("SELECT id FROM donors WHERE role = 'user'")]
+    hospitals = conn.execute("SELECT id, name FROM hospitals").fetchall()
+    conn.executemany("INSERT INTO donations (donor_id, date, volume_ml, hospital, status) VALUES (?, ?, 450, ?, ?)",
+                     ((donor_id, days_ago(random.randint(1, 1500)), random.choice(hospitals)['name'], 'Approved' if n else 'Pending')
+                      for donor_id in donor_ids for n in range(2)))
+    conn.executemany("INSERT INTO appointments (donor_id, hospital_id, date, time_slot, status) VALUES (?, ?, ?, '10:00 AM', ?)",
+                     ((donor_id, random.choice(hospitals)['id'], days_ago(random.randint(-30, 1500)), random.choice(['Scheduled', 'Verified']))
+                      for donor_id in donor_ids))
+    conn.executemany("INSERT INTO hospital_stock (hospital_id, blood_group, units) VALUES (?, ?, ?)",
+                     ((h['id'], group, random.randint(1, 40)) for h in hospitals for group in ('A+', 'B+', 'O+', 'O-')))
+    conn.commit()
+    donor = conn.execute("SELECT id, name FROM donors WHERE role = 'user' LIMIT 1").fetchone()
+    donation_id = conn.execute("SELECT id FROM donations WHERE donor_id = ? AND status = 'Approved'", (donor['id'],)).fetchone()[0]
+    points = [tuple(r) for r in conn.execute("SELECT lat, lng FROM donors WHERE lat IS NOT NULL LIMIT 1000")]
+    app.current_analytics().refresh() # Exports read the analytics snapshot
+    admin = app.app.test_client(); login(admin, 'admin', 1, 'Admin')
+    user = app.app.test_client(); login(user, 'user', donor['id'], donor['name'])
+    return {'app': app, 'conn': conn, 'admin': admin, 'donor': user, 'donor_ids': donor_ids,
+            'donation_id': donation_id, 'points': points, 'repo_root': REPO_ROOT}
+
+def time_case(fn, calls):
+    fn() # Warm-up: caches, compiled statements, fonts
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number): fn()
+        elapsed = time.perf_counter() - started
+        if elapsed >= MIN_ROUND_SECONDS or number >= 1 << 20: break
+        number *= 2 if elapsed * 4 >= MIN_ROUND_SECONDS else 10
+    rounds = [elapsed]; budget = time.perf_counter() + MAX_CASE_SECONDS
+    while len(rounds) < ROUNDS and (len(rounds) < 2 or time.perf_counter() < budget):
+        started = time.perf_counter()
+        for _ in range(number): fn()
+        rounds.append(time.perf_counter() - started)
+    per_call = sorted(r / (number * calls) for r in rounds)
+    return {'best_us': per_call[0] * 1e6, 'median_us': per_call[len(per_call) // 2] * 1e6, 'rounds': len(rounds), 'calls': number * calls}
+
+def child(size, names):
+    os.environ.setdefault('LIFEFLOW_INVENTORY_JOB_INTERVAL', '0') # No background sweeps while timing
+    os.environ.setdefault('LIFEFLOW_ANALYTICS_REFRESH', '0')
+    from common import load_app
+    app = load_app()
+    app.db_metrics.registry.slow_query_seconds = float('inf')
+    ctx = seed(app, SIZES[size])
+    results = {}
+    for name in names:
+        fn, calls = CASES[name](ctx)
+        results[name] = time_case(fn, calls)
+        print(f"  {size:<7} {name:<22} {results[name]['best_us']:>14,.1f} us", file=sys.stderr)
+    print(json.dumps(results))
+
+# =========================================================================
+# COMMANDS
+# =========================================================================
+def run(args):
+    sizes = args.sizes.split(','); names = args.cases.split(',') if args.cases else list(CASES)
+    unknown = [s for s in sizes if s not in SIZES] + [n for n in names if n not in CASES]
+    if unknown: sys.exit(f"unknown size or case: {', '.join(unknown)}")
+    report = {'meta': {'created': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'python': platform.python_version(),
+                       'sqlite': sqlite3.sqlite_version, 'machine': platform.machine(), 'cpus': os.cpu_count()},
+              'sizes': {s: SIZES[s] for s in sizes}, 'results': {}}
+    for size in sizes:
+        print(f"Seeding {size} ({SIZES[size]:,} donors)...", file=sys.stderr)
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', size, ','.join(names)],
+                             cwd=BENCH_DIR, stdout=subprocess.PIPE, text=True, check=True)
+        report['results'][size] = json.loads(out.stdout.strip().splitlines()[-1])
+    os.makedirs(BASELINE_DIR, exist_ok=True)
+    path = baseline_path(args.save)
+    with open(path, 'w', encoding='utf-8') as f: json.dump(report, f, indent=2)
+    print(f"Results written to {path}")
+
+def baseline_path(name):
+    return name if name.endswith('.json') else os.path.join(BASELINE_DIR, f"{name}.json")
+
+def compare(args):
+    with open(baseline_path(args.baseline), encoding='utf-8') as f: base = json.load(f)
+    with open(baseline_path(args.current), encoding='utf-8') as f: current = json.load(f)
+    regressions = []
+    print(f"{'size':<7} {'case':<22} {'baseline us':>14} {'current us':>14} {'ratio':>7}")
+    for size, cases in current['results'].items():
+        for name, result in cases.items():
+            before = base['results'].get(size, {}).get(name)
+            if before is None: print(f"{size:<7} {name:<22} {'-':>14} {result['best_us']:>14,.1f}    new"); continue
+            ratio = result['best_us'] / before['best_us']
+            flag = ''
+            if ratio > 1 + args.threshold: flag = '  REGRESSION'; regressions.append((size, name, ratio))
+            elif ratio < 1 / (1 + args.threshold): flag = '  faster'
+            print(f"{size:<7} {name:<22} {before['best_us']:>14,.1f} {result['best_us']:>14,.1f} {ratio:>7.2f}{flag}")
+    if regressions:
+        print(f"\n{len(regressions)} case(s) slower than the {args.threshold:.0%} threshold")
+        sys.exit(1)
+    print(f"\nNo regressions beyond {args.threshold:.0%}")
+
+def main():
+    parser = argparse.ArgumentParser(description="LifeFlow micro-benchmarks with JSON baselines.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    p = commands.add_parser('run', help="Run the suite and save the results")
+    p.add_argument('--sizes', default='small,medium', help=f"Comma-separated, from: {', '.join(SIZES)}")
+    p.add_argument('--cases', help="Comma-separated case names (default: all)")
+    p.add_argument('--save', default='latest', help="Baseline name under benchmarks/baselines/, or a .json path")
+    p.set_defaults(fn=run)
+    p = commands.add_parser('compare', help="Compare two saved runs; exit 1 on regressions")
+    p.add_argument('baseline')
+    p.add_argument('current', nargs='?', default='latest')
+    p.add_argument('--threshold', type=float, default=0.15, help="Allowed slowdown as a fraction (default 0.15)")
+    p.set_defaults(fn=compare)
+    p = commands.add_parser('list', help="List the cases")
+    p.set_defaults(fn=lambda args: print('\n'.join(CASES)))
+    args = parser.parse_args()
+    args.fn(args)
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--child']: child(sys.argv[2], sys.argv[3].split(','))
+    else: main()
@@ -0,0 +1,51 @@
+"""Stress test: many donors registering concurrently for one popular camp.
+
+Every donor submits the camp booking form several times from parallel threads.
+The run checks that the camp is never overbooked, that nobody holds two seats and
+that camps.registered_count matches the camp_registrations rows.
+
+Usage: python benchmarks/stress_camp_registration.py [donors] [capacity] [threads]"""
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from common import load_app, login, seed_donors, Timer
+
+DONORS = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+CAPACITY = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+THREADS = int(sys.argv[3]) if len(sys.argv) > 3 else 16
+ATTEMPTS_PER_DONOR = 3
+
+def main():
+    app = load_app()
+    conn = app.get_db_connection()
+    seed_donors(conn, DONORS)
+    conn.execute("INSERT INTO camp_hosts (organization_name, email, password) VALUES ('Stress Host', 'stress@host.local', 'x')")
+    conn.execute("INSERT INTO camps (host_id, name, date, time, location_name, lat, lng, estimated_participants, city) VALUES (1, 'Popular Camp', date('now', '+7 days'), '09:00', 'Marina', 13.05, 80.28, ?, 'Chennai')", (CAPACITY,))
+    camp_id = conn.execute("SELECT MAX(id) FROM camps").fetchone()[0]
+    donors = [(r['id'], r['name']) for r in conn.execute("SELECT id, name FROM donors WHERE role = 'user'")]
+    conn.commit(); conn.close()
+
+    def register(donor):
+        client = app.app.test_client()
+        login(client, 'user', donor[0], donor[1])
+        for _ in range(ATTEMPTS_PER_DONOR):
+            client.post('/book_appointment', data={'booking_type': 'camp', 'camp_id': camp_id})
+
+    with Timer() as t:
+        with ThreadPoolExecutor(max_workers=THREADS) as pool:
+            list(pool.map(register, donors))
+
+    conn = app.get_db_connection()
+    counter = conn.execute("SELECT registered_count FROM camps WHERE id = ?", (camp_id,)).fetchone()[0]
+    rows = conn.execute("SELECT COUNT(*) FROM camp_registrations WHERE camp_id = ?", (camp_id,)).fetchone()[0]
+    duplicates = conn.execute("SELECT COUNT(*) FROM (SELECT donor_id FROM camp_registrations WHERE camp_id = ? GROUP BY donor_id HAVING COUNT(*) > 1)", (camp_id,)).fetchone()[0]
+    conn.close()
+
+    attempts = len(donors) * ATTEMPTS_PER_DONOR
+    print(f"Attempts: {attempts} from {len(donors)} donors on {THREADS} threads in {t.elapsed:.2f}s ({attempts / t.elapsed:.0f} req/s)")
+    print(f"Capacity: {CAPACITY} | registered_count: {counter} | registration rows: {rows} | duplicate donors: {duplicates}")
+    ok = counter == rows == min(CAPACITY, len(donors)) and duplicates == 0
+    print("PASS" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,277 @@
+"""Streaming bulk CSV import for LifeFlow (donors, hospital stock, past donations).
+
+Rows are read lazily from the CSV, validated, and written in chunked transactions,
+so memory stays bounded by CHUNK_SIZE no matter how large the file is. Donor
+passwords are hashed in a process pool (from the command line) because hashing
+dominates import time. A donor whose phone is already registered is never touched:
+the row is reported as a conflict, so an import cannot take over an account.
+In a sharded deployment the web import passes AccountClaims, which also skips rows
+for another shard's cities and phones or emails registered in any shard.
+
+Command line usage:
+    python bulk_import.py donors legacy_donors.csv [--db bloodbank.db] [--errors errors.csv]
+    python bulk_import.py stock stock.csv
+    python bulk_import.py donations history.csv
+"""
+import argparse
+import csv
+import itertools
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+from functools import partial
+from werkzeug.security import generate_password_hash
+from inventory import SHELF_LIFE_DAYS
+from accounts import account_keys, claim_accounts, release_accounts
+
+CHUNK_SIZE = 5000
+MAX_ERRORS_KEPT = 100 # Only the first errors are kept in memory; the rest go to the error file
+BLOOD_GROUPS = {'A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-'}
+HASH_PREFIXES = ('scrypt:', 'pbkdf2:') # Accepted in the password_hash column only
+
+IMPORT_COLUMNS = {
+    'donors': ['name', 'email', 'phone', 'password', 'blood_group', 'city', 'age', 'weight', 'address'],
+    'stock': ['hospital_email', 'blood_group', 'units'],
+    'donations': ['donor_phone', 'date', 'volume_ml', 'hospital'],
+}
+
+class RowError(ValueError):
+    pass
+
+class ImportReport:
+    def __init__(self, kind):
+        self.kind = kind; self.rows = 0; self.inserted = 0; self.updated = 0; self.skipped = 0
+        self.error_count = 0; self.errors = []; self.started = time.perf_counter(); self.elapsed = 0.0
+
+    def add_error(self, line, message, error_writer=None):
+        self.error_count += 1
+        if len(self.errors) < MAX_ERRORS_KEPT: self.errors.append((line, message))
+        if error_writer: error_writer.writerow([line, message])
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def summary(self):
+        return (f"{self.kind}: {self.rows} rows in {self.elapsed:.2f}s ({self.rows_per_second:.0f} rows/s) - "
+                f"{self.inserted} inserted, {self.updated} updated, {self.skipped} skipped, {self.error_count} errors")
+
+class AccountClaims:
+    """Keeps a donor import inside one shard (see sharding.py) and the account directory (see accounts.py).
+
+    claim() runs before each chunk's transaction: rows whose city belongs to another shard,
+    or whose phone or email is already in the directory, are reported and skipped, and the
+    rest are claimed for `shard`. release() gives the claims back if the chunk fails."""
+    def __init__(self, directory, shard, shard_for_city):
+        self.directory = directory; self.shard = shard; self.shard_for_city = shard_for_city
+
+    def claim(self, chunk, report, error_writer):
+        rows = []
+        for line, values in chunk:
+            owner = self.shard_for_city(values[5])
+            if owner != self.shard: report.add_error(line, f"City {values[5]!r} belongs to shard {owner!r}; import the row there", error_writer); report.skipped += 1
+            else: rows.append((line, values))
+        claimed = claim_accounts(self.directory, [self._keys(values) for _, values in rows], self.shard)
+        for (line, values), ok in zip(rows, claimed):
+            if not ok: report.add_error(line, f"Phone {values[2]!r} or email {values[1]!r} is already registered; row skipped", error_writer); report.skipped += 1
+        return [row for row, ok in zip(rows, claimed) if ok]
+
+    def release(self, chunk):
+        release_accounts(self.directory, [self._keys(values) for _, values in chunk])
+
+    @staticmethod
+    def _keys(values):
+        return account_keys('donor', phone=values[2], email=values[1])
+
+# --- ROW VALIDATION (one function per import kind, returns the DB tuple or raises RowError) ---
+def _required(row, field):
+    value = (row.get(field) or '').strip()
+    if not value: raise RowError(f"Missing '{field}'")
+    return value
+
+def _number(row, field, cast=int, default=None):
+    value = (row.get(field) or '').strip()
+    if not value:
+        if default is None: raise RowError(f"Missing '{field}'")
+        return default
+    try: return cast(value)
+    except ValueError: raise RowError(f"Invalid {field}: {value!r}")
+
+def _blood_group(row, field='blood_group'):
+    bg = _required(row, field).upper()
+    if bg not in BLOOD_GROUPS: raise RowError(f"Unknown blood group: {bg!r}")
+    return bg
+
+def validate_donor(row):
+    age = _number(row, 'age'); weight = _number(row, 'weight', float)
+    if age < 18 or weight < 50: raise RowError("Donor must be at least 18 years old and 50kg")
+    email = (row.get('email') or '').strip()
+    if email and '@' not in email: raise RowError(f"Invalid email: {email!r}")
+    # Only the explicit password_hash column is taken as already hashed; a plaintext password is always hashed
+    password_hash = (row.get('password_hash') or '').strip()
+    if password_hash and not password_hash.startswith(HASH_PREFIXES): raise RowError("password_hash is not a Werkzeug password hash")
+    password = password_hash or (row.get('password') or '').strip()
+    if not password: raise RowError("Missing 'password'")
+    lat = _number(row, 'lat', float, default=0.0) or None; lng = _number(row, 'lng', float, default=0.0) or None # Missing GPS is filled in by init_db()
+    return (_required(row, 'name'), email, _required(row, 'phone'), password, _blood_group(row),
+            (row.get('city') or '').strip(), age, weight, (row.get('address') or '').strip(), lat, lng, bool(password_hash))
+
+def validate_stock(row):
+    units = _number(row, 'units')
+    if units <= 0: raise RowError("Units must be positive")
+    return (_required(row, 'hospital_email'), _blood_group(row), units)
+
+def validate_donation(row):
+    donation_date = _required(row, 'date')
+    try: datetime.strptime(donation_date, '%Y-%m-%d')
+    except ValueError: raise RowError(f"Invalid date (expected YYYY-MM-DD): {donation_date!r}")
+    volume = _number(row, 'volume_ml', default=450)
+    if volume <= 0: raise RowError("volume_ml must be positive")
+    status = (row.get('status') or 'Approved').strip()
+    if status not in ('Approved', 'Pending', 'Rejected', 'Archived'): raise RowError(f"Invalid status: {status!r}")
+    return (_required(row, 'donor_phone'), donation_date, volume, _required(row, 'hospital'), status)
+
+# --- CHUNK WRITERS (each runs inside one transaction) ---
+def _hash_passwords(rows, pool, hash_method):
+    # rows end with the prehashed flag from validate_donor; returns the DB tuples with hashed passwords
+    to_hash = [r[3] for r in rows if not r[-1]]
+    hasher = partial(generate_password_hash, method=hash_method) if hash_method else generate_password_hash
+    hashed = iter(pool.map(hasher, to_hash, chunksize=64) if pool else map(hasher, to_hash))
+    return [r[:3] + (r[3] if r[-1] else next(hashed),) + r[4:-1] for r in rows]
+
+def existing_phones(conn, phones):
+    found = set()
+    for i in range(0, len(phones), 900): # Stay below SQLite's bound-parameter limit
+        part = phones[i:i + 900]
+        found.update(p for (p,) in conn.execute(f"SELECT phone FROM donors WHERE phone IN ({','.join('?' * len(part))})", part))
+    return found
+
+def write_donors(conn, chunk, report, pool, hash_method, error_writer, **_):
+    taken = existing_phones(conn, list({values[2] for _, values in chunk}))
+    rows = []
+    for line, values in chunk:
+        # Existing accounts are reported, never updated: a CSV row must not replace a donor's details or password
+        if values[2] in taken: report.add_error(line, f"Phone {values[2]!r} is already registered; row skipped", error_writer); report.skipped += 1; continue
+        taken.add(values[2]); rows.append(values)
+    inserted = conn.executemany('''
+        INSERT INTO donors (name, email, phone, password, blood_group, city, age, weight, address, lat, lng, role)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'user')
+        ON CONFLICT(phone) DO NOTHING
+    ''', _hash_passwords(rows, pool, hash_method)).rowcount
+    report.inserted += inserted; report.skipped += len(rows) - inserted
+
+def write_stock(conn, chunk, report, error_writer, **_):
+    emails = {values[0] for _, values in chunk}
+    hospital_ids = {}
+    for email in emails:
+        row = conn.execute("SELECT id FROM hospitals WHERE email = ?", (email,)).fetchone()
+        if row: hospital_ids[email] = row[0]
+    rows = []
+    for line, (email, bg, units) in chunk:
+        if email not in hospital_ids: report.add_error(line, f"Unknown hospital: {email!r}", error_writer); continue
+        rows.append((hospital_ids[email], bg, units))
+    # Same semantics as hospital_update_stock: the lifetime counter grows and each row becomes an inventory lot
+    conn.executemany('''INSERT INTO hospital_stock (hospital_id, blood_group, units) VALUES (?, ?, ?)
+                        ON CONFLICT(hospital_id, blood_group) DO UPDATE SET units = units + excluded.units''', rows)
+    today = date.today(); expires = today + timedelta(days=SHELF_LIFE_DAYS)
+    conn.executemany('''INSERT INTO inventory_movements (hospital_id, blood_group, units, kind, collected_on, expires_on, source)
+                        VALUES (?, ?, ?, 'in', ?, ?, 'import')''', [r + (today.isoformat(), expires.isoformat()) for r in rows])
+    report.updated += len(rows)
+
+def write_donations(conn, chunk, report, error_writer, **_):
+    phones = list({values[0] for _, values in chunk})
+    donor_ids = {}
+    for i in range(0, len(phones), 900):
+        part = phones[i:i + 900]
+        donor_ids.update(conn.execute(f"SELECT phone, id FROM donors WHERE phone IN ({','.join('?' * len(part))})", part).fetchall())
+    rows = []
+    for line, (phone, donation_date, volume, hospital, status) in chunk:
+        if phone not in donor_ids: report.add_error(line, f"Unknown donor phone: {phone!r}", error_writer); continue
+        rows.append((donor_ids[phone], donation_date, volume, hospital, status, donor_ids[phone], donation_date))
+    # A donor can only have one donation per day; re-importing the same file is a no-op.
+    # rowcount (unlike total_changes) leaves out the donor_totals rows written by triggers.
+    inserted = conn.executemany('''INSERT INTO donations (donor_id, date, volume_ml, hospital, status)
+                        SELECT ?, ?, ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM donations WHERE donor_id = ? AND date = ?)''', rows).rowcount
+    report.inserted += inserted; report.skipped += len(rows) - inserted
+
+IMPORTERS = {
+    'donors': (validate_donor, write_donors),
+    'stock': (validate_stock, write_stock),
+    'donations': (validate_donation, write_donations),
+}
+
+def import_csv(conn, kind, stream, chunk_size=CHUNK_SIZE, workers=0, hash_method=None, error_stream=None, progress=None, accounts=None):
+    """Streams a CSV (text file object) into the database. Returns an ImportReport.
+    Each chunk is committed in its own transaction, so a bad row never rolls back good ones.
+    workers: password hashing processes for donor imports (0 = hash inline, None = one per CPU).
+    accounts: AccountClaims for a donor import into one shard of a sharded deployment."""
+    if kind not in IMPORTERS: raise ValueError(f"Unknown import kind: {kind}")
+    validate, write = IMPORTERS[kind]
+    report = ImportReport(kind)
+    error_writer = csv.writer(error_stream) if error_stream else None
+    if error_writer: error_writer.writerow(['line', 'error'])
+
+    reader = csv.DictReader(stream)
+    reader.fieldnames = [f.strip().lower() for f in (reader.fieldnames or [])]
+    missing = [c for c in IMPORT_COLUMNS[kind] if c not in reader.fieldnames and not (c == 'password' and 'password_hash' in reader.fieldnames)]
+    if missing:
+        report.add_error(1, f"Missing columns: {', '.join(missing)}", error_writer)
+        report.elapsed = time.perf_counter() - report.started
+        return report
+
+    pool = ProcessPoolExecutor(max_workers=workers) if kind == 'donors' and workers != 0 else None
+    try:
+        rows = enumerate(reader, start=2) # Line 1 is the header
+        while True:
+            batch = list(itertools.islice(rows, chunk_size))
+            if not batch: break
+            chunk = []
+            for line, row in batch:
+                try: chunk.append((line, validate(row)))
+                except RowError as e: report.add_error(line, str(e), error_writer)
+            report.rows += len(batch)
+            if chunk and accounts: chunk = accounts.claim(chunk, report, error_writer)
+            if chunk:
+                try:
+                    conn.execute("BEGIN IMMEDIATE TRANSACTION")
+                    write(conn, chunk, report, pool=pool, hash_method=hash_method, error_writer=error_writer)
+                    conn.commit()
+                except sqlite3.Error as e:
+                    conn.rollback()
+                    if accounts: accounts.release(chunk)
+                    for line, _ in chunk: report.add_error(line, f"Database error: {e}", error_writer)
+            if progress: progress(report)
+    finally:
+        if pool: pool.shutdown()
+    report.elapsed = time.perf_counter() - report.started
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import donors, hospital stock or past donations from CSV.")
+    parser.add_argument('kind', choices=sorted(IMPORTERS))
+    parser.add_argument('csv_file')
+    parser.add_argument('--db', default='bloodbank.db')
+    parser.add_argument('--errors', help="Write per-row errors to this CSV file")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Password hashing processes (0 = hash inline)")
+    parser.add_argument('--hash-method', help="Werkzeug hash method, e.g. 'pbkdf2:sha256' (default: Werkzeug's default)")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    error_stream = open(args.errors, 'w', newline='') if args.errors else None
+    def progress(report):
+        elapsed = time.perf_counter() - report.started
+        print(f"\r{report.rows} rows, {report.error_count} errors, {report.rows / elapsed:.0f} rows/s", end='', flush=True)
+    try:
+        with open(args.csv_file, newline='', encoding='utf-8-sig') as f:
+            report = import_csv(conn, args.kind, f, args.chunk_size, args.workers, args.hash_method, error_stream, progress)
+    finally:
+        conn.close()
+        if error_stream: error_stream.close()
+    print("\n" + report.summary())
+    for line, message in report.errors[:10]: print(f"  line {line}: {message}")
+
+if __name__ == '__main__':
+    main()
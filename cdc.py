@@ -0,0 +1,217 @@
+"""Change-data capture: a sequenced log of every write to the replicated tables.
+
+Off unless LIFEFLOW_CDC=1: the triggers add a log row to every write, so they are only
+installed when something consumes the feed, and dropped again when it is switched off.
+Switching it back on voids every earlier cursor, since the writes in between were never
+logged, and consumers must register and copy again.
+
+Triggers on CDC_TABLES append one change_log row per inserted, updated or deleted row:
+(seq, table, op, row id, time). seq is AUTOINCREMENT, so it never goes backwards or
+gets reused, even after compaction. SQLite has a single writer, so seq order is also
+commit order: a reader never sees seq N+1 and later finds an N committed behind it.
+
+Consumers (read replicas, external dashboards, cache invalidators on other workers)
+pull with a cursor: pull_changes(since) returns the next batch after `since`. Each
+change carries the row as it is at pull time, or None once the row is gone. A consumer
+that upserts every non-None row and deletes on None converges on the live table, even
+if it replays a batch. Each named consumer acknowledges the last seq it has applied.
+compact() then deletes only what every registered consumer has acknowledged. A consumer
+silent for CONSUMER_TIMEOUT_HOURS is dropped so it cannot hold the log forever, and with
+no consumers the log keeps RETENTION_HOURS of changes. Compactor runs compact() on a timer.
+
+A new replica registers at head_seq(), copies the tables, then pulls from that cursor.
+Changes made during the copy are replayed, which is harmless for the reason above.
+A cursor older than the last compaction raises CursorExpired: the consumer must copy again.
+Archival (see archive.py) shows up as deletes, like any other delete.
+
+    python cdc.py status | compact | drop CONSUMER  [--shard NAME]   (default: every shard, see sharding.py)
+"""
+import os
+import sqlite3
+import threading
+
+# Replicated tables and the columns never shipped to consumers
+CDC_TABLES = {
+    'donors': {'password'},
+    'donations': set(),
+    'appointments': set(),
+    'hospital_stock': set(),
+    'camps': set(),
+    'camp_registrations': set(),
+}
+PULL_BATCH_SIZE = 500
+MAX_PULL_BATCH = 5000
+COMPACT_BATCH_SIZE = 10000
+COMPACTIONS_KEPT = 100
+CDC_ENABLED = os.environ.get('LIFEFLOW_CDC', '0') == '1'
+RETENTION_HOURS = int(os.environ.get('LIFEFLOW_CDC_RETENTION_HOURS', '24')) # Log kept while no consumer is registered
+CONSUMER_TIMEOUT_HOURS = int(os.environ.get('LIFEFLOW_CDC_CONSUMER_TIMEOUT_HOURS', '168')) # Unacknowledged this long: dropped
+COMPACT_INTERVAL_SECONDS = int(os.environ.get('LIFEFLOW_CDC_COMPACT_INTERVAL', '600'))
+
+class CursorExpired(ValueError):
+    """The changes after this cursor have been compacted away; the consumer must re-copy the tables."""
+
+def init_cdc_tables(c, enabled=CDC_ENABLED):
+    """Called from init_db() with its cursor. Installs the triggers if enabled, else drops them.
+    Only writes from then on are logged; existing rows are not backfilled."""
+    existed = c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'change_log'").fetchone() is not None
+    c.execute('''CREATE TABLE IF NOT EXISTS change_log
+                 (seq INTEGER PRIMARY KEY AUTOINCREMENT, table_name TEXT, op TEXT, row_id INTEGER,
+                  changed_at DATETIME DEFAULT CURRENT_TIMESTAMP)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS cdc_consumers
+                 (name TEXT PRIMARY KEY, acked_seq INTEGER DEFAULT 0,
+                  registered_at DATETIME DEFAULT CURRENT_TIMESTAMP, acked_at DATETIME)''')
+    # Every compaction run; the highest compacted_through is the oldest cursor that can still be served
+    c.execute('''CREATE TABLE IF NOT EXISTS cdc_compactions
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT, compacted_through INTEGER, rows INTEGER,
+                  compacted_at DATETIME DEFAULT CURRENT_TIMESTAMP)''')
+    triggers = [(table, op, ref) for table in CDC_TABLES for op, ref in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD'))]
+    if not enabled:
+        for table, op, _ in triggers: c.execute(f"DROP TRIGGER IF EXISTS cdc_{table}_{op.lower()}")
+        return
+    if existed and not c.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'cdc_donors_insert'").fetchone():
+        # Back on after being off: writes in between were never logged, so every cursor handed out before is void
+        head = c.execute("INSERT INTO change_log (table_name, op) VALUES ('', 'RESYNC')").lastrowid
+        c.execute("DELETE FROM change_log"); c.execute("DELETE FROM cdc_consumers")
+        c.execute("INSERT INTO cdc_compactions (compacted_through, rows) VALUES (?, 0)", (head,))
+    for table, op, ref in triggers:
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS cdc_{table}_{op.lower()}
+                      AFTER {op} ON {table}
+                      BEGIN
+                          INSERT INTO change_log (table_name, op, row_id) VALUES ('{table}', '{op}', {ref}.id);
+                      END;''')
+
+def head_seq(conn):
+    """seq of the latest change (0 before the first); survives compaction emptying the log."""
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'").fetchone()
+    return row[0] if row else 0
+
+def compacted_through(conn):
+    return conn.execute("SELECT IFNULL(MAX(compacted_through), 0) FROM cdc_compactions").fetchone()[0]
+
+def register_consumer(conn, name, since=None):
+    """Registers `name` with its cursor at `since` (default: the head); re-registering keeps the stored cursor."""
+    since = head_seq(conn) if since is None else since
+    if since < compacted_through(conn): raise CursorExpired(f"changes up to {compacted_through(conn)} have been compacted")
+    conn.execute("INSERT OR IGNORE INTO cdc_consumers (name, acked_seq) VALUES (?, ?)", (name, since))
+    conn.commit()
+
+def pull_changes(conn, since, limit=PULL_BATCH_SIZE):
+    """Up to `limit` changes after seq `since`, oldest first, each with its row as it is now.
+
+    Returns {'changes': [...], 'next_cursor': seq of the last change (or since), 'has_more': bool}.
+    Changes and rows are read in one transaction, so a batch is a consistent view."""
+    conn.execute("BEGIN")
+    try:
+        if since < compacted_through(conn): raise CursorExpired(f"changes up to {compacted_through(conn)} have been compacted")
+        log = conn.execute("SELECT seq, table_name, op, row_id, changed_at FROM change_log WHERE seq > ? ORDER BY seq LIMIT ?", (since, limit + 1)).fetchall()
+        has_more = len(log) > limit; log = log[:limit]
+        wanted = {}
+        for _, table, _, row_id, _ in log: wanted.setdefault(table, set()).add(row_id)
+        rows = {}
+        for table, ids in wanted.items():
+            ids = list(ids)
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                cur = conn.execute(f"SELECT * FROM {table} WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+                names = [d[0] for d in cur.description]
+                for values in cur:
+                    row = {k: v for k, v in zip(names, values) if k not in CDC_TABLES[table]}
+                    rows[(table, row['id'])] = row
+    finally:
+        conn.commit()
+    changes = [{'seq': seq, 'table': table, 'op': op, 'id': row_id, 'changed_at': changed_at, 'row': rows.get((table, row_id))}
+               for seq, table, op, row_id, changed_at in log]
+    return {'changes': changes, 'next_cursor': log[-1][0] if log else since, 'has_more': has_more}
+
+def acknowledge(conn, name, seq):
+    """Moves consumer `name` up to `seq` (never backwards, never past the head), then compacts.
+
+    Returns (the consumer's acknowledged seq, rows compacted)."""
+    n = conn.execute('''UPDATE cdc_consumers SET acked_seq = MAX(acked_seq, MIN(?, ?)), acked_at = CURRENT_TIMESTAMP
+                        WHERE name = ?''', (seq, head_seq(conn), name)).rowcount
+    conn.commit()
+    if not n: raise ValueError(f"unknown consumer {name!r}")
+    acked = conn.execute("SELECT acked_seq FROM cdc_consumers WHERE name = ?", (name,)).fetchone()[0]
+    return acked, compact(conn)
+
+def compact(conn, batch_size=COMPACT_BATCH_SIZE, retention_hours=RETENTION_HOURS, consumer_timeout_hours=CONSUMER_TIMEOUT_HOURS):
+    """Deletes the changes every registered consumer has acknowledged, batch_size per transaction.
+
+    Consumers that have not acknowledged (or, if they never did, registered) within
+    consumer_timeout_hours are dropped first; they must register and copy again. With no
+    consumers registered, changes older than retention_hours are deleted, which leaves a
+    consumer that has not registered yet that long to do so. Returns the number of rows deleted."""
+    conn.execute("DELETE FROM cdc_consumers WHERE IFNULL(acked_at, registered_at) < datetime('now', ?)", (f'-{int(consumer_timeout_hours)} hours',))
+    conn.commit()
+    target = conn.execute("SELECT MIN(acked_seq) FROM cdc_consumers").fetchone()[0]
+    if target is None: target = conn.execute("SELECT MAX(seq) FROM change_log WHERE changed_at < datetime('now', ?)", (f'-{int(retention_hours)} hours',)).fetchone()[0]
+    if target is None or target <= compacted_through(conn): return 0
+    deleted = 0
+    while True:
+        conn.execute("BEGIN IMMEDIATE TRANSACTION")
+        # seq is the rowid, so each batch is one range delete from the front of the log
+        n = conn.execute('''DELETE FROM change_log WHERE seq <= MIN(?, (SELECT MIN(seq) FROM change_log) + ?)''',
+                         (target, batch_size - 1)).rowcount
+        if not n:
+            conn.execute("INSERT INTO cdc_compactions (compacted_through, rows) VALUES (?, ?)", (target, deleted))
+            conn.execute("DELETE FROM cdc_compactions WHERE id <= (SELECT MAX(id) FROM cdc_compactions) - ?", (COMPACTIONS_KEPT,))
+            conn.commit()
+            return deleted
+        conn.commit()
+        deleted += n
+
+def drop_consumer(conn, name):
+    """Forgets a consumer that is gone for good, so it no longer holds back compaction."""
+    n = conn.execute("DELETE FROM cdc_consumers WHERE name = ?", (name,)).rowcount
+    conn.commit()
+    return n > 0
+
+class Compactor:
+    """Runs compact() every interval seconds in a daemon thread, so the retention and consumer
+    timeout apply even when no consumer acknowledges. Concurrent runs in other processes are harmless."""
+    def __init__(self, connect, interval=COMPACT_INTERVAL_SECONDS):
+        self.connect = connect; self.interval = interval; self._thread = None; self._lock = threading.Lock()
+
+    def start(self):
+        if self.interval <= 0: return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self.run_forever, name='cdc-compactor', daemon=True)
+                self._thread.start()
+
+    def run_forever(self):
+        while True:
+            conn = self.connect()
+            try: compact(conn)
+            except sqlite3.Error as e: print(f"CDC compaction failed: {e}")
+            finally: conn.close()
+            threading.Event().wait(self.interval)
+
+def consumer_status(conn):
+    """Every consumer with its cursor and how many retained changes it has not acknowledged."""
+    head = head_seq(conn)
+    return [{'name': name, 'acked_seq': acked, 'lag': conn.execute("SELECT COUNT(*) FROM change_log WHERE seq > ?", (acked,)).fetchone()[0],
+             'behind_head': head - acked, 'acked_at': acked_at}
+            for name, acked, acked_at in conn.execute("SELECT name, acked_seq, acked_at FROM cdc_consumers ORDER BY name").fetchall()]
+
+if __name__ == '__main__':
+    import sys
+    from sharding import ShardRouter
+    args = sys.argv[1:]; only = None
+    if len(args) >= 2 and args[-2] == '--shard': only = args[-1]; args = args[:-2]
+    if args[:1] not in (['status'], ['compact'], ['drop']) or (args[0] == 'drop') != (len(args) == 2):
+        sys.exit("usage: python cdc.py status | compact | drop CONSUMER  [--shard NAME]")
+    router = ShardRouter.from_env(os.environ.get('LIFEFLOW_DB', 'bloodbank.db'))
+    if only is not None and not router.valid(only): sys.exit(f"unknown shard {only!r}; shards: {', '.join(router.names)}")
+    for shard in router.shards:
+        if only is not None and shard.name != only: continue
+        conn = sqlite3.connect(shard.path)
+        try:
+            if args[0] == 'compact': print(f"{shard.name}: compacted {compact(conn)} changes")
+            elif args[0] == 'drop': print(f"{shard.name}: dropped consumer {args[1]}" if drop_consumer(conn, args[1]) else f"{shard.name}: no consumer named {args[1]}")
+            else:
+                retained = conn.execute("SELECT COUNT(*) FROM change_log").fetchone()[0]
+                print(f"{shard.name}: head seq {head_seq(conn)}, {retained} changes retained, compacted through {compacted_through(conn)}")
+                for c in consumer_status(conn): print(f"  {c['name']:<24} acked {c['acked_seq']:>12}  {c['lag']:>9} unacknowledged  (last ack {c['acked_at'] or 'never'})")
+        finally: conn.close()
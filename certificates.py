@@ -0,0 +1,163 @@
+"""Blood donation certificates, one at a time or a whole camp / date range at once.
+
+Every certificate is the same A4 landscape page with four variable lines (name, blood
+group, date, location). The static part - colour bars, heading, "awarded to" line - is
+drawn once per process into a template: the raw page operators are recorded and
+pasted into each new page, so a page costs only its variable lines. The two core
+fonts are registered in the same order in every CertificateDocument, so the pasted
+operators' font references (/F1, /F2) are valid in any document. Core fonts only
+cover Latin-1, so each variable line goes through pdf_text() first and no donor's
+name can abort a batch halfway through.
+
+Batches are split into chunks that render in a process pool. render_batch_pdf() returns
+one multi-page PDF (the pool draws pages and the parent assembles them);
+stream_batch_zip() yields a ZIP with one PDF per donor, chunk by chunk as they finish.
+
+    python certificates.py bench [count] [workers]
+"""
+import io
+import itertools
+import time
+import unicodedata
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from fpdf import FPDF
+from werkzeug.utils import secure_filename
+
+CHUNK_SIZE = 100 # Certificates per pool task
+POOL_THRESHOLD = 200 # Smaller batches render inline: starting workers costs more than it saves
+MAX_BATCH = 5000
+
+class _Buffer:
+    """Stands in for FPDF.buffer, which FPDF grows with `+=` on an attribute (a full copy per
+    line, quadratic in document size). Appends are O(1); FPDF only needs += and len()."""
+    def __init__(self):
+        self.parts = []; self.length = 0
+    def __iadd__(self, s):
+        self.parts.append(s); self.length += len(s); return self
+    def __len__(self):
+        return self.length
+    def __str__(self):
+        return ''.join(self.parts)
+
+class CertificateDocument(FPDF):
+    def __init__(self):
+        super().__init__('L', 'mm', 'A4')
+        self.buffer = _Buffer()
+        self.set_font("Arial", 'B', 12); self.set_font("Arial", '', 12) # Fixed font numbering for the template
+
+    def output_bytes(self):
+        if self.state < 3: self.close()
+        return str(self.buffer).encode('latin-1')
+
+def _draw_static(pdf):
+    pdf.set_fill_color(178, 34, 34); pdf.rect(0, 0, 297, 15, 'F'); pdf.rect(0, 195, 297, 15, 'F')
+    pdf.set_y(40); pdf.set_font("Arial", 'B', 32); pdf.set_text_color(139, 0, 0); pdf.cell(0, 15, "BLOOD DONATION CERTIFICATE", 0, 1, 'C')
+    pdf.set_font("Arial", '', 12); pdf.set_text_color(80, 80, 80); pdf.ln(15); pdf.cell(0, 10, "This certificate is awarded to", 0, 1, 'C')
+    pdf.ln(5)
+
+_template = None # (page operators, y of the name line), built once per process
+
+def page_template():
+    global _template
+    if _template is None:
+        pdf = CertificateDocument(); pdf.add_page()
+        start = len(pdf.pages[pdf.page]); _draw_static(pdf)
+        _template = (pdf.pages[pdf.page][start:], pdf.get_y())
+    return _template
+
+def pdf_text(value):
+    """value as Latin-1 text: other characters lose their accents where Unicode can split them off, else become '?'."""
+    text = unicodedata.normalize('NFC', '' if value is None else str(value))
+    return ''.join(ch if ord(ch) < 256 else unicodedata.normalize('NFKD', ch).encode('latin-1', 'ignore').decode('latin-1') or '?' for ch in text)
+
+def render_page(pdf, data):
+    """Adds one certificate page. data: name, blood_group, date, hospital_name (the location line)."""
+    data = {key: pdf_text(data[key]) for key in ('name', 'blood_group', 'date', 'hospital_name')}
+    operators, name_y = page_template()
+    pdf.add_page()
+    pdf.pages[pdf.page] += operators
+    pdf.font_family = '' # The pasted operators changed the font; make the next set_font emit its own
+    pdf.set_y(name_y); pdf.set_font("Arial", 'B', 40); pdf.set_text_color(0, 0, 0); pdf.cell(0, 20, data['name'], 0, 1, 'C')
+    pdf.set_font("Arial", '', 14); pdf.ln(15)
+    pdf.multi_cell(0, 10, f"For the voluntary blood donation (Group: {data['blood_group']}).\nYour contribution brings hope and saves lives.", 0, 'C')
+    pdf.set_y(150); pdf.set_font("Arial", 'B', 12); pdf.cell(0, 10, f"Date: {data['date']}", 0, 1, 'C')
+    pdf.ln(8); pdf.cell(0, 10, f"Location: {data['hospital_name']}", 0, 1, 'C')
+
+def render_certificate(data):
+    """One certificate as a standalone PDF."""
+    pdf = CertificateDocument(); render_page(pdf, data)
+    return pdf.output_bytes()
+
+def certificate_filename(data):
+    return f"Certificate_{data['id']}_{secure_filename(str(data['name'])) or 'donor'}.pdf"
+
+def _render_chunk(kind, rows):
+    # Pool task: ZIP entries (filename, PDF bytes), or the raw operators of each page for one merged PDF
+    if kind == 'zip': return [(certificate_filename(row), render_certificate(row)) for row in rows]
+    pdf = CertificateDocument()
+    for row in rows: render_page(pdf, row)
+    return [pdf.pages[n] for n in range(1, pdf.page + 1)]
+
+def _chunks(rows, workers):
+    """Splits rows into pool tasks; big batches use a process pool unless workers == 0."""
+    rows = [dict(r) for r in rows]
+    tasks = [rows[i:i + CHUNK_SIZE] for i in range(0, len(rows), CHUNK_SIZE)]
+    return tasks, (workers != 0 and len(rows) >= POOL_THRESHOLD)
+
+def render_batch_pdf(rows, workers=None):
+    """All certificates as one multi-page PDF. Returns (bytes, seconds)."""
+    started = time.perf_counter()
+    tasks, pooled = _chunks(rows, workers)
+    pdf = CertificateDocument()
+    def assemble(results):
+        for pages in results:
+            for page in pages:
+                pdf.add_page(); pdf.pages[pdf.page] = page
+    if pooled:
+        with ProcessPoolExecutor(max_workers=workers) as pool: assemble(pool.map(_render_chunk, itertools.repeat('pdf'), tasks))
+    else: assemble(_render_chunk('pdf', task) for task in tasks)
+    data = pdf.output_bytes() if pdf.page else CertificateDocument().output_bytes()
+    return data, time.perf_counter() - started
+
+class _ZipStream(io.RawIOBase):
+    """Write-only, unseekable sink for zipfile; the streamed response drains it after every chunk."""
+    def __init__(self):
+        self.parts = []
+    def writable(self):
+        return True
+    def write(self, b):
+        self.parts.append(bytes(b)); return len(b)
+    def drain(self):
+        data = b''.join(self.parts); self.parts.clear(); return data
+
+def stream_batch_zip(rows, workers=None, on_done=None):
+    """Generator of ZIP bytes, one PDF per certificate, flushed after every rendered chunk.
+    PDF pages are already deflated, so entries are stored. on_done(count, seconds) runs at the end."""
+    started = time.perf_counter(); count = 0
+    tasks, pooled = _chunks(rows, workers)
+    sink = _ZipStream()
+    pool = ProcessPoolExecutor(max_workers=workers) if pooled else None
+    try:
+        results = pool.map(_render_chunk, itertools.repeat('zip'), tasks) if pool else (_render_chunk('zip', task) for task in tasks)
+        with zipfile.ZipFile(sink, 'w', zipfile.ZIP_STORED) as archive:
+            for entries in results:
+                for name, data in entries: archive.writestr(name, data)
+                count += len(entries)
+                yield sink.drain()
+        yield sink.drain() # Central directory
+    finally:
+        if pool: pool.shutdown()
+    if on_done: on_done(count, time.perf_counter() - started)
+
+if __name__ == '__main__':
+    import sys
+    if sys.argv[1:2] != ['bench']: sys.exit("usage: python certificates.py bench [count] [workers]")
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    rows = [{'id': i, 'name': f'Donor {i}', 'blood_group': 'O+', 'date': '2026-10-19', 'hospital_name': 'LifeFlow Camp, Chennai'} for i in range(count)]
+    _, seconds = render_batch_pdf(rows, workers)
+    print(f"Multi-page PDF: {count} certificates in {seconds:.2f}s ({count / seconds:,.0f}/s)")
+    started = time.perf_counter(); size = sum(len(chunk) for chunk in stream_batch_zip(rows, workers))
+    seconds = time.perf_counter() - started
+    print(f"Streamed ZIP:   {count} certificates in {seconds:.2f}s ({count / seconds:,.0f}/s), {size / 2 ** 20:.1f} MB")
@@ -0,0 +1,218 @@
+"""Query-level instrumentation for LifeFlow's SQLite connections.
+
+get_db_connection() opens connections with InstrumentedConnection as the sqlite3
+factory. Each statement is timed from execute() until its rows are consumed (or
+the cursor is discarded), and recorded per (route, statement) in a process-wide
+MetricsRegistry. Statements slower than the threshold are logged together with
+their EXPLAIN QUERY PLAN. The registry renders itself in Prometheus text format.
+
+Overhead per statement is a couple of perf_counter() calls and one short lock
+hold, so it is meant to stay enabled in production."""
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+
+SAMPLES_PER_SERIES = 512 # Reservoir used for percentiles (most recent executions)
+QUANTILES = (0.5, 0.95, 0.99)
+MAX_QUERY_SERIES = 2000 # Statements past this many (route, statement) pairs share one overflow series per route
+OVERFLOW_STATEMENT = '(other statements)'
+_WHITESPACE = re.compile(r'\s+')
+_IN_LIST = re.compile(r'\bIN \(\?(?:, ?\?)*\)', re.IGNORECASE)
+
+slow_query_log = logging.getLogger('lifeflow.slow_query')
+
+@lru_cache(maxsize=2048) # Routes reuse a small, fixed set of statement strings
+def normalize_sql(sql):
+    # Generated IN (?, ?, ...) lists become IN (?...), so each list length is not a series of its own
+    return _IN_LIST.sub('IN (?...)', _WHITESPACE.sub(' ', sql).strip())
+
+class _Series:
+    __slots__ = ('count', 'total', 'rows', 'samples')
+    def __init__(self):
+        self.count = 0; self.total = 0.0; self.rows = 0; self.samples = deque(maxlen=SAMPLES_PER_SERIES)
+
+    def observe(self, seconds, rows=0):
+        self.count += 1; self.total += seconds; self.rows += rows; self.samples.append(seconds)
+
+    def quantile(self, q):
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+class MetricsRegistry:
+    def __init__(self, slow_query_seconds=0.1, explain=None, route_getter=None):
+        self.enabled = True
+        self.slow_query_seconds = slow_query_seconds
+        self.explain = explain # callable(sql, params) -> list of plan rows
+        self.route_getter = route_getter or (lambda: 'none')
+        self._queries = {}; self._requests = {}; self._templates = {}; self._batches = {}
+        self._lock = threading.Lock()
+
+    def record_query(self, route, sql, params, seconds, rows):
+        key = (route, normalize_sql(sql))
+        with self._lock:
+            series = self._queries.get(key)
+            if series is None:
+                if len(self._queries) >= MAX_QUERY_SERIES: key = (route, OVERFLOW_STATEMENT); series = self._queries.get(key)
+                if series is None: series = self._queries[key] = _Series()
+            series.observe(seconds, rows)
+        if seconds >= self.slow_query_seconds: self._log_slow(route, sql, params, seconds, rows)
+
+    def record_request(self, route, seconds):
+        with self._lock:
+            series = self._requests.get(route)
+            if series is None: series = self._requests[route] = _Series()
+            series.observe(seconds)
+
+    def record_template(self, name, seconds, size):
+        with self._lock:
+            series = self._templates.get(name)
+            if series is None: series = self._templates[name] = _Series()
+            series.observe(seconds, size) # rows field carries output bytes for templates
+
+    def record_batch(self, kind, seconds, items):
+        with self._lock:
+            series = self._batches.get(kind)
+            if series is None: series = self._batches[kind] = _Series()
+            series.observe(seconds, items) # rows field carries items produced (e.g. certificates)
+
+    def _log_slow(self, route, sql, params, seconds, rows):
+        plan = ''
+        if self.explain and normalize_sql(sql).upper().startswith(('SELECT', 'WITH')):
+            try: plan = '\n'.join(f"  {row[3]}" for row in self.explain(sql, params))
+            except sqlite3.Error as e: plan = f"  (plan unavailable: {e})"
+        slow_query_log.warning("Slow query on %s: %.1f ms, %d rows\n%s\n%s", route, seconds * 1000, rows, normalize_sql(sql), plan)
+
+    def reset(self):
+        with self._lock: self._queries.clear(); self._requests.clear(); self._templates.clear(); self._batches.clear()
+
+    def render_prometheus(self):
+        with self._lock:
+            queries = [(k, s.count, s.total, s.rows, [s.quantile(q) for q in QUANTILES]) for k, s in self._queries.items()]
+            requests = [(k, s.count, s.total, [s.quantile(q) for q in QUANTILES]) for k, s in self._requests.items()]
+            templates = [(k, s.count, s.total, s.rows, [s.quantile(q) for q in QUANTILES]) for k, s in self._templates.items()]
+            batches = [(k, s.count, s.total, s.rows, [s.quantile(q) for q in QUANTILES]) for k, s in self._batches.items()]
+        lines = ['# HELP lifeflow_sql_query_duration_seconds SQLite statement latency, execute to last row fetched.',
+                 '# TYPE lifeflow_sql_query_duration_seconds summary']
+        for (route, sql), count, total, _, qs in sorted(queries):
+            labels = f'route="{_escape(route)}",statement="{_escape(sql)}"'
+            for q, v in zip(QUANTILES, qs): lines.append(f'lifeflow_sql_query_duration_seconds{{{labels},quantile="{q}"}} {v:.6f}')
+            lines.append(f'lifeflow_sql_query_duration_seconds_sum{{{labels}}} {total:.6f}')
+            lines.append(f'lifeflow_sql_query_duration_seconds_count{{{labels}}} {count}')
+        lines += ['# HELP lifeflow_sql_rows_returned_total Rows fetched from SQLite statements.',
+                  '# TYPE lifeflow_sql_rows_returned_total counter']
+        for (route, sql), _, _, rows, _ in sorted(queries):
+            lines.append(f'lifeflow_sql_rows_returned_total{{route="{_escape(route)}",statement="{_escape(sql)}"}} {rows}')
+        lines += ['# HELP lifeflow_http_request_duration_seconds Flask request latency per route.',
+                  '# TYPE lifeflow_http_request_duration_seconds summary']
+        for route, count, total, qs in sorted(requests):
+            labels = f'route="{_escape(route)}"'
+            for q, v in zip(QUANTILES, qs): lines.append(f'lifeflow_http_request_duration_seconds{{{labels},quantile="{q}"}} {v:.6f}')
+            lines.append(f'lifeflow_http_request_duration_seconds_sum{{{labels}}} {total:.6f}')
+            lines.append(f'lifeflow_http_request_duration_seconds_count{{{labels}}} {count}')
+        lines += ['# HELP lifeflow_template_render_seconds Jinja render time per template.',
+                  '# TYPE lifeflow_template_render_seconds summary']
+        for name, count, total, _, qs in sorted(templates):
+            labels = f'template="{_escape(name)}"'
+            for q, v in zip(QUANTILES, qs): lines.append(f'lifeflow_template_render_seconds{{{labels},quantile="{q}"}} {v:.6f}')
+            lines.append(f'lifeflow_template_render_seconds_sum{{{labels}}} {total:.6f}')
+            lines.append(f'lifeflow_template_render_seconds_count{{{labels}}} {count}')
+        lines += ['# HELP lifeflow_template_output_bytes_total Bytes of HTML produced per template.',
+                  '# TYPE lifeflow_template_output_bytes_total counter']
+        for name, _, _, size, _ in sorted(templates):
+            lines.append(f'lifeflow_template_output_bytes_total{{template="{_escape(name)}"}} {size}')
+        lines += ['# HELP lifeflow_batch_duration_seconds Wall time of batch jobs (e.g. certificate batches).',
+                  '# TYPE lifeflow_batch_duration_seconds summary']
+        for kind, count, total, _, qs in sorted(batches):
+            labels = f'kind="{_escape(kind)}"'
+            for q, v in zip(QUANTILES, qs): lines.append(f'lifeflow_batch_duration_seconds{{{labels},quantile="{q}"}} {v:.6f}')
+            lines.append(f'lifeflow_batch_duration_seconds_sum{{{labels}}} {total:.6f}')
+            lines.append(f'lifeflow_batch_duration_seconds_count{{{labels}}} {count}')
+        lines += ['# HELP lifeflow_batch_items_total Items produced by batch jobs; divide by the duration sum for throughput.',
+                  '# TYPE lifeflow_batch_items_total counter']
+        for kind, _, _, items, _ in sorted(batches):
+            lines.append(f'lifeflow_batch_items_total{{kind="{_escape(kind)}"}} {items}')
+        return '\n'.join(lines) + '\n'
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ')
+
+# Module-level registry shared by every connection in this process (configured by app.py)
+registry = MetricsRegistry()
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Times a statement from execute() until its result set is drained, closed or discarded."""
+    _pending = None
+
+    def execute(self, sql, params=()):
+        self._finish()
+        if not registry.enabled: return super().execute(sql, params)
+        start = time.perf_counter()
+        super().execute(sql, params)
+        self._pending = [sql, params, time.perf_counter() - start, 0]
+        if self.description is None: self._finish() # DML/DDL: nothing left to fetch
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self._finish()
+        if not registry.enabled: return super().executemany(sql, seq_of_params)
+        start = time.perf_counter()
+        super().executemany(sql, seq_of_params)
+        registry.record_query(registry.route_getter(), sql, (), time.perf_counter() - start, 0)
+        return self
+
+    def fetchone(self):
+        if self._pending is None: return super().fetchone()
+        start = time.perf_counter(); row = super().fetchone()
+        self._pending[2] += time.perf_counter() - start
+        if row is None: self._finish()
+        else: self._pending[3] += 1
+        return row
+
+    def fetchmany(self, size=None):
+        if self._pending is None: return super().fetchmany(size if size is not None else self.arraysize)
+        start = time.perf_counter(); rows = super().fetchmany(size if size is not None else self.arraysize)
+        self._pending[2] += time.perf_counter() - start; self._pending[3] += len(rows)
+        if not rows: self._finish()
+        return rows
+
+    def fetchall(self):
+        if self._pending is None: return super().fetchall()
+        start = time.perf_counter(); rows = super().fetchall()
+        self._pending[2] += time.perf_counter() - start; self._pending[3] += len(rows)
+        self._finish()
+        return rows
+
+    def __next__(self):
+        if self._pending is None: return super().__next__()
+        start = time.perf_counter()
+        try: row = super().__next__()
+        except StopIteration:
+            self._pending[2] += time.perf_counter() - start; self._finish(); raise
+        self._pending[2] += time.perf_counter() - start; self._pending[3] += 1
+        return row
+
+    def close(self):
+        self._finish(); super().close()
+
+    def __del__(self):
+        self._finish()
+
+    def _finish(self):
+        pending = self._pending
+        if pending is not None:
+            self._pending = None
+            registry.record_query(registry.route_getter(), pending[0], pending[1], pending[2], pending[3])
+
+class InstrumentedConnection(sqlite3.Connection):
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
@@ -0,0 +1,213 @@
+"""Unit-level blood inventory ledger.
+
+inventory_movements is an append-only ledger. Every received batch of units is an 'in'
+lot with its collection and expiry date. Units leave through negative movements that
+point back at their lot ('issued', 'expired', 'reversal'). Only the lot's `open` flag
+is ever updated, and only by the code that closes it. A partial index over open lots
+keeps the expiry sweep and FIFO issuing proportional to the unexpired inventory.
+
+Current stock is the latest balance snapshot plus the movements appended since it,
+minus open lots that expired after the last sweep. run_jobs() sweeps expired lots in
+batches and then writes a new snapshot. It runs in a background thread of the web app
+or as `python inventory.py sweep [--shard NAME]` from cron (every shard by default).
+Every worker process starts the thread; a run is claimed in inventory_job_runs first,
+so one process does it per interval."""
+import os
+import sqlite3
+import threading
+from datetime import date, timedelta
+
+SHELF_LIFE_DAYS = 35 # Whole blood in CPDA-1; SAGM-preserved red cells last 42
+SWEEP_BATCH_SIZE = 500
+SNAPSHOTS_KEPT = 30
+JOB_INTERVAL_SECONDS = int(os.environ.get('LIFEFLOW_INVENTORY_JOB_INTERVAL', '3600'))
+
+# Approved donations become one-unit lots at the collecting hospital (skipped if already expired)
+_DONATION_LOT = f'''
+    INSERT INTO inventory_movements (hospital_id, blood_group, units, kind, collected_on, expires_on, source, source_id)
+    SELECT h.id, u.blood_group, 1, 'in', NEW.date, date(NEW.date, '+{SHELF_LIFE_DAYS} days'), 'donation', NEW.id
+    FROM hospitals h JOIN donors u ON u.id = NEW.donor_id
+    WHERE h.name = NEW.hospital AND date(NEW.date, '+{SHELF_LIFE_DAYS} days') >= date('now', 'localtime');'''
+
+_REMAINING = "l.units + IFNULL((SELECT SUM(o.units) FROM inventory_movements o WHERE o.lot_id = l.id), 0)"
+
+def init_inventory_tables(c):
+    """Called from init_db() with its cursor. Seeds the ledger the first time it is created."""
+    created = c.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='inventory_movements'").fetchone() is None
+    c.execute('''CREATE TABLE IF NOT EXISTS inventory_movements
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT, hospital_id INTEGER, blood_group TEXT, units INTEGER,
+                  kind TEXT, collected_on DATE, expires_on DATE, lot_id INTEGER, source TEXT, source_id INTEGER,
+                  open INTEGER DEFAULT 1, created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                  FOREIGN KEY(hospital_id) REFERENCES hospitals(id), FOREIGN KEY(lot_id) REFERENCES inventory_movements(id))''')
+    c.execute('''CREATE TABLE IF NOT EXISTS inventory_snapshots
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT, last_movement_id INTEGER, taken_at DATETIME DEFAULT CURRENT_TIMESTAMP)''')
+    c.execute("CREATE TABLE IF NOT EXISTS inventory_job_runs (job TEXT PRIMARY KEY, started_at DATETIME)")
+    c.execute('''CREATE TABLE IF NOT EXISTS inventory_balances
+                 (snapshot_id INTEGER, hospital_id INTEGER, blood_group TEXT, units INTEGER,
+                  PRIMARY KEY(snapshot_id, hospital_id, blood_group),
+                  FOREIGN KEY(snapshot_id) REFERENCES inventory_snapshots(id))''')
+    # Partial indexes: only lots that still hold units are indexed, so they stay small as history grows
+    c.execute("CREATE INDEX IF NOT EXISTS idx_inventory_open_expiry ON inventory_movements(expires_on) WHERE kind = 'in' AND open = 1")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_inventory_open_fifo ON inventory_movements(hospital_id, blood_group, expires_on) WHERE kind = 'in' AND open = 1")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_inventory_lot ON inventory_movements(lot_id) WHERE lot_id IS NOT NULL")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_inventory_source ON inventory_movements(source, source_id) WHERE source = 'donation'")
+
+    c.execute('''CREATE TRIGGER IF NOT EXISTS inventory_append_only BEFORE UPDATE OF hospital_id, blood_group, units, kind, collected_on, expires_on, lot_id ON inventory_movements
+                 BEGIN SELECT RAISE(ABORT, 'inventory_movements is append-only'); END;''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS inventory_no_delete BEFORE DELETE ON inventory_movements
+                 BEGIN SELECT RAISE(ABORT, 'inventory_movements is append-only'); END;''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS inventory_donation_insert AFTER INSERT ON donations
+                  WHEN NEW.status = 'Approved'
+                  BEGIN {_DONATION_LOT} END;''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS inventory_donation_approved AFTER UPDATE OF status ON donations
+                  WHEN NEW.status = 'Approved' AND OLD.status != 'Approved'
+                  BEGIN {_DONATION_LOT} END;''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS inventory_donation_revoked AFTER UPDATE OF status ON donations
+                  WHEN OLD.status = 'Approved' AND NEW.status != 'Approved'
+                  BEGIN
+                      INSERT INTO inventory_movements (hospital_id, blood_group, units, kind, lot_id, source, source_id)
+                      SELECT l.hospital_id, l.blood_group, -({_REMAINING}), 'reversal', l.id, 'donation', OLD.id
+                      FROM inventory_movements l WHERE l.source = 'donation' AND l.source_id = OLD.id AND l.kind = 'in' AND l.open = 1;
+                      UPDATE inventory_movements SET open = 0 WHERE source = 'donation' AND source_id = OLD.id AND kind = 'in';
+                  END;''')
+    if created: _seed_ledger(c)
+
+def _seed_ledger(c):
+    # Donations still within shelf life become lots; legacy external counters become lots received today
+    c.execute(f'''INSERT INTO inventory_movements (hospital_id, blood_group, units, kind, collected_on, expires_on, source, source_id)
+                  SELECT h.id, u.blood_group, 1, 'in', d.date, date(d.date, '+{SHELF_LIFE_DAYS} days'), 'donation', d.id
+                  FROM donations d JOIN donors u ON u.id = d.donor_id JOIN hospitals h ON h.name = d.hospital
+                  WHERE d.status = 'Approved' AND date(d.date, '+{SHELF_LIFE_DAYS} days') >= date('now', 'localtime')''')
+    today = date.today()
+    c.execute('''INSERT INTO inventory_movements (hospital_id, blood_group, units, kind, collected_on, expires_on, source)
+                 SELECT hospital_id, blood_group, units, 'in', ?, ?, 'external' FROM hospital_stock WHERE units > 0''',
+              (today.isoformat(), (today + timedelta(days=SHELF_LIFE_DAYS)).isoformat()))
+
+def receive_units(conn, hospital_id, blood_group, units, collected_on=None, source='external'):
+    """Appends an 'in' lot. Runs in the caller's transaction."""
+    collected = date.fromisoformat(collected_on) if collected_on else date.today()
+    expires = collected + timedelta(days=SHELF_LIFE_DAYS)
+    conn.execute('''INSERT INTO inventory_movements (hospital_id, blood_group, units, kind, collected_on, expires_on, source)
+                    VALUES (?, ?, ?, 'in', ?, ?, ?)''', (hospital_id, blood_group, units, collected.isoformat(), expires.isoformat(), source))
+    return expires
+
+def issue_units(conn, hospital_id, blood_group, units, today=None):
+    """Takes units from open lots, earliest expiry first. Returns how many were issued (less than asked if short).
+    Runs in the caller's transaction, which must hold the write lock before the lots are read; if the
+    caller has not opened one, a BEGIN IMMEDIATE transaction is started here. The caller commits."""
+    # Reading remaining units without the write lock would let two concurrent issues take the same units
+    if not conn.in_transaction: conn.execute("BEGIN IMMEDIATE TRANSACTION")
+    today = today or date.today().isoformat(); left = units
+    lots = conn.execute(f'''SELECT l.id, {_REMAINING} AS remaining FROM inventory_movements l
+                            WHERE l.kind = 'in' AND l.open = 1 AND l.hospital_id = ? AND l.blood_group = ? AND l.expires_on >= ?
+                            ORDER BY l.expires_on, l.id''', (hospital_id, blood_group, today))
+    for lot_id, remaining in lots.fetchall():
+        take = min(left, remaining)
+        if take > 0:
+            conn.execute("INSERT INTO inventory_movements (hospital_id, blood_group, units, kind, lot_id) VALUES (?, ?, ?, 'issued', ?)",
+                         (hospital_id, blood_group, -take, lot_id))
+            left -= take
+        if take == remaining: conn.execute("UPDATE inventory_movements SET open = 0 WHERE id = ?", (lot_id,))
+        if left == 0: break
+    return units - left
+
+def stock_levels(conn, hospital_id=None, today=None):
+    """{(hospital_id, blood_group): units} = latest snapshot + movements since + expired lots not yet swept."""
+    today = today or date.today().isoformat()
+    where = " AND hospital_id = ?" if hospital_id is not None else ""
+    extra = (hospital_id,) if hospital_id is not None else ()
+    rows = conn.execute(f'''
+        WITH latest AS (SELECT id, last_movement_id FROM inventory_snapshots ORDER BY id DESC LIMIT 1)
+        SELECT hospital_id, blood_group, SUM(units) FROM (
+            SELECT hospital_id, blood_group, units FROM inventory_balances WHERE snapshot_id = (SELECT id FROM latest){where}
+            UNION ALL
+            SELECT hospital_id, blood_group, units FROM inventory_movements WHERE id > IFNULL((SELECT last_movement_id FROM latest), 0){where}
+            UNION ALL
+            SELECT l.hospital_id, l.blood_group, -({_REMAINING}) FROM inventory_movements l
+            WHERE l.kind = 'in' AND l.open = 1 AND l.expires_on < ?{where.replace('hospital_id', 'l.hospital_id')}
+        ) GROUP BY hospital_id, blood_group''', extra + extra + (today,) + extra).fetchall()
+    return {(r[0], r[1]): r[2] for r in rows if r[2]}
+
+def sweep_expired(conn, today=None, batch_size=SWEEP_BATCH_SIZE):
+    """Writes an 'expired' movement for every open lot past its expiry date and closes it, batch_size lots per transaction."""
+    today = today or date.today().isoformat(); lots = units = 0
+    while True:
+        conn.execute("BEGIN IMMEDIATE TRANSACTION")
+        batch = conn.execute(f'''SELECT l.id, l.hospital_id, l.blood_group, {_REMAINING} AS remaining FROM inventory_movements l
+                                 WHERE l.kind = 'in' AND l.open = 1 AND l.expires_on < ? ORDER BY l.expires_on LIMIT ?''', (today, batch_size)).fetchall()
+        if not batch: conn.commit(); break
+        conn.executemany("INSERT INTO inventory_movements (hospital_id, blood_group, units, kind, lot_id) VALUES (?, ?, ?, 'expired', ?)",
+                         [(r[1], r[2], -r[3], r[0]) for r in batch if r[3] > 0])
+        conn.executemany("UPDATE inventory_movements SET open = 0 WHERE id = ?", [(r[0],) for r in batch])
+        conn.commit()
+        lots += len(batch); units += sum(r[3] for r in batch if r[3] > 0)
+    return lots, units
+
+def take_snapshot(conn, keep=SNAPSHOTS_KEPT):
+    """Rolls the previous snapshot forward by the movements appended since; prunes snapshots beyond `keep`."""
+    conn.execute("BEGIN IMMEDIATE TRANSACTION")
+    watermark = conn.execute("SELECT IFNULL(MAX(id), 0) FROM inventory_movements").fetchone()[0]
+    previous = conn.execute("SELECT id, last_movement_id FROM inventory_snapshots ORDER BY id DESC LIMIT 1").fetchone()
+    snapshot_id = conn.execute("INSERT INTO inventory_snapshots (last_movement_id) VALUES (?)", (watermark,)).lastrowid
+    conn.execute('''INSERT INTO inventory_balances (snapshot_id, hospital_id, blood_group, units)
+                    SELECT ?, hospital_id, blood_group, SUM(units) FROM (
+                        SELECT hospital_id, blood_group, units FROM inventory_balances WHERE snapshot_id = ?
+                        UNION ALL
+                        SELECT hospital_id, blood_group, units FROM inventory_movements WHERE id > ? AND id <= ?
+                    ) GROUP BY hospital_id, blood_group HAVING SUM(units) != 0''',
+                 (snapshot_id, previous[0] if previous else None, previous[1] if previous else 0, watermark))
+    conn.execute("DELETE FROM inventory_balances WHERE snapshot_id IN (SELECT id FROM inventory_snapshots WHERE id <= ?)", (snapshot_id - keep,))
+    conn.execute("DELETE FROM inventory_snapshots WHERE id <= ?", (snapshot_id - keep,))
+    conn.commit()
+    return snapshot_id
+
+def claim_run(conn, job, min_interval):
+    """True if this process should run `job` now: nobody started it in the last min_interval seconds."""
+    conn.execute("BEGIN IMMEDIATE TRANSACTION")
+    conn.execute("INSERT OR IGNORE INTO inventory_job_runs (job, started_at) VALUES (?, '')", (job,))
+    claimed = conn.execute("UPDATE inventory_job_runs SET started_at = datetime('now') WHERE job = ? AND started_at <= datetime('now', ?)",
+                           (job, f'-{int(min_interval)} seconds')).rowcount
+    conn.commit()
+    return claimed == 1
+
+def run_jobs(conn):
+    """The periodic batch job: expiry sweep, then a fresh balance snapshot."""
+    lots, units = sweep_expired(conn)
+    return lots, units, take_snapshot(conn)
+
+class InventoryJobs:
+    """Runs run_jobs() every interval seconds in a daemon thread, in whichever process claims the run."""
+    def __init__(self, connect, interval=JOB_INTERVAL_SECONDS):
+        self.connect = connect; self.interval = interval; self._thread = None; self._lock = threading.Lock()
+
+    def start(self):
+        if self.interval <= 0: return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self.run_forever, name='inventory-jobs', daemon=True)
+                self._thread.start()
+
+    def run_forever(self):
+        while True:
+            conn = self.connect()
+            # The claim lapses a little before the next tick, so timer drift never shuts out the worker that ran last time
+            try:
+                if claim_run(conn, 'sweep', self.interval * 0.9): run_jobs(conn)
+            except sqlite3.Error as e: print(f"Inventory job failed: {e}")
+            finally: conn.close()
+            threading.Event().wait(self.interval)
+
+if __name__ == '__main__':
+    import sys
+    from sharding import ShardRouter
+    args = sys.argv[1:]; only = None
+    if len(args) == 3 and args[1] == '--shard': only = args[2]; args = args[:1]
+    if args != ['sweep']: sys.exit("usage: python inventory.py sweep [--shard NAME]")
+    router = ShardRouter.from_env(os.environ.get('LIFEFLOW_DB', 'bloodbank.db'))
+    if only is not None and not router.valid(only): sys.exit(f"unknown shard {only!r}; shards: {', '.join(router.names)}")
+    for shard in router.shards:
+        if only is not None and shard.name != only: continue
+        conn = sqlite3.connect(shard.path)
+        try: lots, units, snapshot_id = run_jobs(conn)
+        finally: conn.close()
+        print(f"{shard.name}: expired {units} units in {lots} lots; balance snapshot #{snapshot_id} written")
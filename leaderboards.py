@@ -0,0 +1,87 @@
+"""Incrementally maintained donor leaderboards.
+
+donor_totals holds one row per donor per period - 'all', a year ('2026') and a month
+('2026-10') - with the approved volume, donation count and last donation date. City and
+blood group are copied from donors so each leaderboard is a range scan over one index
+that is already in rank order. Triggers on donations keep the totals exact on insert,
+delete and status/volume/date changes, so reading a leaderboard never touches the
+donation history. Donations moved to the archive stay counted (see archive.py), and
+archived_last_date keeps the last archived date of each row for when the hot ones go."""
+import sqlite3
+
+# The three periods a donation on day `d` contributes to
+_PERIODS = "SELECT 'all' AS period UNION ALL SELECT substr({d}, 1, 4) UNION ALL SELECT substr({d}, 1, 7)"
+
+_ADD_DONATION = f'''
+    INSERT INTO donor_totals (donor_id, period, city, blood_group, total_volume, donation_count, last_date)
+    SELECT NEW.donor_id, p.period, u.city, u.blood_group, IFNULL(NEW.volume_ml, 0), 1, NEW.date
+    FROM ({_PERIODS.format(d='NEW.date')}) p JOIN donors u ON u.id = NEW.donor_id WHERE 1
+    ON CONFLICT(donor_id, period) DO UPDATE SET total_volume = total_volume + excluded.total_volume,
+        donation_count = donation_count + 1, last_date = MAX(IFNULL(last_date, ''), excluded.last_date);'''
+
+_REMOVE_DONATION = '''
+    UPDATE donor_totals SET total_volume = total_volume - IFNULL(OLD.volume_ml, 0), donation_count = donation_count - 1,
+        last_date = NULLIF(MAX(IFNULL(archived_last_date, ''), IFNULL(
+            (SELECT MAX(date) FROM donations WHERE donor_id = OLD.donor_id AND status = 'Approved'
+             AND (donor_totals.period = 'all' OR substr(date, 1, length(donor_totals.period)) = donor_totals.period)), '')), '')
+    WHERE donor_id = OLD.donor_id AND period IN ('all', substr(OLD.date, 1, 4), substr(OLD.date, 1, 7));
+    DELETE FROM donor_totals WHERE donor_id = OLD.donor_id AND donation_count <= 0;'''
+
+def init_leaderboard_tables(c):
+    """Called from init_db() with its cursor. Backfills donor_totals the first time it is created."""
+    created = c.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='donor_totals'").fetchone() is None
+    c.execute('''CREATE TABLE IF NOT EXISTS donor_totals
+                 (donor_id INTEGER, period TEXT, city TEXT, blood_group TEXT,
+                  total_volume INTEGER DEFAULT 0, donation_count INTEGER DEFAULT 0, last_date TEXT,
+                  PRIMARY KEY(donor_id, period),
+                  FOREIGN KEY(donor_id) REFERENCES donors(id))''')
+    try: c.execute("ALTER TABLE donor_totals ADD COLUMN archived_last_date TEXT") # Set by archive.py for donations it moves out
+    except sqlite3.OperationalError: pass
+    # Top-K indexes: every leaderboard filter reads its rows in rank order straight from one of these
+    c.execute("CREATE INDEX IF NOT EXISTS idx_donor_totals_rank ON donor_totals(period, total_volume DESC)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_donor_totals_city_rank ON donor_totals(period, city, total_volume DESC)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_donor_totals_group_rank ON donor_totals(period, blood_group, total_volume DESC)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_donor_totals_city_group_rank ON donor_totals(period, city, blood_group, total_volume DESC)")
+
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS donor_totals_insert AFTER INSERT ON donations
+                  WHEN NEW.status = 'Approved'
+                  BEGIN {_ADD_DONATION} END;''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS donor_totals_delete AFTER DELETE ON donations
+                  WHEN OLD.status = 'Approved'
+                  BEGIN {_REMOVE_DONATION} END;''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS donor_totals_update_old AFTER UPDATE OF status, volume_ml, date, donor_id ON donations
+                  WHEN OLD.status = 'Approved'
+                  BEGIN {_REMOVE_DONATION} END;''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS donor_totals_update_new AFTER UPDATE OF status, volume_ml, date, donor_id ON donations
+                  WHEN NEW.status = 'Approved'
+                  BEGIN {_ADD_DONATION} END;''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS donor_totals_profile AFTER UPDATE OF city, blood_group ON donors
+                 BEGIN UPDATE donor_totals SET city = NEW.city, blood_group = NEW.blood_group WHERE donor_id = NEW.id; END;''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS donor_totals_donor_delete AFTER DELETE ON donors
+                 BEGIN DELETE FROM donor_totals WHERE donor_id = OLD.id; END;''')
+    if created: rebuild_donor_totals(c)
+
+def rebuild_donor_totals(c):
+    """Recomputes donor_totals from scratch (first migration, or after editing donations with triggers off).
+
+    Archived donations are only counted if the archive is attached as `archive` first
+    (archive.attach_archive); without it they drop out of the totals."""
+    source = "SELECT donor_id, date, volume_ml, status, NULL AS archived_date FROM main.donations"
+    if any(r[1] == 'archive' for r in c.execute("PRAGMA database_list").fetchall()):
+        source += ''' UNION ALL SELECT donor_id, date, volume_ml, status, date FROM archive.donations a
+                      WHERE NOT EXISTS (SELECT 1 FROM main.donations hot WHERE hot.id = a.id)'''
+    c.execute("DELETE FROM donor_totals")
+    for period_expr in ("'all'", "substr(d.date, 1, 4)", "substr(d.date, 1, 7)"):
+        c.execute(f'''INSERT INTO donor_totals (donor_id, period, city, blood_group, total_volume, donation_count, last_date, archived_last_date)
+                      SELECT d.donor_id, {period_expr}, u.city, u.blood_group, SUM(IFNULL(d.volume_ml, 0)), COUNT(*), MAX(d.date), MAX(d.archived_date)
+                      FROM ({source}) d JOIN donors u ON u.id = d.donor_id
+                      WHERE d.status = 'Approved' GROUP BY d.donor_id, {period_expr}''')
+
+def leaderboard_query(period='all', city=None, blood_group=None):
+    """(sql, params) for one leaderboard in rank order; callers add LIMIT/OFFSET (e.g. paginate())."""
+    sql = '''SELECT t.donor_id, u.name, t.blood_group, t.city, t.total_volume, t.donation_count, t.last_date
+             FROM donor_totals t JOIN donors u ON u.id = t.donor_id WHERE t.period = ?'''
+    params = [period]
+    if city: sql += " AND t.city = ?"; params.append(city)
+    if blood_group: sql += " AND t.blood_group = ?"; params.append(blood_group)
+    return sql + " ORDER BY t.total_volume DESC, u.name ASC", params
@@ -0,0 +1,97 @@
+"""Regional sharding: each city or region keeps its donors, hospitals, camps and donations
+in its own SQLite file, so writes in one region never wait on another region's write lock.
+
+The shard map is a JSON file named by LIFEFLOW_SHARDS:
+
+    [{"name": "chennai", "path": "bloodbank.db", "cities": ["Chennai", "Chengalpattu"]},
+     {"name": "coimbatore", "path": "shards/coimbatore.db", "cities": ["Coimbatore", "Tiruppur"]}]
+
+The first shard is the home shard. It holds the admin account and takes any city that
+no shard lists. Without LIFEFLOW_SHARDS there is a single home shard at the default
+database path, which is exactly the unsharded layout.
+
+Shard N allocates row ids from N * ID_SPAN upwards (see reserve_id_range), so an id
+names its shard and routes that receive only an id can still find the right file.
+Shards must therefore only ever be appended to the map, never reordered.
+
+Cross-shard reads go through scatter(). It runs one callable per shard on a thread
+pool, since SQLite releases the GIL while it reads, and returns the results in shard
+order for the caller to merge.
+
+    python sharding.py status
+"""
+import heapq
+import json
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+ID_SPAN = 10 ** 12 # Row ids per shard; far beyond what one SQLite file will ever allocate
+
+class Shard:
+    __slots__ = ('name', 'path', 'cities', 'index')
+    def __init__(self, name, path, cities, index):
+        self.name = name; self.path = path; self.cities = cities; self.index = index
+
+class ShardRouter:
+    def __init__(self, shards):
+        if not shards: raise ValueError('at least one shard is required')
+        self.shards = [Shard(s['name'], s['path'], {c.strip().lower() for c in s.get('cities', [])}, i) for i, s in enumerate(shards)]
+        self.by_name = {s.name: s for s in self.shards}
+        if len(self.by_name) != len(self.shards): raise ValueError('shard names must be unique')
+        self.home = self.shards[0].name
+        self.names = [s.name for s in self.shards]
+        self._city = {city: s.name for s in reversed(self.shards) for city in s.cities}
+        self._pool = ThreadPoolExecutor(max_workers=len(self.shards), thread_name_prefix='lifeflow-shard') if len(self.shards) > 1 else None
+
+    @classmethod
+    def from_env(cls, default_path):
+        config = os.environ.get('LIFEFLOW_SHARDS')
+        if not config: return cls([{'name': 'default', 'path': default_path}])
+        with open(config, encoding='utf-8') as f: return cls(json.load(f))
+
+    def path(self, name):
+        return self.by_name[name].path
+
+    def valid(self, name):
+        return name if name in self.by_name else None
+
+    def shard_for_city(self, city):
+        return self._city.get((city or '').strip().lower(), self.home)
+
+    def shard_for_id(self, row_id):
+        index = int(row_id) // ID_SPAN
+        return self.shards[index].name if 0 <= index < len(self.shards) else self.home
+
+    def scatter(self, fn, names=None):
+        """Calls fn(shard_name) for every shard (or the given ones) in parallel; results in shard order."""
+        names = list(names or self.names)
+        if self._pool is None or len(names) == 1: return [fn(name) for name in names]
+        return list(self._pool.map(fn, names))
+
+def reserve_id_range(conn, index):
+    """Starts every AUTOINCREMENT table of shard `index` at index * ID_SPAN (no-op for the home shard)."""
+    if index == 0: return
+    base = index * ID_SPAN
+    for (table,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND sql LIKE '%AUTOINCREMENT%'").fetchall():
+        row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,)).fetchone()
+        if row is None: conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table, base))
+        elif row[0] < base: conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = ?", (base, table))
+
+def merge_sorted(results, key, limit=None, reverse=False):
+    """Merges per-shard lists that are each already sorted by key."""
+    merged = heapq.merge(*results, key=key, reverse=reverse)
+    return [row for _, row in zip(range(limit), merged)] if limit is not None else list(merged)
+
+if __name__ == '__main__':
+    import sys
+    if sys.argv[1:] != ['status']: sys.exit("usage: python sharding.py status")
+    router = ShardRouter.from_env(os.environ.get('LIFEFLOW_DB', 'bloodbank.db'))
+    def counts(name):
+        conn = sqlite3.connect(router.path(name))
+        try: return [conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0] for t in ('donors', 'hospitals', 'donations', 'appointments')]
+        except sqlite3.OperationalError: return None
+        finally: conn.close()
+    print(f"{'shard':<14} {'path':<28} {'donors':>8} {'hospitals':>10} {'donations':>10} {'appointments':>13}")
+    for shard, row in zip(router.shards, router.scatter(counts)):
+        print(f"{shard.name:<14} {shard.path:<28} " + (' '.join(f"{n:>{w}}" for n, w in zip(row, (8, 10, 10, 13))) if row else 'not initialised'))
@@ -0,0 +1,277 @@
+"""Mass SOS alert campaigns: nearest eligible donors selection + throttled notification fan-out.
+
+Donor coordinates are kept in per-blood-group NumPy arrays (DonorCoordinateIndex), so
+picking the nearest N donors out of a million is one vectorized haversine pass plus an
+argpartition, instead of one Python UDF call per row inside SQLite.
+
+Selected donors are written to sos_notifications with status 'Queued'. A dispatcher
+thread (or `python sos_campaigns.py dispatch` as its own process) drains the queue at a
+fixed rate through a local SMTP stand-in for email and an outbox file for SMS.
+Every worker process runs a dispatcher; each one claims its batch atomically (status
+'Sending'), so a notification is sent by exactly one of them. They all take their send
+tokens from one SharedTokenBucket per host (shared_send_limiter), so the host as a whole
+sends at most LIFEFLOW_SOS_SEND_RATE notifications per second. Email and SMS delivery
+are tracked separately: a retry only repeats the channel that failed.
+A donor is alerted at most once per campaign (UNIQUE(campaign_id, donor_id)) and at most
+once per COOLDOWN_HOURS across overlapping campaigns."""
+import os
+import smtplib
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+from datetime import date, datetime, timedelta, timezone
+from email.message import EmailMessage
+import numpy as np
+from traffic_control import SharedTokenBucket
+
+EARTH_RADIUS_KM = 6371.0
+ELIGIBILITY_DAYS = 90 # Same rule as check_eligibility() in app.py
+COOLDOWN_HOURS = int(os.environ.get('LIFEFLOW_SOS_COOLDOWN_HOURS', '24'))
+INDEX_TTL_SECONDS = 300
+SEND_RATE_PER_SECOND = float(os.environ.get('LIFEFLOW_SOS_SEND_RATE', '20'))
+MAX_ATTEMPTS = 3
+CLAIM_TIMEOUT_SECONDS = 600 # A claim older than this belonged to a dispatcher that died mid-batch
+SMTP_HOST = os.environ.get('LIFEFLOW_SOS_SMTP_HOST', 'localhost')
+SMTP_PORT = int(os.environ.get('LIFEFLOW_SOS_SMTP_PORT', '1025')) # e.g. `python -m aiosmtpd -n -l localhost:1025`
+SMS_OUTBOX = os.environ.get('LIFEFLOW_SOS_SMS_OUTBOX', os.path.join('instance', 'sms_outbox.log'))
+SENDER_EMAIL = 'sos@lifeflow.local'
+
+def init_sos_tables(c):
+    """Called from init_db() with its cursor."""
+    c.execute('''CREATE TABLE IF NOT EXISTS sos_campaigns
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT, hospital_id INTEGER, blood_group TEXT,
+                  lat REAL, lng REAL, radius_km REAL, target_count INTEGER, status TEXT DEFAULT 'Active',
+                  created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                  FOREIGN KEY(hospital_id) REFERENCES hospitals(id))''')
+    c.execute('''CREATE TABLE IF NOT EXISTS sos_notifications
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT, campaign_id INTEGER, donor_id INTEGER, distance_km REAL,
+                  status TEXT DEFAULT 'Queued', attempts INTEGER DEFAULT 0, last_error TEXT,
+                  queued_at DATETIME DEFAULT CURRENT_TIMESTAMP, sent_at DATETIME,
+                  UNIQUE(campaign_id, donor_id),
+                  FOREIGN KEY(campaign_id) REFERENCES sos_campaigns(id), FOREIGN KEY(donor_id) REFERENCES donors(id))''')
+    # Dispatcher claims and per-channel delivery (NULL = not delivered yet; 'Sent', 'Skipped' without an address, 'Failed')
+    for column in ('claimed_by TEXT', 'claimed_at DATETIME', 'email_status TEXT', 'sms_status TEXT'):
+        try: c.execute(f"ALTER TABLE sos_notifications ADD COLUMN {column}")
+        except sqlite3.OperationalError: pass
+    c.execute("CREATE INDEX IF NOT EXISTS idx_sos_notification_time ON sos_notifications(queued_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_sos_notification_status ON sos_notifications(status, id)")
+
+# =========================================================================
+# VECTORIZED NEAREST-DONOR SELECTION
+# =========================================================================
+def haversine_np(lat, lng, lats, lngs):
+    """Distance in km from one point to every point in the lats/lngs arrays (degrees)."""
+    lat1 = np.radians(lat); lats2 = np.radians(lats)
+    d_lat = lats2 - lat1; d_lng = np.radians(lngs) - np.radians(lng)
+    a = np.sin(d_lat / 2) ** 2 + np.cos(lat1) * np.cos(lats2) * np.sin(d_lng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+class DonorCoordinateIndex:
+    """Process-wide cache of (id, lat, lng) arrays per blood group, refreshed after INDEX_TTL_SECONDS or invalidate().
+    Entries are kept per database shard (the connection's `shard` attribute, see app.get_db_connection)."""
+    def __init__(self, ttl=INDEX_TTL_SECONDS):
+        self.ttl = ttl; self._groups = {}; self._lock = threading.Lock()
+
+    def arrays(self, conn, blood_group):
+        key = (getattr(conn, 'shard', None), blood_group)
+        with self._lock:
+            entry = self._groups.get(key)
+            if entry and time.monotonic() - entry[0] < self.ttl: return entry[1]
+        rows = conn.execute("SELECT id, lat, lng FROM donors WHERE blood_group = ? AND role != 'admin' AND lat IS NOT NULL AND lng IS NOT NULL",
+                            (blood_group,)).fetchall()
+        data = np.array([tuple(r) for r in rows], dtype=np.float64).reshape(-1, 3)
+        arrays = (data[:, 0].astype(np.int64), np.ascontiguousarray(data[:, 1]), np.ascontiguousarray(data[:, 2]))
+        with self._lock: self._groups[key] = (time.monotonic(), arrays)
+        return arrays
+
+    def invalidate(self, blood_group=None):
+        with self._lock:
+            if blood_group is None: self._groups.clear()
+            else:
+                for key in [k for k in self._groups if k[1] == blood_group]: del self._groups[key]
+
+donor_index = DonorCoordinateIndex()
+
+def ineligible_donor_ids(conn):
+    """Donors who gave blood in the last ELIGIBILITY_DAYS or were alerted within the cooldown window."""
+    cutoff = (date.today() - timedelta(days=ELIGIBILITY_DAYS)).strftime('%Y-%m-%d')
+    alert_cutoff = (datetime.now(timezone.utc) - timedelta(hours=COOLDOWN_HOURS)).strftime('%Y-%m-%d %H:%M:%S')
+    rows = conn.execute('''
+        SELECT donor_id FROM donations WHERE date >= ? AND status IN ('Approved', 'Pending', 'Archived')
+        UNION SELECT donor_id FROM appointments WHERE status = 'Verified' AND date >= ?
+        UNION SELECT donor_id FROM sos_notifications WHERE queued_at >= ? AND status != 'Failed'
+    ''', (cutoff, cutoff, alert_cutoff)).fetchall()
+    return np.fromiter((r[0] for r in rows if r[0] is not None), dtype=np.int64)
+
+def select_nearest_donors(conn, lat, lng, blood_group, radius_km, limit, arrays=None):
+    """Returns [(donor_id, distance_km), ...] for the nearest eligible donors, closest first."""
+    ids, lats, lngs = arrays or donor_index.arrays(conn, blood_group)
+    if not len(ids): return []
+    distances = haversine_np(float(lat), float(lng), lats, lngs)
+    mask = distances <= radius_km
+    excluded = ineligible_donor_ids(conn)
+    if len(excluded): mask &= ~np.isin(ids, excluded)
+    candidates = np.flatnonzero(mask)
+    if len(candidates) > limit:
+        candidates = candidates[np.argpartition(distances[candidates], limit - 1)[:limit]]
+    candidates = candidates[np.argsort(distances[candidates], kind='stable')]
+    return list(zip(ids[candidates].tolist(), np.round(distances[candidates], 2).tolist()))
+
+# =========================================================================
+# CAMPAIGNS
+# =========================================================================
+def create_campaign(conn, hospital_id, lat, lng, blood_group, radius_km, target_count):
+    """Selects recipients and enqueues their notifications in one transaction. Returns (campaign_id, queued).
+    Selection runs under the write lock so overlapping campaigns see each other's cooldowns; the
+    donor coordinate arrays are loaded before it, so a cold index never holds the lock."""
+    arrays = donor_index.arrays(conn, blood_group)
+    conn.execute("BEGIN IMMEDIATE TRANSACTION")
+    try:
+        recipients = select_nearest_donors(conn, lat, lng, blood_group, radius_km, target_count, arrays)
+        cur = conn.execute("INSERT INTO sos_campaigns (hospital_id, blood_group, lat, lng, radius_km, target_count) VALUES (?, ?, ?, ?, ?, ?)",
+                           (hospital_id, blood_group, lat, lng, radius_km, target_count))
+        campaign_id = cur.lastrowid
+        before = conn.total_changes
+        conn.executemany("INSERT OR IGNORE INTO sos_notifications (campaign_id, donor_id, distance_km) VALUES (?, ?, ?)",
+                         [(campaign_id, donor_id, distance) for donor_id, distance in recipients])
+        queued = conn.total_changes - before
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return campaign_id, queued
+
+def campaign_status(conn, campaign_id, hospital_id):
+    campaign = conn.execute("SELECT * FROM sos_campaigns WHERE id = ? AND hospital_id = ?", (campaign_id, hospital_id)).fetchone()
+    if not campaign: return None
+    counts = dict(conn.execute("SELECT status, COUNT(*) FROM sos_notifications WHERE campaign_id = ? GROUP BY status", (campaign_id,)).fetchall())
+    return {'id': campaign['id'], 'blood_group': campaign['blood_group'], 'radius_km': campaign['radius_km'],
+            'target_count': campaign['target_count'], 'created_at': campaign['created_at'], 'notifications': counts}
+
+# =========================================================================
+# THROTTLED NOTIFICATION FAN-OUT
+# =========================================================================
+def alert_text(alert):
+    return (f"URGENT: {alert['hospital_name']} needs {alert['blood_group']} blood donors now. "
+            f"You are about {alert['distance_km']} km away. Please call {alert['hospital_email']} if you can donate today.")
+
+def send_email(alert):
+    """Email through the local SMTP stand-in."""
+    msg = EmailMessage()
+    msg['Subject'] = f"LifeFlow SOS: {alert['blood_group']} blood needed at {alert['hospital_name']}"
+    msg['From'] = SENDER_EMAIL; msg['To'] = alert['email']
+    msg.set_content(f"Hi {alert['name']},\n\n{alert_text(alert)}\n\nThe LifeFlow Team")
+    with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=10) as smtp: smtp.send_message(msg)
+
+def send_sms(alert):
+    """SMS appended to the outbox file."""
+    os.makedirs(os.path.dirname(SMS_OUTBOX) or '.', exist_ok=True)
+    with open(SMS_OUTBOX, 'a', encoding='utf-8') as outbox: outbox.write(f"{datetime.now(timezone.utc).isoformat(timespec='seconds')}\t{alert['phone']}\t{alert_text(alert)}\n")
+
+# channel -> (donor column holding its address, sender)
+CHANNELS = {'email': ('email', send_email), 'sms': ('phone', send_sms)}
+
+def shared_send_limiter(db_path, rate=SEND_RATE_PER_SECOND):
+    """The host-wide send bucket for db_path's deployment, shared by every dispatcher in every process (None if unthrottled)."""
+    if rate <= 0: return None
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return SharedTokenBucket(rate, 1, os.path.join(directory, f"lifeflow_sos_send_{zlib.crc32(os.path.abspath(db_path).encode())}.bin"), slots=8)
+
+class NotificationDispatcher:
+    """Drains queued notifications at rate_per_second. Any number of dispatchers may share one queue.
+
+    With a limiter (see shared_send_limiter) the rate is shared with every dispatcher using
+    it; without one it applies to this dispatcher alone."""
+    def __init__(self, connect, rate_per_second=SEND_RATE_PER_SECOND, channels=CHANNELS, batch_size=100, limiter=None):
+        self.connect = connect; self.rate = rate_per_second; self.channels = channels; self.limiter = limiter
+        # About ten seconds of sends per claim, so a batch waiting on a shared limiter finishes long before its claim goes stale
+        self.batch_size = min(batch_size, max(1, int(rate_per_second * 10))) if rate_per_second > 0 else batch_size
+        self.name = f"{os.getpid()}-{id(self):x}"
+        self._wake = threading.Event(); self._thread = None; self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self.run_forever, name='sos-dispatcher', daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def run_forever(self, idle_seconds=5.0):
+        while True:
+            if not self.drain_once(): self._wake.wait(idle_seconds); self._wake.clear()
+
+    def claim(self, conn):
+        """Atomically moves up to batch_size queued (or abandoned) notifications to 'Sending' for this dispatcher."""
+        stale = (datetime.now(timezone.utc) - timedelta(seconds=CLAIM_TIMEOUT_SECONDS)).strftime('%Y-%m-%d %H:%M:%S')
+        conn.execute("BEGIN IMMEDIATE TRANSACTION")
+        try:
+            ids = [r[0] for r in conn.execute('''
+                UPDATE sos_notifications SET status = 'Sending', claimed_by = ?, claimed_at = CURRENT_TIMESTAMP
+                WHERE id IN (SELECT id FROM sos_notifications WHERE status = 'Queued' OR (status = 'Sending' AND claimed_at < ?)
+                             ORDER BY id LIMIT ?)
+                RETURNING id''', (self.name, stale, self.batch_size)).fetchall()]
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return ids
+
+    def drain_once(self):
+        """Claims and sends one batch; returns the number of notifications processed."""
+        conn = self.connect()
+        try:
+            ids = self.claim(conn)
+            if not ids: return 0
+            batch = conn.execute(f'''
+                SELECT n.id, n.attempts, n.email_status, n.sms_status, n.distance_km, d.name, d.email, d.phone,
+                       c.blood_group, h.name as hospital_name, h.email as hospital_email
+                FROM sos_notifications n JOIN donors d ON n.donor_id = d.id
+                JOIN sos_campaigns c ON n.campaign_id = c.id JOIN hospitals h ON c.hospital_id = h.id
+                WHERE n.id IN ({','.join('?' * len(ids))}) ORDER BY n.id''', ids).fetchall()
+            interval = 1.0 / self.rate if self.rate > 0 and self.limiter is None else 0.0
+            for row in batch:
+                started = time.monotonic()
+                if self.limiter: self._take_token()
+                self.deliver(conn, row)
+                wait = interval - (time.monotonic() - started)
+                if wait > 0: time.sleep(wait)
+            return len(ids)
+        finally:
+            conn.close()
+
+    def _take_token(self):
+        while True:
+            allowed, retry_after = self.limiter.allow('send')
+            if allowed: return
+            time.sleep(retry_after)
+
+    def deliver(self, conn, row):
+        """Sends every channel not delivered yet and records each outcome; requeues while a channel can still be retried."""
+        results = {}; errors = []
+        for channel, (address, sender) in self.channels.items():
+            status = row[f'{channel}_status']
+            if status is not None: results[channel] = status; continue
+            if not row[address]: results[channel] = 'Skipped'; continue
+            try: sender(row); results[channel] = 'Sent'
+            except (OSError, smtplib.SMTPException) as e: results[channel] = None; errors.append(f"{channel}: {e}")
+        exhausted = row['attempts'] + 1 >= MAX_ATTEMPTS
+        if errors and exhausted: results = {k: v or 'Failed' for k, v in results.items()}
+        if errors and not exhausted: status = 'Queued'
+        else: status = 'Sent' if 'Sent' in results.values() else 'Failed'
+        conn.execute('''UPDATE sos_notifications SET status = ?, attempts = attempts + 1, email_status = ?, sms_status = ?,
+                            last_error = ?, claimed_by = NULL, claimed_at = NULL,
+                            sent_at = CASE WHEN ? = 'Sent' THEN CURRENT_TIMESTAMP ELSE sent_at END
+                        WHERE id = ? AND claimed_by = ?''',
+                     (status, results.get('email'), results.get('sms'), '; '.join(errors)[:200] or None, status, row['id'], self.name))
+        conn.commit()
+
+if __name__ == '__main__':
+    import sys
+    if sys.argv[1:] != ['dispatch']: sys.exit("usage: python sos_campaigns.py dispatch")
+    db_path = os.environ.get('LIFEFLOW_DB', 'bloodbank.db')
+    def connect():
+        conn = sqlite3.connect(db_path); conn.row_factory = sqlite3.Row
+        return conn
+    NotificationDispatcher(connect, limiter=shared_send_limiter(db_path)).run_forever()
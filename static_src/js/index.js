@@ -0,0 +1,21 @@
+document.addEventListener("DOMContentLoaded", function() {
+    if (!sessionStorage.getItem('leaderboardShown')) {
+        var myModal = new bootstrap.Modal(document.getElementById('welcomeLeaderboardModal'));
+        myModal.show();
+        sessionStorage.setItem('leaderboardShown', 'true');
+    }
+    filterHospitals();
+});
+
+function filterHospitals() {
+    let selected = document.getElementById('cityFilter').value;
+    let cards = document.querySelectorAll('.hospital-card');
+
+    cards.forEach(card => {
+        if (selected === 'all' || card.getAttribute('data-city') === selected) {
+            card.style.display = 'block';
+        } else {
+            card.style.display = 'none';
+        }
+    });
+}
@@ -0,0 +1,47 @@
+function toggleChat() {
+    var chat = document.getElementById('chatWindow');
+    if (chat.style.display === 'flex') {
+        chat.style.display = 'none';
+    } else {
+        chat.style.display = 'flex';
+    }
+}
+
+function handleEnter(e) {
+    if (e.key === 'Enter') sendMessage();
+}
+
+function sendMessage() {
+    var input = document.getElementById('chatInput');
+    var message = input.value.trim();
+    if (message === "") return;
+
+    addMessage(message, 'user');
+    input.value = "";
+
+    setTimeout(() => {
+        var botReply = getBotResponse(message.toLowerCase());
+        addMessage(botReply, 'bot');
+    }, 600);
+}
+
+function addMessage(text, sender) {
+    var chatBody = document.getElementById('chatBody');
+    var div = document.createElement('div');
+    div.classList.add('msg', sender === 'user' ? 'msg-user' : 'msg-bot');
+    div.innerText = text;
+    chatBody.appendChild(div);
+    chatBody.scrollTop = chatBody.scrollHeight;
+}
+
+function getBotResponse(msg) {
+    if (msg.includes('hello') || msg.includes('hi')) return "Hello! How can I save a life today? 🩸";
+    if (msg.includes('emergency') || msg.includes('urgent') || msg.includes('need blood')) return "🚨 FOR EMERGENCIES: Please click the RED phone button on the left immediately or call 108!";
+    if (msg.includes('donate') || msg.includes('give blood')) return "That's wonderful! ❤️ Please login and check 'Upcoming Camps' or visit a nearby hospital.";
+    if (msg.includes('stock') || msg.includes('available')) return "You can see the live blood stock on our Home Page dashboard.";
+    if (msg.includes('certificate')) return "You can download your donation certificate from your Donor Dashboard after the hospital approves your donation.";
+    if (msg.includes('camp')) return "We have several camps scheduled! Check the 'Upcoming Camps' section on the home page.";
+    if (msg.includes('login') || msg.includes('password')) return "Click the 'Login' button at the top right. If you forgot your password, contact Admin.";
+
+    return "I'm still learning! 🤔 You can ask me about donating, stock, or emergency contacts.";
+}
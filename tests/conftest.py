@@ -0,0 +1,64 @@
+"""Shared fixtures for the LifeFlow tests.
+
+app.py is imported once per session from inside a temporary directory, so init_db()
+creates an empty bloodbank.db (and archive.db, analytics.db) there and the real
+database is never touched. The change feed is enabled so its triggers are installed."""
+import os
+import sys
+import itertools
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path: sys.path.insert(0, REPO_ROOT)
+# Read when cdc.py is first imported, which test modules do before any fixture runs
+os.environ['LIFEFLOW_CDC'] = '1'
+os.environ.setdefault('LIFEFLOW_PUBLIC_RATE', '0')
+_serial = itertools.count(1)
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    workdir = tmp_path_factory.mktemp('lifeflow')
+    previous = os.getcwd(); os.chdir(workdir)
+    import app
+    yield app
+    os.chdir(previous)
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+@pytest.fixture
+def conn(app_module):
+    conn = app_module.get_db_connection(app_module.shards.home)
+    yield conn
+    conn.close()
+
+@pytest.fixture
+def login():
+    def login(client, role, user_id, name):
+        with client.session_transaction() as s:
+            s['user_id'] = user_id; s['role'] = role; s['name'] = name
+    return login
+
+@pytest.fixture
+def make_donor(conn):
+    """Inserts a donor with a unique phone and email; returns its id."""
+    def make_donor(name='Test Donor', city='Chennai', blood_group='O+', password='original-hash'):
+        n = next(_serial)
+        donor_id = conn.execute("""INSERT INTO donors (name, email, age, weight, blood_group, city, address, phone, password, role)
+                                   VALUES (?, ?, 30, 70, ?, ?, 'Test Street', ?, ?, 'user')""",
+                                (name, f'donor{n}@test.local', blood_group, city, f'8{n:09d}', password)).lastrowid
+        conn.commit()
+        return donor_id
+    return make_donor
+
+@pytest.fixture
+def make_hospital(conn):
+    """Inserts a hospital with a unique name and email; returns (id, name)."""
+    def make_hospital():
+        n = next(_serial); name = f'Test Hospital {n}'
+        hospital_id = conn.execute("INSERT INTO hospitals (name, email, password, lat, lng, type) VALUES (?, ?, 'x', 13.08, 80.27, 'Hospital')",
+                                   (name, f'hospital{n}@test.local')).lastrowid
+        conn.commit()
+        return hospital_id, name
+    return make_hospital
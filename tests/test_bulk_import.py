@@ -0,0 +1,32 @@
+import io
+from bulk_import import import_csv
+
+HEADER = 'name,email,phone,password,blood_group,city,age,weight,address\n'
+
+def donor_row(conn, phone):
+    return conn.execute("SELECT name, email, password, blood_group FROM donors WHERE phone = ?", (phone,)).fetchone()
+
+def test_existing_phone_is_reported_and_not_overwritten(conn, make_donor):
+    donor_id = make_donor(name='Existing Donor')
+    phone = conn.execute("SELECT phone FROM donors WHERE id = ?", (donor_id,)).fetchone()['phone']
+    before = tuple(donor_row(conn, phone))
+    csv_text = HEADER + f'Imposter,imposter@test.local,{phone},newpass,AB-,Chennai,40,80,Elsewhere\n' \
+                      + 'Fresh Donor,fresh.import@test.local,7000000001,pass,A+,Chennai,25,60,Street\n'
+    report = import_csv(conn, 'donors', io.StringIO(csv_text))
+    assert (report.rows, report.inserted, report.skipped, report.error_count) == (2, 1, 1, 1)
+    line, message = report.errors[0]
+    assert line == 2 and phone in message
+    assert tuple(donor_row(conn, phone)) == before
+    assert donor_row(conn, '7000000001')['name'] == 'Fresh Donor'
+
+def test_admin_import_keeps_existing_donor(client, conn, login, make_donor):
+    donor_id = make_donor(name='Existing Donor')
+    phone = conn.execute("SELECT phone FROM donors WHERE id = ?", (donor_id,)).fetchone()['phone']
+    before = tuple(donor_row(conn, phone))
+    login(client, 'admin', 1, 'Admin')
+    csv_text = HEADER + f'Imposter,imposter2@test.local,{phone},newpass,AB-,Chennai,40,80,Elsewhere\n'
+    r = client.post('/admin/bulk_import', data={'kind': 'donors', 'csv_file': (io.BytesIO(csv_text.encode()), 'donors.csv')},
+                    content_type='multipart/form-data', follow_redirects=True)
+    assert r.status_code == 200
+    assert b'already registered; row skipped' in r.data
+    assert tuple(donor_row(conn, phone)) == before
@@ -0,0 +1,28 @@
+import pytest
+from cdc import pull_changes, register_consumer, drop_consumer, head_seq, CursorExpired
+
+def test_expired_cursor_must_resync(client, conn, login, make_donor):
+    login(client, 'admin', 1, 'Admin')
+    start = client.post('/api/changes/register', json={'consumer': 'test-expiry'}).get_json()['cursor']
+    make_donor(); make_donor()
+    batch = client.get('/api/changes', query_string={'consumer': 'test-expiry'}).get_json()
+    assert [c['table'] for c in batch['changes']] == ['donors', 'donors']
+
+    # Once every consumer has acknowledged them, the changes are compacted away
+    ack = client.post('/api/changes/ack', json={'consumer': 'test-expiry', 'seq': batch['next_cursor']}).get_json()
+    assert ack['compacted'] >= 2
+
+    r = client.get('/api/changes', query_string={'since': start})
+    assert r.status_code == 410 and r.get_json()['resync'] is True
+    with pytest.raises(CursorExpired): pull_changes(conn, start)
+    r = client.post('/api/changes/register', json={'consumer': 'late-consumer', 'since': start})
+    assert r.status_code == 410 and r.get_json()['resync'] is True
+
+    # The consumer's own cursor is still valid
+    assert client.get('/api/changes', query_string={'consumer': 'test-expiry'}).get_json()['changes'] == []
+    assert drop_consumer(conn, 'test-expiry')
+
+def test_register_at_head_never_expires(conn):
+    register_consumer(conn, 'test-head')
+    assert pull_changes(conn, head_seq(conn))['changes'] == []
+    assert drop_consumer(conn, 'test-head')
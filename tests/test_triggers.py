@@ -0,0 +1,72 @@
+from datetime import date, timedelta
+from archive import archive_history
+
+HORIZON = 730
+
+def days_ago(n):
+    return (date.today() - timedelta(days=n)).isoformat()
+
+def totals(conn, donor_id):
+    return {r['period']: (r['total_volume'], r['donation_count'], r['last_date'])
+            for r in conn.execute("SELECT period, total_volume, donation_count, last_date FROM donor_totals WHERE donor_id = ?", (donor_id,))}
+
+def add_donation(conn, donor_id, day, volume=450, status='Approved'):
+    donation_id = conn.execute("INSERT INTO donations (donor_id, date, volume_ml, hospital, status) VALUES (?, ?, ?, 'Test Hospital', ?)",
+                               (donor_id, day, volume, status)).lastrowid
+    conn.commit()
+    return donation_id
+
+def test_donor_totals_follow_inserts_updates_and_deletes(conn, make_donor):
+    donor_id = make_donor()
+    first = add_donation(conn, donor_id, '2025-03-10')
+    second = add_donation(conn, donor_id, '2025-07-01', volume=350)
+    pending = add_donation(conn, donor_id, '2025-07-20', status='Pending')
+    assert totals(conn, donor_id) == {'all': (800, 2, '2025-07-01'), '2025': (800, 2, '2025-07-01'),
+                                      '2025-03': (450, 1, '2025-03-10'), '2025-07': (350, 1, '2025-07-01')}
+
+    conn.execute("UPDATE donations SET status = 'Approved' WHERE id = ?", (pending,)); conn.commit()
+    assert totals(conn, donor_id)['2025-07'] == (800, 2, '2025-07-20')
+    conn.execute("UPDATE donations SET status = 'Rejected' WHERE id = ?", (second,)); conn.commit()
+    assert totals(conn, donor_id)['2025-07'] == (450, 1, '2025-07-20')
+
+    conn.execute("DELETE FROM donations WHERE id IN (?, ?)", (first, pending)); conn.commit()
+    assert totals(conn, donor_id) == {}
+
+def test_donor_totals_survive_archival(app_module, conn, make_donor):
+    donor_id = make_donor()
+    old = days_ago(HORIZON + 200)
+    add_donation(conn, donor_id, old)
+    recent = add_donation(conn, donor_id, days_ago(10))
+    before = totals(conn, donor_id)
+
+    moved = archive_history(conn, app_module.current_archive(), HORIZON)
+    assert moved['donations'] >= 1
+    assert conn.execute("SELECT COUNT(*) FROM donations WHERE donor_id = ?", (donor_id,)).fetchone()[0] == 1
+    assert totals(conn, donor_id) == before
+
+    # Removing the hot donation falls back to the archived date instead of forgetting it
+    conn.execute("DELETE FROM donations WHERE id = ?", (recent,)); conn.commit()
+    assert totals(conn, donor_id)['all'] == (450, 1, old)
+
+def test_registered_count_follows_registrations_and_archival(app_module, conn, make_donor):
+    host_id = conn.execute("INSERT INTO camp_hosts (organization_name, email, password, city) VALUES ('Test Host', NULL, 'x', 'Chennai')").lastrowid
+    camp_day = days_ago(HORIZON + 100)
+    camp_id = conn.execute("""INSERT INTO camps (host_id, name, date, city, estimated_participants, registered_count)
+                              VALUES (?, 'Old Camp', ?, 'Chennai', 10, 0)""", (host_id, camp_day)).lastrowid
+    conn.commit()
+    registrations = []
+    for _ in range(3):
+        donor_id = make_donor()
+        registrations.append(conn.execute("INSERT INTO camp_registrations (camp_id, donor_id, booking_date) VALUES (?, ?, ?)",
+                                          (camp_id, donor_id, camp_day)).lastrowid)
+        conn.execute("UPDATE camps SET registered_count = registered_count + 1 WHERE id = ?", (camp_id,)) # As book_appointment does
+    conn.commit()
+    count = lambda: conn.execute("SELECT registered_count FROM camps WHERE id = ?", (camp_id,)).fetchone()[0]
+
+    conn.execute("DELETE FROM camp_registrations WHERE id = ?", (registrations[0],)); conn.commit()
+    assert count() == 2
+
+    moved = archive_history(conn, app_module.current_archive(), HORIZON)
+    assert moved['camp_registrations'] >= 2
+    assert conn.execute("SELECT COUNT(*) FROM camp_registrations WHERE camp_id = ?", (camp_id,)).fetchone()[0] == 0
+    assert count() == 2
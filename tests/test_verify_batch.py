@@ -0,0 +1,30 @@
+from datetime import date
+
+def test_verify_batch_is_idempotent(app_module, client, conn, login, make_donor, make_hospital):
+    hospital_id, hospital_name = make_hospital()
+    donor_id = make_donor(); today = date.today().isoformat()
+    appt = conn.execute("INSERT INTO appointments (donor_id, hospital_id, date, time_slot, status) VALUES (?, ?, ?, '10:00', 'Scheduled')",
+                        (donor_id, hospital_id, today)).lastrowid
+    manual = conn.execute("INSERT INTO donations (donor_id, date, volume_ml, hospital, status) VALUES (?, ?, 450, ?, 'Pending')",
+                          (make_donor(), today, hospital_name)).lastrowid
+    conn.commit()
+    login(client, 'hospital', hospital_id, hospital_name)
+    items = [{'id': appt, 'type': 'Appointment', 'action': 'approve'}, {'id': appt, 'type': 'Appointment', 'action': 'approve'},
+             {'id': manual, 'type': 'Manual Request', 'action': 'reject'}]
+
+    first = client.post('/hospital/verify_batch', json={'items': items}).get_json()
+    assert [r['result'] for r in first['results']] == ['Verified', 'Verified', 'Rejected']
+    second = client.post('/hospital/verify_batch', json={'items': items}).get_json()
+    assert second['applied'] == 0 and [r['result'] for r in second['results']] == ['not_found'] * 3
+
+    assert conn.execute("SELECT status FROM appointments WHERE id = ?", (appt,)).fetchone()[0] == 'Verified'
+    assert conn.execute("SELECT status FROM donations WHERE id = ?", (manual,)).fetchone()[0] == 'Rejected'
+    # One donation per verified appointment, however often it is approved
+    assert conn.execute("SELECT COUNT(*) FROM donations WHERE donor_id = ? AND date = ?", (donor_id, today)).fetchone()[0] == 1
+
+def test_verify_batch_reports_malformed_items(client, login, make_hospital):
+    hospital_id, hospital_name = make_hospital()
+    login(client, 'hospital', hospital_id, hospital_name)
+    r = client.post('/hospital/verify_batch', json={'items': [1, 'x', None, {'id': 1, 'type': ['Appointment'], 'action': 'approve'}]})
+    assert r.status_code == 200
+    assert [res['result'] for res in r.get_json()['results']] == ['invalid'] * 4
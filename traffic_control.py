@@ -0,0 +1,99 @@
+"""Traffic shaping for LifeFlow's public hot endpoints.
+
+SingleFlight lets concurrent identical requests share one computation. The first caller
+for a key computes; callers that arrive while it runs, or within `linger` seconds after
+it finishes, get the same result. SOS lookups are keyed by blood group and a rounded
+coordinate cell, so a crowd in one neighbourhood costs one query.
+
+SharedTokenBucket is a per-client token bucket kept in a small memory-mapped table
+(app.py puts it under /dev/shm) that every worker process on the host maps. A client
+therefore gets one budget per host, not one per worker. Each lookup locks only the few
+slots it probes, with fcntl byte-range locks. Without fcntl (Windows) only the
+in-process lock is taken, so two processes may occasionally both spend the same token."""
+try: import fcntl
+except ImportError: fcntl = None
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+class _Call:
+    __slots__ = ('event', 'result', 'error', 'finished')
+    def __init__(self):
+        self.event = threading.Event(); self.result = None; self.error = None; self.finished = None
+
+class SingleFlight:
+    def __init__(self, linger=0.0, max_keys=4096):
+        self.linger = linger; self.max_keys = max_keys
+        self._calls = {}; self._lock = threading.Lock()
+        self.computed = 0; self.shared = 0 # Counters for the metrics/benchmarks
+
+    def do(self, key, fn):
+        now = time.monotonic()
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None and call.finished is not None and now - call.finished > self.linger: call = None
+            leader = call is None
+            if leader:
+                if len(self._calls) >= self.max_keys: self._purge(now)
+                call = self._calls[key] = _Call(); self.computed += 1
+            else: self.shared += 1
+        if leader:
+            try: call.result = fn()
+            except Exception as e: call.error = e
+            finally:
+                call.finished = time.monotonic(); call.event.set()
+                if call.error is not None or not self.linger:
+                    with self._lock:
+                        if self._calls.get(key) is call: del self._calls[key]
+        else:
+            call.event.wait()
+        if call.error is not None: raise call.error
+        return call.result
+
+    def _purge(self, now):
+        for key in [k for k, c in self._calls.items() if c.finished is not None and now - c.finished > self.linger]:
+            del self._calls[key]
+
+class SharedTokenBucket:
+    """Allows `rate` requests per second per key with bursts up to `burst`, across processes."""
+    SLOT = struct.Struct('=Qdd') # key hash, tokens, last refill (CLOCK_MONOTONIC is system-wide)
+    PROBES = 4
+
+    def __init__(self, rate, burst, path, slots=65536):
+        self.rate = float(rate); self.burst = float(burst); self.slots = slots
+        self.path = path
+        size = self.SLOT.size * slots
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if os.fstat(fd).st_size != size: os.ftruncate(fd, size)
+            self._fd = fd; self._map = mmap.mmap(fd, size); self._thread_lock = threading.Lock()
+        except OSError:
+            os.close(fd); raise
+
+    def allow(self, key, cost=1.0):
+        """Returns (allowed, retry_after_seconds)."""
+        h = zlib.crc32(key.encode()) | 1 << 32 # Never 0, which marks an empty slot
+        first = h % (self.slots - self.PROBES); size = self.SLOT.size
+        now = time.monotonic()
+        with self._thread_lock: # fcntl locks only exclude other processes, not other threads
+            if fcntl: fcntl.lockf(self._fd, fcntl.LOCK_EX, size * self.PROBES, size * first)
+            try:
+                slot = empty = refilled = oldest = None
+                for i in range(first, first + self.PROBES):
+                    owner, slot_tokens, slot_last = self.SLOT.unpack_from(self._map, i * size)
+                    if owner == h: slot = i; tokens = min(self.burst, slot_tokens + max(0.0, now - slot_last) * self.rate); break
+                    if owner == 0:
+                        if empty is None: empty = i
+                    elif refilled is None and now - slot_last >= self.burst / self.rate: refilled = i
+                    if oldest is None or slot_last < oldest[1]: oldest = (i, slot_last)
+                if slot is None: # New key: take an empty slot, else one whose owner is back at full burst, else the stalest
+                    slot = next(i for i in (empty, refilled, oldest[0]) if i is not None); tokens = self.burst
+                allowed = tokens >= cost
+                if allowed: tokens -= cost
+                self.SLOT.pack_into(self._map, slot * size, h, tokens, now)
+            finally:
+                if fcntl: fcntl.lockf(self._fd, fcntl.LOCK_UN, size * self.PROBES, size * first)
+        return allowed, 0.0 if allowed else (cost - tokens) / self.rate